@@ -1,10 +1,11 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from services.websocket_service import socketio
 from bson import ObjectId
 from functools import wraps
 import os
 import hashlib
+import base64
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 from collections import defaultdict, Counter
@@ -16,16 +17,68 @@ from datetime import datetime, timezone, timedelta, date
 import uuid
 # NEW IMPORTS (required for Atlas + Render)
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 import certifi
 from flask_jwt_extended import verify_jwt_in_request
 
 # ============================================================
 # NEW IMPORTS FOR MODULARITY - ADD THESE
 # ============================================================
-from services.movement_service import process_security_scan
-from services.monitoring_service import monitor_active_checkouts, create_active_checkout
+from services.movement_service import (
+    process_security_scan,
+    get_event_cache_stats,
+    set_in_event_index_ready
+)
+from services.bulk_scan_service import process_security_scans_bulk
+from services.monitoring_service import (
+    monitor_active_checkouts,
+    create_active_checkout,
+    start_deadline_monitor,
+    get_violation_monitor_stats
+)
 from utils.time_utils import INDIA_TZ, get_ist_now, normalize_datetime_to_ist
 from utils.db_utils import set_db, set_client, get_db
+from services.student_directory import student_directory, get_student
+from services.active_checkout_registry import active_checkout_registry
+from services.roster_service import (
+    ensure_roster_indexes,
+    start_roster_versioning,
+    get_roster_version,
+    get_roster_delta,
+    prune_roster_tombstones,
+    start_roster_digests,
+    get_roster_digest
+)
+from services.roster_snapshot_service import (
+    roster_snapshots,
+    negotiate_encoding,
+    negotiate_representation,
+    snapshot_etag,
+    REPRESENTATIONS,
+    build_hostel_roster_body,
+    build_minimal_roster_body
+)
+from services.roster_filter_service import roster_filters, describe_filter
+from services.sync_manifest_service import get_sync_manifest
+from services.roster_push_service import roster_push
+from utils.bloom_filter import BLOOM_FILTER_MIMETYPE
+from services.outbox_service import start_outbox_sweeper, get_outbox_stats
+from services.leader_lease import leader_lease, leader_only
+from utils.group_commit import GroupCommitBuffer
+from utils.ndjson_utils import (
+    NDJSON_MIMETYPE,
+    is_ndjson_request,
+    iter_ndjson,
+    iter_batches,
+    to_ndjson_line
+)
+from services.sync_session_service import (
+    ensure_sync_session_indexes,
+    begin_sync_session,
+    get_sync_session,
+    upload_sync_chunk,
+    commit_sync_session
+)
 # ============================================================
 # ============================================================
 # NEW IMPORTS FOR STUDENT & ANALYTICS SERVICES - ADD THESE
@@ -39,6 +92,7 @@ from services.student_service import (
     update_student_allowed_time,
     reset_student_allowed_time,
     get_all_students_minimal,
+    iter_students_minimal,
     get_student_counts,
     get_active_students_outside,
     get_student_movement_history
@@ -182,6 +236,40 @@ limiter = Limiter(
 scheduler = BackgroundScheduler()
 scheduler.start()
 
+# Optional group commit for canteen scans: visits (and their unauthorized
+# alerts) from concurrent requests are written with one insert_many.
+CANTEEN_GROUP_COMMIT = os.environ.get('CANTEEN_GROUP_COMMIT', 'false').lower() == 'true'
+CANTEEN_GROUP_COMMIT_BATCH = int(os.environ.get('CANTEEN_GROUP_COMMIT_BATCH', 100))
+CANTEEN_GROUP_COMMIT_WAIT_MS = float(os.environ.get('CANTEEN_GROUP_COMMIT_WAIT_MS', 5))
+
+canteen_visit_buffer = GroupCommitBuffer(
+    lambda: db.canteen_visits,
+    max_batch=CANTEEN_GROUP_COMMIT_BATCH,
+    max_wait_ms=CANTEEN_GROUP_COMMIT_WAIT_MS
+)
+canteen_alert_buffer = GroupCommitBuffer(
+    lambda: db.realtime_alerts,
+    max_batch=CANTEEN_GROUP_COMMIT_BATCH,
+    max_wait_ms=CANTEEN_GROUP_COMMIT_WAIT_MS
+)
+
+if CANTEEN_GROUP_COMMIT and db_connected:
+    canteen_visit_buffer.start()
+    canteen_alert_buffer.start()
+    print(f"📦 Canteen group commit enabled | Batch={CANTEEN_GROUP_COMMIT_BATCH} | Wait={CANTEEN_GROUP_COMMIT_WAIT_MS}ms")
+
+
+def _group_commit_submit(buffer, collection, document):
+    """
+    Queue an insert on the group-commit buffer (or insert directly when
+    it is off); returns a callable that waits for it and returns the _id.
+    """
+    if buffer.running:
+        pending = buffer.submit(document)
+        return lambda: buffer.wait(pending)
+    inserted_id = collection.insert_one(document).inserted_id
+    return lambda: inserted_id
+
 # Enhanced security storage
 active_sessions = {}
 login_attempts = {}
@@ -282,6 +370,9 @@ def comprehensive_data_cleanup():
         })
         cleanup_stats['admin_scans_deleted'] = result_admin_scans.deleted_count
 
+        # 6. Clean old roster tombstones (older devices fall back to a full roster sync)
+        cleanup_stats['roster_tombstones_deleted'] = prune_roster_tombstones(cutoff_time, db)
+
         print(f"✅ Comprehensive cleanup completed: {cleanup_stats}")
         return cleanup_stats
 
@@ -291,6 +382,39 @@ def comprehensive_data_cleanup():
 
 
 
+def _ensure_in_event_index():
+    """
+    Check-in idempotency: one IN event closes at most one movement.
+
+    Built on its own so that duplicate (in_event_id, roll_no) pairs
+    already in the data only cost this index, not the ones after it.
+    Without it, single check-ins look up the IN event before claiming.
+    """
+    try:
+        db.movement_records.create_index(
+            [('in_event_id', 1), ('roll_no', 1)],
+            unique=True,
+            partialFilterExpression={'in_event_id': {'$type': 'string'}}
+        )
+        set_in_event_index_ready(True)
+    except OperationFailure as e:
+        set_in_event_index_ready(False)
+        print(f"❌ IN EVENT INDEX NOT BUILT - check-ins query for replays first | {e}")
+        try:
+            duplicates = db.movement_records.aggregate([
+                {'$match': {'in_event_id': {'$type': 'string'}}},
+                {'$group': {
+                    '_id': {'in_event_id': '$in_event_id', 'roll_no': '$roll_no'},
+                    'count': {'$sum': 1}
+                }},
+                {'$match': {'count': {'$gt': 1}}},
+                {'$limit': 5}
+            ])
+            print(f"   Duplicate (in_event_id, roll_no) pairs to resolve: {[d['_id'] for d in duplicates]}")
+        except OperationFailure:
+            pass
+
+
 def initialize_database():
     try:
         # Check if database is connected
@@ -319,12 +443,20 @@ def initialize_database():
         db.canteen_visits.create_index([('timestamp', -1)])
         db.realtime_alerts.create_index([('timestamp', -1)])
         db.students.create_index([('roll_no', 1)], unique=True)
+        # Keyset pagination of hostel rosters
+        db.students.create_index([('hostel', 1), ('roll_no', 1)])
         db.devices.create_index([('device_id', 1)], unique=True)
         db.security_logs.create_index([('timestamp', -1)])
         db.movement_records.create_index(
             [('event_id', 1)],
             unique=True
         )
+        _ensure_in_event_index()
+        # Outbox recovery sweep: only movements with undelivered effects
+        db.movement_records.create_index(
+            [('pending_effects.enqueued_at', 1)],
+            partialFilterExpression={'pending_effects.enqueued_at': {'$exists': True}}
+        )
         # Indexes for proactive allowed-time monitoring
         db.active_checkouts.create_index(
             [('roll_no', 1)],
@@ -339,6 +471,12 @@ def initialize_database():
             [('deadline', 1)]
         )
 
+        # Resumable chunked sync sessions
+        ensure_sync_session_indexes(db)
+
+        # Versioned roster for delta sync
+        ensure_roster_indexes(db)
+
         print("✅ Database initialization completed")
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
@@ -351,6 +489,17 @@ if db_connected:
     set_db(db)
     set_client(client)
     initialize_database()
+    # Before the background jobs, so the first worker up leads right away
+    leader_lease.start(db)
+    start_roster_versioning(db)
+    start_roster_digests()
+    roster_filters.start()
+    roster_push.start()
+    student_directory.start(db)
+    active_checkout_registry.start(db)
+    roster_snapshots.start(db)
+    start_outbox_sweeper(db)
+    start_deadline_monitor(db)
 else:
     print("⚠️ Skipping database initialization - no connection")
 # ============================================================
@@ -384,12 +533,22 @@ def trigger_active_checkout_monitor():
             "message": "Unauthorized"
         }), 401
 
+    # The leader sweeps on its own; other workers leave it to the leader
+    if not leader_lease.is_leader():
+        return jsonify({
+            "success": True,
+            "message": "Not the leader worker; monitoring runs on the leader",
+            "violations_processed": 0
+        }), 200
+
     try:
-        monitor_active_checkouts()
+        processed = monitor_active_checkouts()
 
         return jsonify({
             "success": True,
-            "message": "Active checkout monitoring completed"
+            "message": "Active checkout monitoring completed",
+            "violations_processed": processed,
+            "sweep": get_violation_monitor_stats()['last_sweep']
         }), 200
 
     except Exception as e:
@@ -404,6 +563,45 @@ def trigger_active_checkout_monitor():
         }), 500
 
 
+@app.route('/api/internal/metrics', methods=['GET'])
+@limiter.exempt
+def get_internal_metrics():
+    """In-process performance counters (per worker)"""
+
+    provided_secret = request.headers.get("X-Monitoring-Secret")
+
+    if not MONITORING_SECRET:
+        return jsonify({
+            "success": False,
+            "message": "Monitoring service not configured"
+        }), 500
+
+    if provided_secret != MONITORING_SECRET:
+        return jsonify({
+            "success": False,
+            "message": "Unauthorized"
+        }), 401
+
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "event_id_cache": get_event_cache_stats(),
+        "student_directory": student_directory.stats(),
+        "active_checkouts": active_checkout_registry.stats(),
+        "outbox": get_outbox_stats(),
+        "roster_snapshots": roster_snapshots.stats(),
+        "roster_filters": roster_filters.stats(),
+        "roster_push": roster_push.stats(),
+        "violation_monitor": get_violation_monitor_stats(),
+        "leader_lease": leader_lease.stats(),
+        "canteen_group_commit": {
+            "visits": canteen_visit_buffer.stats(),
+            "alerts": canteen_alert_buffer.stats()
+        },
+        "timestamp": get_ist_now().isoformat()
+    }), 200
+
+
 # Enhanced security logging
 def log_security_event(event_type, user_role, device_id, ip_address, details=None):
     """Log security events for audit trail"""
@@ -951,7 +1149,7 @@ def cleanup_expired_data():
 
 # Schedule comprehensive cleanup to run monthly instead of the current cleanup
 scheduler.add_job(
-    func=comprehensive_data_cleanup,
+    func=leader_only(comprehensive_data_cleanup),
     trigger='cron',  # Use cron trigger for monthly scheduling
     day=1,  # 1st day of every month
     hour=2,  # 2 AM
@@ -960,8 +1158,8 @@ scheduler.add_job(
 )
 
 
-# Also run cleanup when the app starts for any stale records
-cleanup_old_movement_records()
+# Also run cleanup for any stale records, once, on the worker that leads
+leader_lease.on_elected(cleanup_old_movement_records)
 
 # Shut down the scheduler when exiting the app
 atexit.register(lambda: scheduler.shutdown())
@@ -1157,6 +1355,55 @@ def handle_security_scan(selected_role):
     except Exception as e:
         print(f"Error in handle_security_scan: {e}")
         return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+# Largest batch a gate device may send in one request
+MAX_SCAN_BATCH = int(os.environ.get('MAX_SCAN_BATCH', 1000))
+
+
+@app.route('/api/student/scan/security/<selected_role>/batch', methods=['POST'])
+@jwt_required()
+def handle_security_scan_batch(selected_role):
+    """Process an ordered batch of gate scans; one result per scan, in order"""
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        if user_role != selected_role:
+            return jsonify({'message': 'Role mismatch'}), 403
+
+        data = request.get_json(silent=True) or {}
+        scans = data.get('scans')
+
+        if not isinstance(scans, list):
+            return jsonify({'message': 'scans must be a list'}), 400
+
+        if len(scans) > MAX_SCAN_BATCH:
+            return jsonify({'message': f'At most {MAX_SCAN_BATCH} scans per batch'}), 413
+
+        results = []
+        for response_data, status_code in process_security_scans_bulk(
+            user_role=user_role,
+            scans=scans,
+            db=get_db()
+        ):
+            result = dict(response_data)
+            result['status_code'] = status_code
+            result['success'] = status_code == 200
+            results.append(result)
+
+        return jsonify({
+            'success': True,
+            'processed': len(results),
+            'results': results
+        }), 200
+
+    except Exception as e:
+        print(f"Error in handle_security_scan_batch: {e}")
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
 # ============================================================
 
 # Update the existing manual cleanup endpoint to use 6 months
@@ -1554,7 +1801,7 @@ def record_canteen_visit(selected_role):
         else:
             now = datetime.now(INDIA_TZ)
 
-        student = db.students.find_one({'roll_no': roll_no})
+        student = get_student(roll_no, db)
 
         if not student:
             return jsonify({'message': 'Student not found'}), 404
@@ -1578,7 +1825,12 @@ def record_canteen_visit(selected_role):
             'offline_sync': is_offline_sync
         }
 
-        db.canteen_visits.insert_one(visit_record)
+        visit_committed = _group_commit_submit(canteen_visit_buffer, db.canteen_visits, visit_record)
+        visit_committed()
+
+        # Only a stored visit gets an alert; a failed one is retried by the device
+        if is_unauthorized:
+            _send_unauthorized_alert(visit_record)()
 
         response_data = {
             'message': 'Canteen visit recorded successfully',
@@ -1593,8 +1845,6 @@ def record_canteen_visit(selected_role):
 
         if is_unauthorized:
             response_data['alert'] = 'Unauthorized visit detected!'
-            # Trigger real-time alert
-            _send_unauthorized_alert(visit_record)
 
         return jsonify(response_data), 200
 
@@ -1669,7 +1919,7 @@ def _generate_analytics_alerts(hostel_analysis, daily_analysis):
     return alerts
 
 def _send_unauthorized_alert(visit_record):
-    """Send real-time alert for unauthorized visit"""
+    """Queue the real-time alert for an unauthorized visit; returns its commit waiter"""
     alert_message = {
         'type': 'unauthorized_visit',
         'message': f'🚨 Unauthorized canteen visit detected!',
@@ -1684,8 +1934,9 @@ def _send_unauthorized_alert(visit_record):
     }
 
     # Store alert for super users
-    db.realtime_alerts.insert_one(alert_message)
+    alert_committed = _group_commit_submit(canteen_alert_buffer, db.realtime_alerts, alert_message)
     print(f"📢 ALERT: {alert_message['message']}")
+    return alert_committed
 
 # Late arrival analytics with hostel filtering
 @app.route('/api/analytics/late-arrivals', methods=['GET'])
@@ -1738,7 +1989,7 @@ def handle_admin_scan(selected_role):
         data = request.get_json()
         roll_no = data.get('roll_no')
 
-        student = db.students.find_one({'roll_no': roll_no})
+        student = get_student(roll_no, db)
 
         if not student:
             return jsonify({'message': 'Student not found'}), 404
@@ -1786,6 +2037,7 @@ def home():
             "student_operations": [
                 "/api/student/<roll_no>/<role>",
                 "/api/student/scan/security/<role>",
+                "/api/student/scan/security/<role>/batch",
                 "/api/student/scan/canteen/<role>",
                 "/api/student/scan/admin/<role>"
             ],
@@ -2020,6 +2272,33 @@ def secure_login():
 
 # Add to your existing backend.py
 
+# Records handed to the sync services per batch when streaming NDJSON
+SYNC_STREAM_BATCH = int(os.environ.get('SYNC_STREAM_BATCH', 500))
+
+
+def _stream_sync_results(sync_service, user_role):
+    """
+    Sync an NDJSON upload (optionally gzip-encoded) in fixed-size
+    batches and stream one NDJSON result line per record back, in
+    upload order.
+    """
+    gzipped = request.headers.get('Content-Encoding', '').lower() == 'gzip'
+    records = iter_ndjson(request.stream, gzipped=gzipped)
+    sync_db = get_db()
+
+    def generate():
+        try:
+            for batch in iter_batches(records, SYNC_STREAM_BATCH):
+                for result in sync_service(batch, user_role, sync_db):
+                    yield to_ndjson_line(result, CustomJSONEncoder)
+        except Exception as e:
+            # Status is already sent; report the failure in-band.
+            print(f"Error in NDJSON sync stream: {e}")
+            yield to_ndjson_line({'success': False, 'error': f'Server error: {str(e)}'})
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
 @app.route('/api/sync/security-scans', methods=['POST'])
 @jwt_required()
 def sync_security_scans():
@@ -2030,6 +2309,9 @@ def sync_security_scans():
 
         device_id, user_role = identity_string.split(':', 1)
 
+        if is_ndjson_request(request):
+            return _stream_sync_results(sync_security_scans_service, user_role)
+
         data = request.get_json(silent=True) or {}
         scans = data.get('scans', [])
 
@@ -2151,6 +2433,9 @@ def sync_canteen_visits():
 
         device_id, user_role = identity_string.split(':', 1)
 
+        if is_ndjson_request(request):
+            return _stream_sync_results(sync_canteen_visits_service, user_role)
+
         data = request.get_json(silent=True) or {}
         visits = data.get('visits', [])
 
@@ -2169,6 +2454,145 @@ def sync_canteen_visits():
         print(f"Error in sync_canteen_visits: {e}")
         return jsonify({'message': f'Server error: {str(e)}'}), 500
 
+@app.route('/api/sync/sessions', methods=['POST'])
+@jwt_required()
+def begin_sync_session_endpoint():
+    """Open or resume this device's chunked sync session"""
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        data = request.get_json(silent=True) or {}
+
+        response_data, status_code = begin_sync_session(
+            device_id=device_id,
+            user_role=user_role,
+            kind=data.get('kind'),
+            db=get_db()
+        )
+
+        return jsonify(response_data), status_code
+
+    except Exception as e:
+        print(f"Error in begin_sync_session: {e}")
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/sync/sessions/<session_id>', methods=['GET'])
+@jwt_required()
+def get_sync_session_endpoint(session_id):
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        response_data, status_code = get_sync_session(session_id, device_id, db=get_db())
+
+        return jsonify(response_data), status_code
+
+    except Exception as e:
+        print(f"Error in get_sync_session: {e}")
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/sync/sessions/<session_id>/chunks/<int:seq>', methods=['POST'])
+@jwt_required()
+def upload_sync_chunk_endpoint(session_id, seq):
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        data = request.get_json(silent=True) or {}
+
+        response_data, status_code = upload_sync_chunk(
+            session_id=session_id,
+            device_id=device_id,
+            seq=seq,
+            records=data.get('records', []),
+            db=get_db()
+        )
+
+        return jsonify(response_data), status_code
+
+    except Exception as e:
+        print(f"Error in upload_sync_chunk: {e}")
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/sync/sessions/<session_id>/commit', methods=['POST'])
+@jwt_required()
+def commit_sync_session_endpoint(session_id):
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        data = request.get_json(silent=True) or {}
+        total_chunks = data.get('total_chunks')
+
+        if total_chunks is not None and not isinstance(total_chunks, int):
+            return jsonify({'message': 'total_chunks must be an integer'}), 400
+
+        response_data, status_code = commit_sync_session(
+            session_id=session_id,
+            device_id=device_id,
+            total_chunks=total_chunks,
+            db=get_db()
+        )
+
+        return jsonify(response_data), status_code
+
+    except Exception as e:
+        print(f"Error in commit_sync_session: {e}")
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+# Upper bound for the user-controlled /api/sync/students limit
+MAX_SYNC_STUDENTS_LIMIT = int(os.environ.get('MAX_SYNC_STUDENTS_LIMIT', 20000))
+
+# Students serialized per chunk of a streamed roster
+ROSTER_STREAM_CHUNK = 500
+
+
+def _stream_roster_response(head, students, tail):
+    """
+    Stream {**head, "students": [...], **tail(count, size_kb)} while
+    iterating `students` (a cursor), so the roster is never held in
+    memory as a list or as one serialized string.
+    """
+    def generate():
+        opening = json.dumps(head, cls=CustomJSONEncoder)[:-1]
+        yield opening + (', ' if head else '') + '"students": ['
+
+        count = 0
+        size = 0
+        chunk = []
+        for student in students:
+            item = json.dumps(student, cls=CustomJSONEncoder)
+            chunk.append(item if count == 0 else ', ' + item)
+            count += 1
+            size += len(item)
+            if len(chunk) >= ROSTER_STREAM_CHUNK:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+        closing = json.dumps(tail(count, round(size / 1024, 2)), cls=CustomJSONEncoder)
+        yield '], ' + closing[1:] if closing != '{}' else ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 @app.route('/api/sync/students', methods=['GET'])
 @jwt_required()
 def sync_students():
@@ -2180,8 +2604,9 @@ def sync_students():
 
         # Get query parameters
         hostel = request.args.get('hostel')
-        limit = int(request.args.get('limit', 10000))
+        limit = max(1, min(int(request.args.get('limit', 10000)), MAX_SYNC_STUDENTS_LIMIT))
         fields = request.args.get('fields', 'roll_no,name,hostel')
+        stream = request.args.get('stream', 'false').lower() == 'true'
 
         # Build query based on role
         query = {}
@@ -2195,6 +2620,30 @@ def sync_students():
                 user_hostel = user_role.split('_')[1].upper()
                 query['hostel'] = user_hostel
 
+        # Delta mode: only changes since the device's roster version
+        since = request.args.get('since', type=int)
+        if since is not None:
+            delta = get_roster_delta(since, query.get('hostel'), db)
+            delta['timestamp'] = datetime.now(INDIA_TZ).isoformat()
+            return jsonify(delta), 200
+
+        # Read before the roster so changes made meanwhile show up in the next delta
+        roster_version = get_roster_version(db)
+
+        if stream:
+            print(f"📱 Student sync: Streaming up to {limit} students to device {device_id}")
+            return _stream_roster_response(
+                {'success': True},
+                iter_students_minimal(query, limit=limit, sort=False, db=db),
+                lambda count, size_kb: {
+                    'count': count,
+                    'query': query,
+                    'hostel_filter': hostel if hostel else 'ALL',
+                    'roster_version': roster_version,
+                    'timestamp': datetime.now(INDIA_TZ).isoformat()
+                }
+            )
+
         # Get only essential fields
         projection = {
             'roll_no': 1,
@@ -2223,6 +2672,7 @@ def sync_students():
             'students': compressed_students,
             'query': query,
             'hostel_filter': hostel if hostel else 'ALL',
+            'roster_version': roster_version,
             'timestamp': datetime.now(INDIA_TZ).isoformat()
         }), 200
 
@@ -2383,6 +2833,93 @@ def get_feedback():
     except Exception as e:
         return jsonify({'message': f'Error retrieving feedback: {str(e)}'}), 500
 
+def _roster_etag(hostel, *variant):
+    """
+    Strong ETag for a roster response: the hostel's roster digest plus
+    the request parameters that shape the body. None if no digest yet.
+    """
+    digest = get_roster_digest(hostel)
+    if digest is None:
+        return None
+    variant_key = hashlib.sha256(repr(variant).encode('utf-8')).hexdigest()[:12]
+    return f"{digest[:40]}-{variant_key}"
+
+
+def _filter_etag(filters, binary):
+    """
+    Strong ETag for a roster filter response, taken from the served
+    filters' bytes: filters built on different workers (or extended
+    in place) can differ for the same roster.
+    """
+    fingerprint = hashlib.sha256(repr(('filter', binary)).encode('utf-8'))
+    for name in sorted(filters):
+        fingerprint.update(name.encode('utf-8'))
+        fingerprint.update(filters[name].to_bytes())
+    return fingerprint.hexdigest()[:53]
+
+
+def _roster_not_modified(etag):
+    """304 for a roster the device already has"""
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _set_roster_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _serve_roster_snapshot(hostel, get_snapshot, legacy_compress=False):
+    """
+    Serve a full roster from its prebuilt snapshot: pick a stored
+    representation (JSON, or the binary roster via Accept) and
+    encoding and write its bytes. Returns None when no snapshot is
+    available yet, so the caller can fall back to MongoDB.
+    """
+    # The legacy compress=true flag always meant gzipped JSON.
+    if legacy_compress:
+        representation, encoding = 'json', 'gzip'
+    else:
+        representation = negotiate_representation(request.accept_mimetypes)
+        encoding = negotiate_encoding(request.accept_encodings)
+
+    digest = get_roster_digest(hostel)
+    if digest is not None:
+        etag = snapshot_etag(digest, representation, encoding)
+        if etag in request.if_none_match:
+            response = _roster_not_modified(etag)
+            response.headers['Vary'] = 'Accept, Accept-Encoding'
+            return response
+
+    try:
+        snapshot = get_snapshot()
+    except Exception as e:
+        print(f"⚠️ Roster snapshot unavailable, querying MongoDB: {e}")
+        return None
+
+    if snapshot is None:
+        return None
+
+    body = snapshot.body(representation, encoding)
+    response = Response(
+        body if isinstance(body, bytes) else [memoryview(body)],
+        mimetype='application/gzip' if legacy_compress else REPRESENTATIONS[representation]
+    )
+    response.headers['Content-Length'] = str(len(body))
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    response.headers['X-Student-Count'] = str(snapshot.count)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    if legacy_compress:
+        response.headers['X-Metadata'] = snapshot.metadata_header
+
+    return _set_roster_etag(response, snapshot.etag(representation, encoding))
+
+
 @app.route('/api/students/hostel/<hostel>', methods=['GET'])
 @jwt_required()
 def get_students_by_hostel_endpoint(hostel):
@@ -2410,6 +2947,7 @@ def get_students_by_hostel_endpoint(hostel):
         # Get query parameters
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 0))
+        cursor = request.args.get('cursor')
         compress = request.args.get('compress', 'false').lower() == 'true'
 
         # Validate hostel parameter
@@ -2422,29 +2960,40 @@ def get_students_by_hostel_endpoint(hostel):
                 'received_hostel': hostel
             }), 400
 
+        # Delta mode: only changes since the device's roster version
+        since = request.args.get('since', type=int)
+        if since is not None:
+            delta = get_roster_delta(since, hostel, db)
+            delta.update({'hostel': hostel, 'timestamp': get_ist_now().isoformat()})
+            return jsonify(delta), 200
+
+        # Full roster: prebuilt snapshot, encoding picked from Accept-Encoding
+        if page_size <= 0:
+            response = _serve_roster_snapshot(
+                hostel,
+                lambda: roster_snapshots.hostel(hostel, db),
+                legacy_compress=compress
+            )
+            if response is not None:
+                return response
+
+        # Conditional GET: answered from the in-memory roster digest
+        etag = _roster_etag(hostel, page, page_size, compress, cursor)
+        if etag is not None and etag in request.if_none_match:
+            return _roster_not_modified(etag)
+
+        # Read before the roster so changes made meanwhile show up in the next delta
+        roster_version = get_roster_version(db)
+
         # Get students using service
-        result = get_students_by_hostel(hostel, page, page_size)
+        try:
+            result = get_students_by_hostel(hostel, page, page_size, cursor=cursor)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
         # Prepare base response
-        base_response = {
-            'success': True,
-            'purpose': 'offline_caching',
-            'count': len(result['students']),
-            'total_count': result['total_count'],
-            'hostel': hostel,
-            'hostel_display': 'ALL (A, B, C, D)' if hostel == 'ALL' else hostel,
-            'fields_included': ['roll_no', 'name', 'hostel'],
-            'note': 'Only minimal fields included to reduce storage. Additional data available via /api/student/<roll_no>/<role>',
-            'pagination': {
-                'page': result['page'],
-                'page_size': result['page_size'],
-                'total_pages': result['total_pages'],
-                'has_more': result['page'] < result['total_pages'],
-                'showing': f"{((result['page']-1) * (result['page_size'] if isinstance(result['page_size'], int) else 0)) + 1}-{((result['page']-1) * (result['page_size'] if isinstance(result['page_size'], int) else 0)) + len(result['students'])} of {result['total_count']}" if isinstance(result['page_size'], int) and result['page_size'] > 0 else f"ALL {result['total_count']}"
-            },
-            'estimated_size_kb': (len(json.dumps(result['students'])) / 1024) if result['students'] else 0,
-            'timestamp': get_ist_now().isoformat()
-        }
+        base_response = build_hostel_roster_body(hostel, result, roster_version)
+        del base_response['students']
 
         # Handle compression if requested
         if compress and result['students']:
@@ -2474,7 +3023,7 @@ def get_students_by_hostel_endpoint(hostel):
                 response.headers['X-Metadata'] = json.dumps(base_response)
                 response.headers['X-Student-Count'] = str(len(result['students']))
 
-                return response
+                return _set_roster_etag(response, etag)
 
             except Exception as compression_error:
                 print(f"⚠️ Compression failed, falling back to JSON: {compression_error}")
@@ -2482,7 +3031,7 @@ def get_students_by_hostel_endpoint(hostel):
 
         # Regular JSON response
         response_data = {**base_response, 'students': result['students']}
-        return jsonify(response_data), 200
+        return _set_roster_etag(jsonify(response_data), etag), 200
 
     except Exception as e:
         print(f"❌ Error in get_students_by_hostel: {e}")
@@ -2498,6 +3047,31 @@ def get_students_by_hostel_endpoint(hostel):
         }), 500
 
 
+@app.route('/api/sync/manifest', methods=['GET'])
+@jwt_required()
+def sync_manifest():
+    """Counts, roster versions, digests and download sizes for every hostel (from memory)"""
+    try:
+        identity_string = get_jwt_identity()
+        if ':' in identity_string:
+            device_id, user_role = identity_string.split(':', 1)
+
+            if not (user_role.startswith('security_') or user_role.startswith('canteen_')):
+                return jsonify({
+                    'message': 'Offline sync is only available for security and canteen staff'
+                }), 403
+
+        result, status_code = get_sync_manifest(db)
+        return jsonify(result), status_code
+
+    except Exception as e:
+        print(f"❌ Error building sync manifest: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+
 @app.route('/api/sync/check-student-data/<hostel>', methods=['GET'])
 @jwt_required()
 def check_student_data_availability(hostel):
@@ -2514,8 +3088,11 @@ def check_student_data_availability(hostel):
                     'message': 'Offline sync is only available for security and canteen staff'
                 }), 403
 
-        # Simple count of students in hostel
-        student_count = db.students.count_documents({'hostel': hostel})
+        # Count from the student directory; MongoDB only until it is loaded
+        if student_directory.loaded:
+            student_count = student_directory.hostel_counts().get(hostel, 0)
+        else:
+            student_count = db.students.count_documents({'hostel': hostel})
 
         return jsonify({
             'available': True,
@@ -2553,30 +3130,53 @@ def get_all_students_minimal_endpoint():
                     'message': 'Offline student data is only for security and canteen staff'
                 }), 403
 
-        students = get_all_students_minimal()
+        # Delta mode: only changes since the device's roster version
+        since = request.args.get('since', type=int)
+        if since is not None:
+            delta = get_roster_delta(since, 'ALL', db)
+            delta['timestamp'] = get_ist_now().isoformat()
+            return jsonify(delta), 200
 
-        # Calculate approximate data size
-        import sys
-        sample_size = len(json.dumps(students[0])) if students else 0
-        estimated_size_kb = (len(students) * sample_size) / 1024 if students else 0
+        stream = request.args.get('stream', 'false').lower() == 'true'
 
-        response = {
-            'success': True,
-            'purpose': 'offline_caching_minimal',
-            'count': len(students),
-            'fields_included': ['roll_no', 'name', 'hostel'],
-            'fields_excluded': ['room_no', 'course', 'branch', 'contact_no', 'email',
-                               'guardian_name', 'guardian_phone', 'home_address',
-                               'fee_status', 'admission_date', 'in_out_records',
-                               'disciplinary_records', 'medical_info'],
-            'students': students,
-            'estimated_size_kb': round(estimated_size_kb, 2),
-            'timestamp': get_ist_now().isoformat()
-        }
+        # Prebuilt snapshot, encoding picked from Accept-Encoding
+        if not stream:
+            snapshot_response = _serve_roster_snapshot(
+                'ALL',
+                lambda: roster_snapshots.minimal(db)
+            )
+            if snapshot_response is not None:
+                return snapshot_response
+
+        # Conditional GET: answered from the in-memory roster digest
+        etag = _roster_etag('ALL')
+        if etag is not None and etag in request.if_none_match:
+            return _roster_not_modified(etag)
+
+        # Read before the roster so changes made meanwhile show up in the next delta
+        roster_version = get_roster_version(db)
+
+        if stream:
+            minimal_head = build_minimal_roster_body([], roster_version)
+            for key in ('students', 'count', 'estimated_size_kb', 'timestamp'):
+                minimal_head.pop(key)
+            return _stream_roster_response(
+                minimal_head,
+                iter_students_minimal({'hostel': {'$in': ['A', 'B', 'C', 'D']}}, db=db),
+                lambda count, size_kb: {
+                    'count': count,
+                    'estimated_size_kb': size_kb,
+                    'timestamp': get_ist_now().isoformat()
+                }
+            )
+
+        students = get_all_students_minimal()
 
-        print(f"✅ MINIMAL offline sync: {len(students)} students, ~{estimated_size_kb:.1f}KB")
+        response = build_minimal_roster_body(students, roster_version)
 
-        return jsonify(response), 200
+        print(f"✅ MINIMAL offline sync: {len(students)} students, ~{response['estimated_size_kb']:.1f}KB")
+
+        return _set_roster_etag(jsonify(response), etag), 200
 
     except Exception as e:
         print(f"❌ Error in get_all_students_minimal: {e}")
@@ -2585,6 +3185,112 @@ def get_all_students_minimal_endpoint():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/students/filter/<hostel>', methods=['GET'])
+@jwt_required()
+def get_roster_filter_endpoint(hostel):
+    """
+    Bloom filter of a hostel's roll numbers (or of every hostel with ALL)
+    for validating scans offline. Accept: application/x-roster-filter
+    returns one hostel's filter as raw bytes.
+    """
+    try:
+        identity_string = get_jwt_identity()
+        if ':' in identity_string:
+            device_id, user_role = identity_string.split(':', 1)
+
+            if not (user_role.startswith('security_') or user_role.startswith('canteen_')):
+                return jsonify({
+                    'message': 'Offline student data is only for security and canteen staff'
+                }), 403
+
+        hostel = hostel.upper()
+        hostels = ['A', 'B', 'C', 'D'] if hostel == 'ALL' else [hostel]
+        if hostels[0] not in ['A', 'B', 'C', 'D']:
+            return jsonify({'success': False, 'message': 'Invalid hostel'}), 400
+
+        binary = (
+            hostel != 'ALL'
+            and request.accept_mimetypes[BLOOM_FILTER_MIMETYPE] > request.accept_mimetypes['application/json']
+        )
+
+        filters = {}
+        for name in hostels:
+            bloom = roster_filters.get(name, db)
+            if bloom is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Roster filter not available yet, use the full roster'
+                }), 503
+            filters[name] = bloom
+
+        etag = _filter_etag(filters, binary)
+        if etag in request.if_none_match:
+            return _roster_not_modified(etag)
+
+        if binary:
+            response = make_response(filters[hostel].to_bytes())
+            response.headers['Content-Type'] = BLOOM_FILTER_MIMETYPE
+        else:
+            response = jsonify({
+                'success': True,
+                'filters': {
+                    name: dict(describe_filter(bloom), bits=base64.b64encode(bytes(bloom.bits)).decode('ascii'))
+                    for name, bloom in filters.items()
+                },
+                'roster_version': min(bloom.roster_version for bloom in filters.values()),
+                'timestamp': get_ist_now().isoformat()
+            })
+
+        response.headers['Vary'] = 'Accept'
+        return _set_roster_etag(response, etag), 200
+
+    except Exception as e:
+        print(f"❌ Error in get_roster_filter: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/students/outside', methods=['GET'])
+@jwt_required()
+def get_students_outside_endpoint():
+    """Students currently outside, served from the active checkout registry (admin/supervisors)"""
+    try:
+        identity_string = get_jwt_identity()
+        if ':' not in identity_string:
+            return jsonify({'message': 'Invalid token format'}), 401
+
+        device_id, user_role = identity_string.split(':', 1)
+
+        if user_role not in ['admin'] and not user_role.startswith('super_'):
+            return jsonify({'message': 'Access denied'}), 403
+
+        hostel = request.args.get('hostel')
+        include_violations = request.args.get('include_violations', 'false').lower() == 'true'
+
+        if user_role.startswith('super_'):
+            hostel = user_role.split('_', 1)[1].upper()
+
+        students = get_active_students_outside(hostel=hostel, include_violations=include_violations)
+
+        for student in students:
+            for field in ('out_time', 'deadline'):
+                if isinstance(student.get(field), datetime):
+                    student[field] = normalize_datetime_to_ist(student[field]).isoformat()
+
+        return jsonify({
+            'success': True,
+            'hostel': hostel or 'ALL',
+            'count': len(students),
+            'students': students,
+            'source': 'registry' if active_checkout_registry.loaded else 'database',
+            'timestamp': get_ist_now().isoformat()
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Error in get_students_outside: {e}")
+        return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
+
 @app.route('/api/students/count', methods=['GET'])
 @jwt_required()
 def get_student_counts_endpoint():
@@ -0,0 +1,69 @@
+# benchmarks/bench_bloom_filter.py
+"""
+Roster Bloom filter benchmark
+
+Builds filters for synthetic hostels with utils/bloom_filter.py,
+measures the false-positive rate against the target and reports
+filter sizes and lookup speed. Correctness is covered by
+tests/test_bloom_filter.py.
+
+No database needed:
+
+    python benchmarks/bench_bloom_filter.py --students 2500 --rate 0.01
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bloom_filter import BloomFilter
+
+PROBES = 200000
+
+
+def _roll_numbers(count, prefix):
+    return [f'{prefix}{i:05d}' for i in range(count)]
+
+
+def measure_false_positive_rate(bloom, probes):
+    hits = sum(1 for i in range(probes) if f'XX-NOT-ENROLLED-{i}' in bloom)
+    return hits / probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=2500, help='students per hostel')
+    parser.add_argument('--rate', type=float, default=0.01, help='target false-positive rate')
+    parser.add_argument('--probes', type=int, default=PROBES)
+    args = parser.parse_args()
+
+    roll_nos = _roll_numbers(args.students, '23CS')
+
+    bloom = BloomFilter.from_roll_numbers(roll_nos, false_positive_rate=args.rate)
+
+    started = time.perf_counter()
+    measured = measure_false_positive_rate(bloom, args.probes)
+    lookup_us = (time.perf_counter() - started) * 1e6 / args.probes
+
+    print(f"{'rate':>7} | {'bits':>7} | {'k':>2} | {'bytes':>6} | {'expected':>8} | {'measured':>8}")
+    for rate in sorted({args.rate, 0.05, 0.01, 0.001}, reverse=True):
+        sized = BloomFilter.from_roll_numbers(roll_nos, false_positive_rate=rate)
+        print(
+            f"{rate:7.3%} | {sized.bit_count:7d} | {sized.hash_count:2d} | {len(sized.bits):6d} | "
+            f"{sized.expected_false_positive_rate():8.3%} | "
+            f"{measure_false_positive_rate(sized, args.probes):8.3%}"
+        )
+
+    print(f"lookup   | {lookup_us:.2f} us per roll number")
+
+    # Measured rate should sit near the target; 1.5x allows for sampling noise.
+    target_met = measured <= args.rate * 1.5
+    print(f"false positives at {args.rate:.3%} target: {measured:.3%} -> {'PASS' if target_met else 'FAIL'}")
+    sys.exit(0 if target_met else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_canteen_sync.py
+"""
+Offline canteen sync benchmark
+
+Uploads the same offline backlog twice:
+
+- legacy: find_one student, insert_one visit and insert_one alert per visit
+- bulk:   services/sync_service.sync_canteen_visits ($in prefetch,
+          one insert_many for visits, one for alerts)
+
+and reports the server time of each. The target for the bulk path is
+a 5,000-visit backlog in under a second.
+
+Runs against a scratch database, never the production one:
+
+    MONGO_URL=mongodb+srv://... python benchmarks/bench_canteen_sync.py --visits 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import certifi
+from pymongo import MongoClient
+
+from utils.time_utils import get_ist_now
+from services.alert_service import create_unauthorized_alert
+from services.student_directory import student_directory
+from services.sync_service import sync_canteen_visits
+
+TARGET_SECONDS = 1.0
+HOSTELS = ['A', 'B', 'C', 'D']
+
+
+def _legacy_sync(visits, user_role, db):
+    """The pre-bulk sync loop (2-3 round trips per visit)."""
+    user_hostel = user_role.split('_')[1].upper()
+    for visit in visits:
+        student = db.students.find_one({'roll_no': visit['roll_no']})
+        now = get_ist_now()
+        visit_record = {
+            'roll_no': visit['roll_no'],
+            'student_hostel': student['hostel'],
+            'canteen_hostel': user_hostel,
+            'role': user_role,
+            'timestamp': now,
+            'student_name': student['name'],
+            'type': 'canteen',
+            'is_unauthorized': student['hostel'] != user_hostel,
+            'date': now.date(),
+            'hour': now.hour,
+            'day_of_week': now.strftime('%A'),
+            'offline_sync': True
+        }
+        db.canteen_visits.insert_one(visit_record)
+        if visit_record['is_unauthorized']:
+            create_unauthorized_alert(visit_record, db)
+
+
+def _bulk_sync(visits, user_role, db):
+    # Start cold so the $in prefetch is part of the measurement.
+    for roll_no in {visit['roll_no'] for visit in visits}:
+        student_directory.invalidate(roll_no)
+    sync_canteen_visits(visits, user_role, db)
+
+
+def _run(label, sync, visits, db):
+    db.canteen_visits.delete_many({})
+    db.realtime_alerts.delete_many({})
+
+    started = time.perf_counter()
+    sync(visits, 'canteen_a', db)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<7} | visits={len(visits)} | "
+        f"stored={db.canteen_visits.count_documents({})} | "
+        f"alerts={db.realtime_alerts.count_documents({})} | "
+        f"server_time={elapsed:.3f} s"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--visits', type=int, default=5000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--database', default='student_management_bench')
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    options = {'tlsCAFile': certifi.where()} if mongo_url.startswith('mongodb+srv') else {}
+    client = MongoClient(mongo_url, **options)
+    db = client[args.database]
+
+    db.students.create_index([('roll_no', 1)], unique=True)
+    db.students.insert_many([
+        {
+            'roll_no': f'BENCH{i:06d}',
+            'name': f'Bench {i}',
+            'hostel': HOSTELS[i % len(HOSTELS)]
+        }
+        for i in range(args.students)
+    ])
+
+    started_ms = int(time.time() * 1000) - args.visits * 1000
+    visits = [
+        {
+            'roll_no': f'BENCH{i % args.students:06d}',
+            'original_timestamp': started_ms + i * 1000
+        }
+        for i in range(args.visits)
+    ]
+
+    try:
+        if not args.skip_legacy:
+            _run('legacy', _legacy_sync, visits, db)
+        elapsed = _run('bulk', _bulk_sync, visits, db)
+        verdict = 'PASS' if elapsed < TARGET_SECONDS else 'FAIL'
+        print(f"bulk target < {TARGET_SECONDS:.1f} s: {verdict}")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_checkout.py
+"""
+Check-out latency benchmark
+
+Compares the legacy sequential check-out (idempotency find_one,
+active checkout find_one, insert_one, upsert) with the consolidated
+path in services/movement_service.py that relies on unique indexes.
+
+Runs against a scratch database, never the production one:
+
+    MONGO_URL=mongodb+srv://... python benchmarks/bench_checkout.py --scans 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import certifi
+from pymongo import MongoClient
+
+from utils.time_utils import get_ist_now
+from services.monitoring_service import create_active_checkout
+from services.movement_service import _process_check_out
+
+
+def _legacy_check_out(student, roll_no, now, user_role, event_id, db):
+    """The pre-consolidation check-out sequence (4 round trips)."""
+    if db.movement_records.find_one({'event_id': event_id}):
+        return
+    if db.active_checkouts.find_one({
+        'roll_no': roll_no,
+        'status': {'$in': ['active', 'violation']}
+    }):
+        return
+    db.movement_records.insert_one({
+        'event_id': event_id,
+        'roll_no': roll_no,
+        'action': 'out',
+        'out_time': now,
+        'in_time': None,
+        'recorded_by': user_role,
+        'recorded_at': now,
+        'status': 'outside',
+        'offline_sync': False,
+        'created_at': now,
+        'updated_at': now
+    })
+    create_active_checkout(
+        roll_no=roll_no,
+        student=student,
+        out_time=now,
+        user_role=user_role,
+        movement_id=event_id,
+        db=db
+    )
+
+
+def _consolidated_check_out(student, roll_no, now, user_role, event_id, db):
+    _process_check_out(student, roll_no, now, user_role, False, event_id, db)
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run(label, check_out, scans, db):
+    db.movement_records.delete_many({})
+    db.active_checkouts.delete_many({})
+
+    samples = []
+    for i in range(scans):
+        roll_no = f'BENCH{i:06d}'
+        student = {'roll_no': roll_no, 'name': f'Bench {i}', 'hostel': 'A'}
+        started = time.perf_counter()
+        check_out(student, roll_no, get_ist_now(), 'security_a', str(uuid.uuid4()), db)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    print(
+        f"{label:<14} | scans={scans} | "
+        f"p50={_percentile(samples, 50):.2f} ms | "
+        f"p99={_percentile(samples, 99):.2f} ms | "
+        f"mean={statistics.mean(samples):.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scans', type=int, default=300)
+    parser.add_argument('--database', default='student_management_bench')
+    args = parser.parse_args()
+
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    options = {'tlsCAFile': certifi.where()} if mongo_url.startswith('mongodb+srv') else {}
+    client = MongoClient(mongo_url, **options)
+    db = client[args.database]
+
+    db.movement_records.create_index([('event_id', 1)], unique=True)
+    db.active_checkouts.create_index([('roll_no', 1)], unique=True)
+
+    try:
+        _run('legacy', _legacy_check_out, args.scans, db)
+        _run('consolidated', _consolidated_check_out, args.scans, db)
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_roster_codec.py
+"""
+Binary roster codec benchmark
+
+Builds a synthetic roster and compares utils/roster_codec.py with
+the JSON body the roster endpoints serve: size (raw, gzip, zstd)
+and encode, decode and lookup speed. Correctness is covered by
+tests/test_roster_codec.py.
+
+No database needed:
+
+    python benchmarks/bench_roster_codec.py --students 10000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.roster_codec import RosterView, decode_roster, encode_roster
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HOSTELS = ['A', 'B', 'C', 'D']
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Ananya', 'Vikram', 'Meera', 'Rohan', 'Saanvi']
+LAST_NAMES = ['Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Gupta', 'Singh', 'Das']
+
+
+def _roster(count, seed=7):
+    rng = random.Random(seed)
+    students = [
+        {
+            'roll_no': f'{rng.choice(["21", "22", "23", "24"])}{rng.choice(["CS", "EC", "ME"])}{i:05d}',
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'hostel': rng.choice(HOSTELS)
+        }
+        for i in range(count)
+    ]
+    rng.shuffle(students)
+    return students
+
+
+def _time(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    students = _roster(args.students)
+
+    json_encode_ms, json_body = _time(
+        lambda: json.dumps({'students': students}, separators=(',', ':')).encode('utf-8'),
+        args.repeat
+    )
+    binary_encode_ms, binary_body = _time(lambda: encode_roster(students, 1), args.repeat)
+    json_decode_ms, _ = _time(lambda: json.loads(json_body), args.repeat)
+    binary_decode_ms, _ = _time(lambda: decode_roster(binary_body), args.repeat)
+    view = RosterView(binary_body)
+    lookup_us = _time(lambda: view.find(students[-1]['roll_no']), 1000)[0] * 1000
+
+    rows = [('json', json_body), ('binary', binary_body)]
+    print(f"{'format':<8} | {'raw KB':>8} | {'gzip KB':>8} | {'zstd KB':>8}")
+    for label, body in rows:
+        zstd_kb = (
+            f"{len(zstandard.ZstdCompressor(level=19).compress(body)) / 1024:8.1f}"
+            if zstandard else f"{'n/a':>8}"
+        )
+        print(
+            f"{label:<8} | {len(body) / 1024:8.1f} | "
+            f"{len(gzip.compress(body, 9)) / 1024:8.1f} | {zstd_kb}"
+        )
+
+    print(f"encode   | json={json_encode_ms:.2f} ms | binary={binary_encode_ms:.2f} ms")
+    print(f"decode   | json={json_decode_ms:.2f} ms | binary={binary_decode_ms:.2f} ms")
+    print(f"lookup   | binary search on encoded roster={lookup_us:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# services/active_checkout_registry.py
+"""
+Active Checkout Registry - In-process view of the students outside
+
+The monitor, supervisor dashboards and get_active_students_outside
+all need the live set of open checkouts. Instead of each querying
+`active_checkouts`, every worker keeps a registry of them:
+
+- Loaded once at startup with a projection.
+- Kept current by a change stream on `active_checkouts`, including
+  checkouts written by other workers.
+- Reloaded in full whenever the stream is (re)opened, so changes
+  missed while it was invalidated or interrupted are picked up.
+- Falls back to a periodic reload when change streams are not
+  available (standalone MongoDB without a replica set).
+
+Listeners registered with add_listener() see every change, the same
+way student_directory listeners do.
+"""
+
+import os
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from utils.db_utils import get_db
+
+# Fields kept per checkout; everything else stays in MongoDB.
+REGISTRY_PROJECTION = {
+    '_id': 1,
+    'roll_no': 1,
+    'student_name': 1,
+    'student_hostel': 1,
+    'out_time': 1,
+    'deadline': 1,
+    'allowed_minutes': 1,
+    'status': 1,
+    'alert_sent': 1
+}
+
+# Reload interval used when change streams are unavailable.
+REFRESH_SECONDS = int(os.environ.get('ACTIVE_CHECKOUT_REFRESH_SECONDS', 10))
+
+# Error code returned by MongoDB when change streams are not supported.
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+
+class ActiveCheckoutRegistry:
+    """_id keyed registry of projected active_checkouts documents"""
+
+    def __init__(self):
+        self._checkouts = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._listeners = []
+        self.loaded = False
+        self.mode = 'not_started'
+        self.events = 0
+        self.reloads = 0
+
+    # ============================================================
+    # READS
+    # ============================================================
+
+    def outside(self, hostel=None, statuses=('active',)):
+        """
+        Open checkouts, oldest first, optionally of one hostel.
+        Returns copies without _id, shaped like the MongoDB projection
+        they replace.
+        """
+        with self._lock:
+            checkouts = list(self._checkouts.values())
+
+        selected = [
+            {key: value for key, value in checkout.items() if key != '_id'}
+            for checkout in checkouts
+            if checkout.get('status') in statuses
+            and (hostel is None or checkout.get('student_hostel') == hostel)
+        ]
+        selected.sort(key=lambda checkout: (checkout.get('out_time') is None, checkout.get('out_time')))
+        return selected
+
+    def get(self, roll_no):
+        """Open checkout of roll_no, or None"""
+        with self._lock:
+            for checkout in self._checkouts.values():
+                if checkout.get('roll_no') == roll_no:
+                    return dict(checkout)
+        return None
+
+    def counts(self):
+        """{hostel: {status: count}} of the open checkouts"""
+        counts = {}
+        with self._lock:
+            for checkout in self._checkouts.values():
+                by_status = counts.setdefault(checkout.get('student_hostel'), {})
+                status = checkout.get('status')
+                by_status[status] = by_status.get(status, 0) + 1
+        return counts
+
+    def __len__(self):
+        return len(self._checkouts)
+
+    def stats(self):
+        return {
+            'size': len(self._checkouts),
+            'mode': self.mode,
+            'loaded': self.loaded,
+            'events': self.events,
+            'reloads': self.reloads
+        }
+
+    # ============================================================
+    # LISTENERS
+    # ============================================================
+
+    def add_listener(self, listener):
+        """
+        Register listener(operation, checkout).
+
+        - 'upsert': checkout is the projected document after the change
+        - 'delete': checkout is the last known document (None if unseen)
+        - 'resync': after every full reload; checkout is None
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, operation, checkout=None):
+        for listener in self._listeners:
+            try:
+                listener(operation, checkout)
+            except Exception as e:
+                print(f"⚠️ Active checkout listener failed: {type(e).__name__}: {e}")
+
+    # ============================================================
+    # LOADING AND FRESHNESS
+    # ============================================================
+
+    def load(self, db):
+        """Load every open checkout with a projection and swap them in"""
+        checkouts = {
+            checkout['_id']: checkout
+            for checkout in db.active_checkouts.find({}, REGISTRY_PROJECTION)
+        }
+
+        with self._lock:
+            self._checkouts = checkouts
+
+        self.loaded = True
+        self.reloads += 1
+        print(f"🚪 ACTIVE CHECKOUT REGISTRY LOADED | Outside={len(checkouts)}")
+
+        self._notify('resync')
+
+    def start(self, db=None):
+        """Load the registry and start the background freshness thread"""
+        if self._watcher is not None:
+            return
+
+        if db is None:
+            db = get_db()
+
+        try:
+            self.load(db)
+        except PyMongoError as e:
+            print(f"⚠️ Active checkout registry load failed: {e}")
+
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(db,),
+            name='active-checkout-registry',
+            daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, db):
+        """Follow the active_checkouts change stream; fall back to polling if unsupported"""
+        pipeline = [{
+            '$project': dict(
+                {'operationType': 1, 'documentKey': 1},
+                **{f'fullDocument.{field}': 1 for field in REGISTRY_PROJECTION}
+            )
+        }]
+
+        while not self._stop.is_set():
+            try:
+                with db.active_checkouts.watch(pipeline, full_document='updateLookup') as stream:
+                    self.mode = 'change_stream'
+                    # Reload once the stream is open so no change falls between the two
+                    self.load(db)
+                    for change in stream:
+                        self._apply_change(change)
+                        if self._stop.is_set():
+                            return
+
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    print("ℹ️ Change streams unavailable; active checkout registry will poll")
+                    self._poll(db)
+                    return
+                print(f"⚠️ Active checkout stream error, resyncing: {e}")
+
+            except PyMongoError as e:
+                print(f"⚠️ Active checkout stream error, resyncing: {e}")
+
+            # The stream was interrupted or invalidated; reopening it reloads in full.
+            time.sleep(5)
+
+    def _apply_change(self, change):
+        operation = change.get('operationType')
+        self.events += 1
+
+        if operation in ('insert', 'update', 'replace'):
+            checkout = change.get('fullDocument')
+            if checkout is None:
+                # Deleted before the lookup ran.
+                self._remove(change['documentKey']['_id'])
+                return
+            with self._lock:
+                self._checkouts[checkout['_id']] = checkout
+            self._notify('upsert', checkout)
+
+        elif operation == 'delete':
+            self._remove(change['documentKey']['_id'])
+
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            raise PyMongoError(f"active_checkouts change stream {operation}")
+
+    def _remove(self, checkout_id):
+        with self._lock:
+            previous = self._checkouts.pop(checkout_id, None)
+        self._notify('delete', previous)
+
+    def _poll(self, db):
+        self.mode = 'polling'
+        while not self._stop.wait(REFRESH_SECONDS):
+            try:
+                self.load(db)
+            except PyMongoError as e:
+                print(f"⚠️ Active checkout registry reload failed: {e}")
+
+
+# Process-wide registry of the students outside
+active_checkout_registry = ActiveCheckoutRegistry()
@@ -10,25 +10,17 @@ from utils.time_utils import INDIA_TZ, get_ist_now
 from utils.db_utils import get_db
 
 
-def create_unauthorized_alert(visit_record, db=None):
+def build_unauthorized_alert(visit_record):
     """
-    Create a real-time alert for unauthorized canteen visit
+    Build the real-time alert document for an unauthorized canteen visit
     
     Args:
         visit_record: The visit record that triggered the alert
-        db: Database connection (optional)
     
     Returns:
-        dict: The created alert
+        dict: Alert document, not yet stored
     """
-    if db is None:
-        db = get_db()
-    
-    if db is None:
-        print("⚠️ Cannot create alert - database unavailable")
-        return None
-    
-    alert_message = {
+    return {
         'type': 'unauthorized_visit',
         'message': f'🚨 Unauthorized canteen visit detected!',
         'details': {
@@ -42,6 +34,27 @@ def create_unauthorized_alert(visit_record, db=None):
         'priority': 'high',
         'auto_generated': True
     }
+
+
+def create_unauthorized_alert(visit_record, db=None):
+    """
+    Create a real-time alert for unauthorized canteen visit
+    
+    Args:
+        visit_record: The visit record that triggered the alert
+        db: Database connection (optional)
+    
+    Returns:
+        dict: The created alert
+    """
+    if db is None:
+        db = get_db()
+    
+    if db is None:
+        print("⚠️ Cannot create alert - database unavailable")
+        return None
+    
+    alert_message = build_unauthorized_alert(visit_record)
     
     result = db.realtime_alerts.insert_one(alert_message)
     print(f"📢 UNAUTHORIZED ALERT: {alert_message['message']}")
@@ -49,6 +62,34 @@ def create_unauthorized_alert(visit_record, db=None):
     return alert_message
 
 
+def create_unauthorized_alerts(visit_records, db=None):
+    """
+    Create real-time alerts for many unauthorized canteen visits
+    with a single insert_many
+    
+    Args:
+        visit_records: Visit records that triggered alerts
+        db: Database connection (optional)
+    
+    Returns:
+        list: The created alerts
+    """
+    if db is None:
+        db = get_db()
+    
+    if db is None:
+        print("⚠️ Cannot create alerts - database unavailable")
+        return []
+    
+    alerts = [build_unauthorized_alert(visit_record) for visit_record in visit_records]
+    
+    if alerts:
+        db.realtime_alerts.insert_many(alerts, ordered=False)
+        print(f"📢 UNAUTHORIZED ALERTS: {len(alerts)} canteen visits")
+    
+    return alerts
+
+
 def create_time_violation_alert(roll_no, checkout, out_time_utc, allowed_minutes, 
                                 exceeded_minutes, now_utc, db=None):
     """
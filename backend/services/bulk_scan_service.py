@@ -0,0 +1,610 @@
+# services/bulk_scan_service.py
+"""
+Bulk Scan Service - Executes an ordered list of security scans with
+batched database work
+
+Each scan gets exactly the response process_security_scan would give
+if the scans were sent one by one, but the database work is batched:
+
+1. Students come from the directory (misses: one $in query).
+2. Active checkouts and the referenced movement records are
+   prefetched with one $in query each.
+3. The scans are replayed in order against that in-memory state.
+4. The resulting writes go out in the order of the single-scan
+   path, one bulk_write per step: checkouts closed by check-ins are
+   removed, movements are inserted and closed, then the checkouts
+   of new check-outs are inserted.
+
+Writes for one student are collapsed to a single operation per
+document, so the unordered bulk writes never depend on op order.
+If another gate recorded a student's check-in while the batch was
+planned, that student's scans are re-run through the single-scan
+path. A movement write that fails is rolled back per student the
+way the single-scan path does it: a checkout removed for a close
+that failed while the movement is still open is put back, and a
+check-out whose movement or checkout slot could not be written is
+reported as a concurrent change.
+"""
+
+import uuid
+from collections import defaultdict
+from datetime import timezone
+
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.db_utils import get_db
+from services.monitoring_service import (
+    build_active_checkout_document,
+    schedule_checkout_deadline,
+    cancel_checkout_deadline
+)
+from services.outbox_service import new_effect, dispatch_effects
+from services.student_directory import student_directory
+from services.movement_service import (
+    ACTIVE_STATUSES,
+    CONCURRENT_CHANGE_RESPONSE,
+    process_security_scan,
+    get_user_hostel,
+    resolve_scan_time,
+    _validate_scan_fields,
+    _validate_scan_time,
+    _check_student_access,
+    _cached_replay,
+    _remember_event,
+    _movement_payload,
+    _build_out_movement_record,
+    _check_out_response,
+    _already_checked_out_response,
+    _check_out_replay_response,
+    _plan_check_in,
+    _movement_close_rejection,
+    _check_in_replay_response,
+    _restore_active_checkout,
+)
+
+# Scans planned and written together; bounds memory per batch.
+BULK_CHUNK_SIZE = 500
+
+
+def process_security_scans_bulk(user_role, scans, db=None):
+    """
+    Process an ordered list of security scans.
+
+    Args:
+        user_role: The role of the user performing the scans
+        scans: List of scan dicts (roll_no, action, event_id, ...)
+        db: Database connection (optional)
+
+    Returns:
+        list: (response_data, status_code) per scan, in input order
+    """
+    if db is None:
+        db = get_db()
+
+    results = []
+
+    for start in range(0, len(scans), BULK_CHUNK_SIZE):
+        batch = _ScanBatch(user_role, scans[start:start + BULK_CHUNK_SIZE], db)
+        results.extend(batch.run())
+
+    return results
+
+
+def _stored_view(document):
+    """
+    Copy of a planned document as MongoDB would return it
+    (naive UTC datetimes), so replay responses match the
+    single-scan path byte for byte.
+    """
+    view = dict(document)
+    for key in ('out_time', 'in_time'):
+        value = view.get(key)
+        if value is not None and value.tzinfo is not None:
+            view[key] = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return view
+
+
+class _ScanBatch:
+    """Plans and writes one chunk of scans"""
+
+    def __init__(self, user_role, scans, db):
+        self.user_role = user_role
+        self.user_hostel = get_user_hostel(user_role)
+        self.raw_scans = scans
+        self.db = db
+        self.results = [None] * len(scans)
+
+        # Scans that reached planning, grouped per student in order.
+        self.scans_by_roll = defaultdict(list)
+        # Indexes of scans whose result depends on a movement write.
+        self.writes_by_movement = defaultdict(list)
+
+        # In-memory state, seeded from the prefetch.
+        self.open_checkouts = {}
+        self.events = {}
+        self.in_events = {}
+
+        # Planned writes.
+        self.deleted_checkouts = {}
+        self.new_checkouts = {}
+        self.new_movements = {}
+        self.closed_movements = {}
+        # Movements whose close lost to another gate's check-in.
+        self.closed_elsewhere = set()
+        # roll_no -> [(movement_id, (filter, update))]
+        self.disciplinary_updates = defaultdict(list)
+        self.effects = defaultdict(list)
+        self.remember = []
+
+    # ============================================================
+    # DRIVER
+    # ============================================================
+
+    def run(self):
+        parsed = self._parse()
+
+        if parsed:
+            students = student_directory.get_many(
+                [scan['roll_no'] for scan in parsed], self.db
+            )
+
+            planned = []
+            for scan in parsed:
+                student = students.get(scan['roll_no'])
+                denied = _check_student_access(
+                    student, scan['action'], self.user_role, self.user_hostel
+                )
+                if denied is not None:
+                    self.results[scan['index']] = denied
+                    continue
+                scan['student'] = student
+                planned.append(scan)
+                self.scans_by_roll[scan['roll_no']].append(scan)
+
+            if planned:
+                self._prefetch(planned)
+
+                for scan in planned:
+                    if scan['action'] == 'out':
+                        self._plan_out(scan)
+                    else:
+                        self._plan_in(scan)
+
+                conflicts = self._write()
+                self._rerun(conflicts)
+
+        for index, action, event_id, roll_no, hostel in self.remember:
+            response_data, status_code = self.results[index]
+            if status_code == 200:
+                _remember_event(action, event_id, roll_no, hostel, response_data)
+
+        return self.results
+
+    def _parse(self):
+        parsed = []
+
+        for index, data in enumerate(self.raw_scans):
+            if not isinstance(data, dict):
+                self.results[index] = ({'message': 'Invalid scan format'}, 400)
+                continue
+
+            roll_no = data.get('roll_no')
+            action = data.get('action')
+
+            invalid = _validate_scan_fields(roll_no, action)
+            if invalid is not None:
+                self.results[index] = invalid
+                continue
+
+            event_id = data.get('event_id')
+            if event_id:
+                cached_response = _cached_replay(
+                    roll_no, action, event_id, self.user_role, self.user_hostel
+                )
+                if cached_response is not None:
+                    self.results[index] = cached_response
+                    continue
+            else:
+                # Same as the single path: a server-generated event ID.
+                event_id = str(uuid.uuid4())
+
+            is_offline_sync = data.get('offline_sync', False)
+
+            invalid = _validate_scan_time(is_offline_sync, data.get('original_timestamp'))
+            if invalid is not None:
+                self.results[index] = invalid
+                continue
+
+            parsed.append({
+                'index': index,
+                'data': data,
+                'roll_no': roll_no,
+                'action': action,
+                'event_id': event_id,
+                'is_offline_sync': is_offline_sync,
+                'now': resolve_scan_time(is_offline_sync, data.get('original_timestamp'))
+            })
+
+        return parsed
+
+    def _prefetch(self, planned):
+        roll_nos = list(self.scans_by_roll)
+
+        for checkout in self.db.active_checkouts.find({
+            'roll_no': {'$in': roll_nos},
+            'status': {'$in': ACTIVE_STATUSES}
+        }):
+            self.open_checkouts[checkout['roll_no']] = checkout
+
+        event_ids = {
+            scan['event_id'] for scan in planned if scan['action'] == 'out'
+        }
+        event_ids.update(
+            checkout.get('movement_id')
+            for checkout in self.open_checkouts.values()
+            if checkout.get('movement_id')
+        )
+        in_event_ids = {
+            scan['event_id'] for scan in planned if scan['action'] == 'in'
+        }
+
+        for movement in self.db.movement_records.find(
+            {'$or': [
+                {'event_id': {'$in': list(event_ids)}},
+                {'in_event_id': {'$in': list(in_event_ids)}}
+            ]},
+            {'pending_effects': 0}
+        ):
+            self.events[movement['event_id']] = movement
+            if movement.get('in_event_id'):
+                self.in_events[(movement['in_event_id'], movement['roll_no'])] = movement
+
+    # ============================================================
+    # PLANNING
+    # ============================================================
+
+    def _plan_out(self, scan):
+        roll_no = scan['roll_no']
+        event_id = scan['event_id']
+        student = scan['student']
+        now = scan['now']
+
+        existing_event = self.events.get(event_id)
+        if existing_event is not None:
+            self._set_result(scan, _check_out_replay_response(
+                student, roll_no, event_id, _stored_view(existing_event)
+            ))
+            return
+
+        open_checkout = self.open_checkouts.get(roll_no)
+        if open_checkout is not None:
+            self._set_result(scan, _already_checked_out_response(
+                _stored_view(open_checkout).get('out_time')
+            ))
+            return
+
+        effects = [
+            new_effect('movement_update', _movement_payload(
+                student, roll_no, 'out', now, self.user_role, event_id
+            ))
+        ]
+        movement = _build_out_movement_record(
+            roll_no, now, self.user_role, scan['is_offline_sync'], event_id, effects
+        )
+        checkout = build_active_checkout_document(
+            roll_no=roll_no,
+            student=student,
+            out_time=now,
+            user_role=self.user_role,
+            offline_sync=scan['is_offline_sync'],
+            movement_id=event_id
+        )
+
+        self.events[event_id] = movement
+        self.new_movements[event_id] = movement
+        self.open_checkouts[roll_no] = checkout
+        self.new_checkouts[roll_no] = checkout
+        self.effects[event_id].extend(effects)
+
+        self._set_result(
+            scan,
+            _check_out_response(student, roll_no, now, event_id, scan['is_offline_sync']),
+            movement_id=event_id
+        )
+
+    def _plan_in(self, scan):
+        roll_no = scan['roll_no']
+        event_id = scan['event_id']
+        student = scan['student']
+
+        existing_in_event = self.in_events.get((event_id, roll_no))
+        if existing_in_event is not None:
+            self._set_result(scan, _check_in_replay_response(
+                student, roll_no, event_id, _stored_view(existing_in_event)
+            ))
+            return
+
+        open_checkout = self.open_checkouts.get(roll_no)
+        if open_checkout is None:
+            self._set_result(scan, ({'message': 'No active check out record found'}, 400))
+            return
+
+        plan, rejection = _plan_check_in(
+            student, roll_no, scan['now'], self.user_role,
+            scan['is_offline_sync'], event_id, open_checkout
+        )
+        if rejection is not None:
+            self._set_result(scan, rejection)
+            return
+
+        movement_id = plan['movement_id']
+        movement = self.events.get(movement_id)
+
+        if movement is None or movement.get('roll_no') != roll_no:
+            self._set_result(scan, _movement_close_rejection(None))
+            return
+
+        if movement.get('in_time') is not None:
+            self._set_result(scan, _movement_close_rejection(movement))
+            return
+
+        if movement_id in self.new_movements:
+            # Opened and closed in this batch: one insert carries both.
+            movement.update(plan['movement_fields'])
+            movement['pending_effects'].extend(plan['effects'])
+        else:
+            self.closed_movements[movement_id] = {
+                'roll_no': roll_no,
+                'in_event_id': event_id,
+                'fields': plan['movement_fields'],
+                'effects': plan['effects']
+            }
+            movement = dict(movement, **plan['movement_fields'])
+            self.events[movement_id] = movement
+
+        self.in_events[(event_id, roll_no)] = movement
+        self.effects[movement_id].extend(plan['effects'])
+
+        if plan['disciplinary_update'] is not None:
+            self.disciplinary_updates[roll_no].append((movement_id, plan['disciplinary_update']))
+
+        if self.new_checkouts.get(roll_no) is open_checkout:
+            del self.new_checkouts[roll_no]
+        else:
+            self.deleted_checkouts[roll_no] = open_checkout
+        self.open_checkouts[roll_no] = None
+
+        self._set_result(scan, plan['response'], movement_id=movement_id)
+
+    def _set_result(self, scan, result, movement_id=None):
+        self.results[scan['index']] = result
+        self.remember.append((
+            scan['index'], scan['action'], scan['event_id'],
+            scan['roll_no'], scan['student'].get('hostel')
+        ))
+        if movement_id is not None:
+            self.writes_by_movement[movement_id].append(scan['index'])
+
+    # ============================================================
+    # WRITING
+    # ============================================================
+
+    def _write(self):
+        """Run the planned bulk writes; return the students to re-run"""
+        # Same order as the single-scan path: a check-in claims its
+        # checkout before closing the movement, and a check-out records
+        # its movement before claiming the checkout slot.
+        rerun = self._claim_checkouts()
+
+        failed = self._write_movements(rerun)
+        if failed:
+            self._roll_back(failed)
+
+        self._insert_checkouts(rerun, failed)
+
+        self._write_disciplinary(rerun, failed)
+
+        # Re-run students are scheduled by process_security_scan;
+        # restored checkouts by _restore_active_checkout.
+        for roll_no in (set(self.deleted_checkouts) | set(self.new_checkouts)) - rerun:
+            new_checkout = self.new_checkouts.get(roll_no)
+            if new_checkout is not None:
+                schedule_checkout_deadline(roll_no, new_checkout['deadline'])
+            else:
+                cancel_checkout_deadline(roll_no)
+
+        for movement_id, effects in self.effects.items():
+            movement = self.events.get(movement_id)
+            if movement is not None and movement['roll_no'] not in rerun and movement_id not in failed:
+                dispatch_effects(movement_id, effects, self.db)
+
+        for movement_id in failed:
+            for index in self.writes_by_movement.get(movement_id, []):
+                self.results[index] = CONCURRENT_CHANGE_RESPONSE
+
+        return rerun
+
+    def _claim_checkouts(self):
+        """
+        Remove the checkouts closed by planned check-ins; return the
+        students whose check-in another gate has already recorded.
+        """
+        claims = {
+            roll_no: checkout['_id']
+            for roll_no, checkout in self.deleted_checkouts.items()
+        }
+
+        if not claims:
+            return set()
+
+        try:
+            removed = self.db.active_checkouts.bulk_write(
+                [DeleteOne({'_id': checkout_id}) for checkout_id in claims.values()],
+                ordered=False
+            ).deleted_count
+        except BulkWriteError as e:
+            removed = e.details.get('nRemoved', 0)
+
+        if removed == len(claims):
+            return set()
+
+        # Some checkouts were already gone, claimed by another gate.
+        # The counts do not say whose; a claimant that already closed
+        # the movement has won, so those students are re-run before
+        # anything is written for them. The conditional movement close
+        # settles the rest.
+        movement_ids = {
+            self.deleted_checkouts[roll_no]['movement_id']: roll_no
+            for roll_no in claims
+        }
+        lost = set()
+        for movement in self.db.movement_records.find(
+            {'event_id': {'$in': list(movement_ids)}},
+            {'event_id': 1, 'in_time': 1}
+        ):
+            if movement.get('in_time') is not None:
+                lost.add(movement_ids[movement['event_id']])
+
+        print(
+            f"⚠️ BULK SCAN CLAIM CONFLICTS | Missing={len(claims) - removed} | "
+            f"Rerun={sorted(lost)}"
+        )
+        return lost
+
+    def _write_movements(self, skip):
+        """Insert and close the planned movements; return the movement IDs not written"""
+        operations = []
+        op_movements = []
+
+        for event_id, movement in self.new_movements.items():
+            if movement['roll_no'] in skip:
+                continue
+            operations.append(InsertOne(movement))
+            op_movements.append(event_id)
+
+        closing = {}
+        for movement_id, closure in self.closed_movements.items():
+            if closure['roll_no'] in skip:
+                continue
+            operations.append(UpdateOne(
+                {
+                    'event_id': movement_id,
+                    'roll_no': closure['roll_no'],
+                    'in_time': None
+                },
+                {
+                    '$set': closure['fields'],
+                    '$push': {'pending_effects': {'$each': closure['effects']}}
+                }
+            ))
+            op_movements.append(movement_id)
+            closing[movement_id] = closure
+
+        failed = set()
+
+        if not operations:
+            return failed
+
+        try:
+            result = self.db.movement_records.bulk_write(operations, ordered=False)
+            modified = result.modified_count
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                failed.add(op_movements[write_error['index']])
+            modified = e.details.get('nModified', 0)
+
+        # A close that modified nothing lost a race with another gate.
+        if closing and modified < len(closing):
+            for movement in self.db.movement_records.find(
+                {'event_id': {'$in': list(closing)}},
+                {'event_id': 1, 'in_event_id': 1, 'in_time': 1}
+            ):
+                closure = closing[movement['event_id']]
+                if movement.get('in_event_id') != closure['in_event_id']:
+                    failed.add(movement['event_id'])
+                    if movement.get('in_time') is not None:
+                        self.closed_elsewhere.add(movement['event_id'])
+
+        return failed
+
+    def _roll_back(self, failed):
+        """
+        Undo the checkout writes behind movements that were not written,
+        one student at a time, as the single-scan path does.
+        """
+        roll_nos = {self.events[movement_id]['roll_no'] for movement_id in failed}
+
+        for roll_no in roll_nos:
+            new_checkout = self.new_checkouts.get(roll_no)
+            if new_checkout is not None and new_checkout['movement_id'] in failed:
+                # Its movement insert failed: the checkout is never written.
+                del self.new_checkouts[roll_no]
+                new_checkout = None
+
+            old_checkout = self.deleted_checkouts.get(roll_no)
+            movement_id = old_checkout.get('movement_id') if old_checkout is not None else None
+            if movement_id in failed and movement_id not in self.closed_elsewhere:
+                # Its movement is still open: the student is still outside,
+                # so a check-out planned after it cannot stand either.
+                if new_checkout is not None:
+                    self._drop_new_movement(roll_no, new_checkout['movement_id'])
+                    failed.add(new_checkout['movement_id'])
+                _restore_active_checkout(old_checkout, self.db)
+                del self.deleted_checkouts[roll_no]
+
+        print(f"⚠️ BULK SCAN CONFLICTS | Students={sorted(roll_nos)} | Movements={sorted(failed)}")
+
+    def _insert_checkouts(self, rerun, failed):
+        """Claim the checkout slots of the recorded check-outs"""
+        inserts = [
+            (roll_no, checkout) for roll_no, checkout in self.new_checkouts.items()
+            if roll_no not in rerun
+        ]
+
+        if not inserts:
+            return
+
+        try:
+            self.db.active_checkouts.bulk_write(
+                [InsertOne(checkout) for _, checkout in inserts],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # The student was checked out elsewhere meanwhile.
+            for write_error in e.details.get('writeErrors', []):
+                roll_no, checkout = inserts[write_error['index']]
+                self._drop_new_movement(roll_no, checkout['movement_id'])
+                failed.add(checkout['movement_id'])
+                del self.new_checkouts[roll_no]
+            print(f"⚠️ BULK SCAN CHECKOUT CONFLICTS | Errors={len(e.details.get('writeErrors', []))}")
+
+    def _drop_new_movement(self, roll_no, movement_id):
+        # No checkout points at this movement, so nothing else can have used it.
+        self.db.movement_records.delete_one({'event_id': movement_id, 'roll_no': roll_no})
+
+    def _write_disciplinary(self, rerun, failed):
+        operations = [
+            UpdateOne(update_filter, update)
+            for roll_no, updates in self.disciplinary_updates.items()
+            if roll_no not in rerun
+            for movement_id, (update_filter, update) in updates
+            if movement_id not in failed
+        ]
+
+        if not operations:
+            return
+
+        try:
+            self.db.students.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            print(f"❌ Disciplinary bulk write errors: {e.details.get('writeErrors')}")
+
+    def _rerun(self, roll_nos):
+        """Re-run the scans of conflicting students one by one"""
+        for roll_no in roll_nos:
+            print(f"🔁 BULK SCAN RERUN | Roll={roll_no}")
+            for scan in self.scans_by_roll[roll_no]:
+                self.results[scan['index']] = process_security_scan(
+                    self.user_role, scan['data'], self.db
+                )
@@ -0,0 +1,189 @@
+# services/leader_lease.py
+"""
+Leader Lease - One worker runs the background jobs
+
+With more than one gunicorn worker, every worker would run the
+checkout monitor, the scheduled cleanups, the outbox recovery sweep
+and roster stamping. Workers instead compete for a lease document in
+the `leases` collection:
+
+- The holder renews it every LEASE_HEARTBEAT_SECONDS; it expires
+  LEASE_TTL_SECONDS after the last renewal.
+- Expiry is judged by the MongoDB server clock ($$NOW), so worker
+  clocks do not need to agree.
+- A worker stops considering itself leader when its own lease may
+  have expired (measured from before the renewal was sent), even if
+  it cannot reach MongoDB to find out.
+
+If the leader dies, another worker takes over within
+LEASE_TTL_SECONDS + LEASE_HEARTBEAT_SECONDS. A clean shutdown releases
+the lease so failover is immediate.
+"""
+
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+from functools import wraps
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+LEASE_TTL_SECONDS = float(os.environ.get('LEASE_TTL_SECONDS', 15))
+LEASE_HEARTBEAT_SECONDS = float(os.environ.get('LEASE_HEARTBEAT_SECONDS', 5))
+
+# Give up leadership this long before the lease could expire in MongoDB.
+LEASE_SAFETY_SECONDS = 1.0
+
+
+class LeaderLease:
+    """
+    Args:
+        name: Lease document _id; one leader per name
+    """
+
+    def __init__(self, name='background-jobs'):
+        self.name = name
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._db = None
+        self._valid_until = 0.0
+        self._leader = False
+        self._elected_callbacks = []
+        self._thread = None
+        self._stop = threading.Event()
+        self.elections = 0
+        self.renew_failures = 0
+
+    def start(self, db):
+        """Try to acquire the lease now, then keep renewing or retrying it"""
+        if self._thread is not None:
+            return
+
+        self._db = db
+        self._heartbeat()
+
+        self._thread = threading.Thread(target=self._run, name='leader-lease', daemon=True)
+        self._thread.start()
+        atexit.register(self.release)
+
+    def on_elected(self, callback):
+        """Run callback() in a background thread every time this worker becomes leader"""
+        self._elected_callbacks.append(callback)
+        if self.is_leader():
+            self._run_callback(callback)
+
+    def is_leader(self):
+        return self._leader and time.monotonic() < self._valid_until
+
+    def _run(self):
+        while not self._stop.wait(LEASE_HEARTBEAT_SECONDS):
+            self._heartbeat()
+
+    def _heartbeat(self):
+        sent_at = time.monotonic()
+        # A lease that lapsed locally counts as lost even if we get it back
+        was_leader = self.is_leader()
+
+        try:
+            lease = self._db.leases.find_one_and_update(
+                {
+                    '_id': self.name,
+                    '$or': [
+                        {'holder': self.worker_id},
+                        {'$expr': {'$lt': ['$expires_at', '$$NOW']}}
+                    ]
+                },
+                [{
+                    '$set': {
+                        'holder': self.worker_id,
+                        'expires_at': {'$add': ['$$NOW', int(LEASE_TTL_SECONDS * 1000)]},
+                        'renewed_at': '$$NOW',
+                        'acquired_at': {
+                            '$cond': [
+                                {'$eq': ['$holder', self.worker_id]},
+                                '$acquired_at',
+                                '$$NOW'
+                            ]
+                        }
+                    }
+                }],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            acquired = lease is not None and lease.get('holder') == self.worker_id
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease (the upsert lost the race)
+            acquired = False
+        except PyMongoError as e:
+            self.renew_failures += 1
+            print(f"⚠️ Leader lease heartbeat failed: {e}")
+            if self._leader and not was_leader:
+                self._demote()
+            return
+
+        if acquired:
+            self._valid_until = sent_at + LEASE_TTL_SECONDS - LEASE_SAFETY_SECONDS
+            if not was_leader:
+                self._leader = True
+                self.elections += 1
+                print(f"👑 LEADER ELECTED | Lease={self.name} | Worker={self.worker_id}")
+                for callback in self._elected_callbacks:
+                    self._run_callback(callback)
+        elif self._leader:
+            self._demote()
+
+    def _demote(self):
+        self._leader = False
+        self._valid_until = 0.0
+        print(f"🔻 LEADERSHIP LOST | Lease={self.name} | Worker={self.worker_id}")
+
+    def _run_callback(self, callback):
+        def _call():
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ Leader election callback failed: {type(e).__name__}: {e}")
+
+        threading.Thread(target=_call, name='leader-elected', daemon=True).start()
+
+    def release(self):
+        """Give the lease up so another worker can take over immediately"""
+        self._stop.set()
+        if not self._leader or self._db is None:
+            return
+        self._leader = False
+        try:
+            self._db.leases.update_one(
+                {'_id': self.name, 'holder': self.worker_id},
+                [{'$set': {'expires_at': '$$NOW'}}]
+            )
+        except PyMongoError:
+            pass
+
+    def stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'is_leader': self.is_leader(),
+            'elections': self.elections,
+            'renew_failures': self.renew_failures,
+            'ttl_seconds': LEASE_TTL_SECONDS,
+            'heartbeat_seconds': LEASE_HEARTBEAT_SECONDS
+        }
+
+
+def leader_only(func):
+    """Wrap a scheduled job so it only runs on the leader"""
+    @wraps(func)
+    def _wrapper(*args, **kwargs):
+        if not leader_lease.is_leader():
+            print(f"⏭️ Skipping {func.__name__} - not the leader worker")
+            return None
+        return func(*args, **kwargs)
+
+    return _wrapper
+
+
+# Process-wide lease for the background jobs
+leader_lease = LeaderLease()
@@ -1,10 +1,35 @@
 # services/monitoring_service.py
 """
 Monitoring Service - Proactive monitoring of student checkouts
+
+Each worker keeps the deadline of every active checkout in an
+in-process scheduler (utils/deadline_scheduler.py), seeded from
+MongoDB at startup and updated on check-out and check-in, so a
+violation is processed as soon as its deadline passes. Expired
+deadlines are checked on a bounded pool, and the notifications of a
+violation (FCM, WebSocket) on another, after the violation has been
+claimed; both keep the order of each student (roll_no) and run
+different students in parallel. The scheduler thread never waits for
+the check pool: when it is full, the expired checkout is left to the
+next sweep. Deadline checks and the sweep do wait for room in the
+notification pool, which slows them down rather than dropping alerts.
+
+Only the leader worker (services/leader_lease.py) fires deadlines and
+runs the sweep. Every worker's scheduler also follows the active
+checkout registry, so checkouts made by other workers are scheduled
+as they are written; every MONITOR_SWEEP_SECONDS the leader sweeps
+expired checkouts and schedules the ones due soon as a backstop.
+monitor_active_checkouts() remains as a backstop sweep over the
+checkouts already past their deadline.
 """
 
+import threading
+import time
+import uuid
+from concurrent.futures import wait
 from datetime import datetime, timedelta, timezone
-from services.notification_service import send_hostel_alert
+from pymongo import UpdateOne
+from services.notification_service import ALERT_FAILED, ALERT_SKIPPED, send_hostel_alert
 from services.websocket_service import emit_violation_alert
 
 # Import utils
@@ -13,6 +38,46 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.time_utils import INDIA_TZ, get_ist_now, normalize_datetime_to_ist
 from utils.db_utils import get_db
+from utils.deadline_scheduler import DeadlineScheduler
+from utils.keyed_executor import KeyedExecutor
+from services.leader_lease import leader_lease
+from services.active_checkout_registry import active_checkout_registry
+
+
+def build_active_checkout_document(
+    roll_no,
+    student,
+    out_time,
+    user_role,
+    offline_sync=False,
+    movement_id=None
+):
+    """
+    Build the active checkout document used for proactive allowed-time
+    monitoring. Nothing is written to the database here.
+    """
+    # Get student's custom allowed time (default 480 minutes)
+    allowed_minutes = float(student.get('custom_allowed_time_minutes', 480))
+
+    # Normalize times to IST
+    out_time = normalize_datetime_to_ist(out_time)
+    deadline = out_time + timedelta(minutes=allowed_minutes)
+
+    return {
+        'roll_no': roll_no,
+        'student_name': student.get('name', 'Unknown'),
+        'student_hostel': student.get('hostel', 'Unknown'),
+        'movement_id': movement_id,
+        'out_time': out_time,
+        'allowed_minutes': allowed_minutes,
+        'deadline': deadline,
+        'status': 'active',
+        'alert_sent': False,
+        'recorded_by': user_role,
+        'offline_sync': offline_sync,
+        'created_at': get_ist_now(),
+        'updated_at': get_ist_now()
+    }
 
 
 def create_active_checkout(
@@ -35,28 +100,14 @@ def create_active_checkout(
         return None
     
     try:
-        # Get student's custom allowed time (default 480 minutes)
-        allowed_minutes = float(student.get('custom_allowed_time_minutes', 480))
-        
-        # Normalize times to IST
-        out_time = normalize_datetime_to_ist(out_time)
-        deadline = out_time + timedelta(minutes=allowed_minutes)
-        
-        active_checkout = {
-            'roll_no': roll_no,
-            'student_name': student.get('name', 'Unknown'),
-            'student_hostel': student.get('hostel', 'Unknown'),
-            'movement_id': movement_id,
-            'out_time': out_time,
-            'allowed_minutes': allowed_minutes,
-            'deadline': deadline,
-            'status': 'active',
-            'alert_sent': False,
-            'recorded_by': user_role,
-            'offline_sync': offline_sync,
-            'created_at': get_ist_now(),
-            'updated_at': get_ist_now()
-        }
+        active_checkout = build_active_checkout_document(
+            roll_no=roll_no,
+            student=student,
+            out_time=out_time,
+            user_role=user_role,
+            offline_sync=offline_sync,
+            movement_id=movement_id
+        )
         
         db.active_checkouts.update_one(
             {'roll_no': roll_no},
@@ -64,7 +115,9 @@ def create_active_checkout(
             upsert=True
         )
         
-        print(f"⏱️ ACTIVE CHECKOUT CREATED | Roll: {roll_no} | Deadline: {deadline}")
+        schedule_checkout_deadline(roll_no, active_checkout['deadline'])
+        
+        print(f"⏱️ ACTIVE CHECKOUT CREATED | Roll: {roll_no} | Deadline: {active_checkout['deadline']}")
         return active_checkout
         
     except Exception as e:
@@ -72,44 +125,409 @@ def create_active_checkout(
         return None
 
 
+# ============================================================
+# DEADLINE SCHEDULER
+# ============================================================
+
+# Leader sweep interval; deadlines due within two intervals are scheduled each time.
+MONITOR_SWEEP_SECONDS = int(os.environ.get('MONITOR_SWEEP_SECONDS', 60))
+
+
+# Expired deadlines are checked off the scheduler thread, which only keeps time.
+DEADLINE_CHECK_WORKERS = int(os.environ.get('DEADLINE_CHECK_WORKERS', 8))
+DEADLINE_CHECK_MAX_PENDING = int(os.environ.get('DEADLINE_CHECK_MAX_PENDING', 10000))
+
+_deadline_checks = KeyedExecutor(
+    max_workers=DEADLINE_CHECK_WORKERS,
+    max_pending=DEADLINE_CHECK_MAX_PENDING,
+    thread_name_prefix='deadline-checks'
+)
+
+
+def _on_deadline(roll_no):
+    # Followers keep their schedule so they are ready if elected, but do not act on it
+    if leader_lease.is_leader():
+        # Never block the scheduler thread; the sweep catches what is turned away
+        if _deadline_checks.try_submit(roll_no, _run_deadline_check, roll_no) is None:
+            print(f"⚠️ Deadline checks full, leaving to the sweep | Roll={roll_no}")
+
+
+def _run_deadline_check(roll_no):
+    try:
+        check_checkout_deadline(roll_no)
+    except Exception as e:
+        print(f"❌ Deadline check failed | Roll={roll_no} | {type(e).__name__}: {e}")
+        raise
+
+
+checkout_deadlines = DeadlineScheduler(_on_deadline, name='checkout-deadlines')
+_monitor_thread = None
+
+
+def start_deadline_monitor(db=None):
+    """Start the scheduler, and the seed and sweep that run while this worker is leader"""
+    global _monitor_thread
+    
+    if db is None:
+        db = get_db()
+    
+    if db is None:
+        print("⚠️ Deadline monitor not started - database unavailable")
+        return
+    
+    if _monitor_thread is not None:
+        return
+    
+    checkout_deadlines.start()
+    active_checkout_registry.add_listener(_on_checkout_change)
+    leader_lease.on_elected(lambda: _seed_deadlines(db))
+    
+    def _monitor():
+        while True:
+            time.sleep(MONITOR_SWEEP_SECONDS)
+            if not leader_lease.is_leader():
+                continue
+            try:
+                monitor_active_checkouts(db)
+                _schedule_upcoming_deadlines(db)
+            except Exception as e:
+                print(f"❌ Leader monitor cycle failed: {type(e).__name__}: {e}")
+    
+    _monitor_thread = threading.Thread(target=_monitor, name='checkout-monitor', daemon=True)
+    _monitor_thread.start()
+    
+    print(f"⏱️ DEADLINE MONITOR STARTED | Sweep every {MONITOR_SWEEP_SECONDS}s on the leader")
+
+
+def _on_checkout_change(operation, checkout):
+    """Keep the scheduler in step with the active checkout registry"""
+    if operation == 'resync':
+        for active in active_checkout_registry.outside():
+            schedule_checkout_deadline(active['roll_no'], active.get('deadline'))
+    elif checkout is None:
+        return
+    elif operation == 'upsert' and checkout.get('status') == 'active':
+        schedule_checkout_deadline(checkout['roll_no'], checkout.get('deadline'))
+    else:
+        cancel_checkout_deadline(checkout['roll_no'])
+
+
+def _active_deadlines(db, until=None):
+    """(roll_no, deadline) of active checkouts, from the registry once it is loaded"""
+    if active_checkout_registry.loaded:
+        checkouts = active_checkout_registry.outside()
+    else:
+        query = {'status': 'active', 'deadline': {'$ne': None}}
+        if until is not None:
+            query['deadline'] = {'$lte': until}
+        checkouts = db.active_checkouts.find(query, {'roll_no': 1, 'deadline': 1})
+
+    for checkout in checkouts:
+        deadline = _to_utc_naive(checkout.get('deadline'))
+        if deadline is not None and (until is None or deadline <= until):
+            yield checkout['roll_no'], checkout['deadline']
+
+
+def _seed_deadlines(db):
+    """Schedule every active checkout; run when this worker becomes leader"""
+    seeded = 0
+    for roll_no, deadline in _active_deadlines(db):
+        checkout_deadlines.schedule(roll_no, deadline)
+        seeded += 1
+    
+    print(f"⏱️ DEADLINES SEEDED | Active checkouts={seeded}")
+
+
+def _schedule_upcoming_deadlines(db):
+    """Schedule checkouts due before the next sweep, including other workers' checkouts"""
+    horizon = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=2 * MONITOR_SWEEP_SECONDS)
+    for roll_no, deadline in _active_deadlines(db, horizon):
+        checkout_deadlines.schedule(roll_no, deadline)
+
+
+def schedule_checkout_deadline(roll_no, deadline):
+    """Check roll_no for a violation when deadline passes"""
+    if deadline is not None:
+        checkout_deadlines.schedule(roll_no, deadline)
+
+
+def cancel_checkout_deadline(roll_no):
+    """The student checked in; no violation check is needed"""
+    checkout_deadlines.cancel(roll_no)
+
+
+def get_violation_monitor_stats():
+    return {
+        'scheduler': checkout_deadlines.stats(),
+        'deadline_checks': _deadline_checks.stats(),
+        'sweeps': _sweep_stats['sweeps'],
+        'last_sweep': _sweep_stats['last_sweep'],
+        'side_effects': _violation_effects.stats()
+    }
+
+
+def check_checkout_deadline(roll_no, db=None):
+    """
+    Called when a scheduled deadline passes. Re-reads the checkout,
+    since it may have been closed or replaced after it was scheduled.
+    """
+    if db is None:
+        db = get_db()
+    
+    if db is None:
+        print(f"⚠️ Deadline check skipped - database unavailable | Roll={roll_no}")
+        return
+    
+    checkout = db.active_checkouts.find_one({'roll_no': roll_no, 'status': 'active'})
+    
+    if checkout is None:
+        return
+    
+    now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+    deadline = checkout.get('deadline')
+    
+    # A newer checkout with a later deadline: wait for that one instead
+    if deadline is not None:
+        deadline_utc = deadline.astimezone(timezone.utc).replace(tzinfo=None) if deadline.tzinfo else deadline
+        if deadline_utc > now_utc:
+            checkout_deadlines.schedule(roll_no, deadline)
+            return
+    
+    _check_single_checkout(checkout, now_utc, db)
+
+
+# Fields the violation path reads from an active checkout.
+VIOLATION_PROJECTION = {
+    '_id': 1,
+    'roll_no': 1,
+    'student_name': 1,
+    'student_hostel': 1,
+    'out_time': 1,
+    'allowed_minutes': 1,
+    'deadline': 1
+}
+
+# Expired checkouts claimed and alerted per round of bulk writes.
+SWEEP_BATCH_SIZE = 500
+
+# Notifications of claimed violations: parallel across students, in order within one.
+VIOLATION_EFFECT_WORKERS = int(os.environ.get('VIOLATION_EFFECT_WORKERS', 8))
+VIOLATION_EFFECT_MAX_PENDING = int(os.environ.get('VIOLATION_EFFECT_MAX_PENDING', 1000))
+# How long a sweep waits for its notifications before reporting them as pending.
+VIOLATION_EFFECT_WAIT_SECONDS = 60
+
+_violation_effects = KeyedExecutor(
+    max_workers=VIOLATION_EFFECT_WORKERS,
+    max_pending=VIOLATION_EFFECT_MAX_PENDING,
+    thread_name_prefix='violation-effects'
+)
+
+_sweep_stats = {
+    'sweeps': 0,
+    'last_sweep': None
+}
+
+
 def monitor_active_checkouts(db=None):
     """
-    Proactively monitor students who are currently outside.
+    Sweep for checkouts whose allowed time has run out.
+    
+    Only active checkouts past their deadline are read, through the
+    (status, deadline) index, so the cost follows the number of
+    violations rather than the number of students outside. For each
+    batch of expired checkouts:
+    1. Claim them as violations with one update_many.
+    2. Create their realtime alerts with one insert_many.
+    3. Store the alert IDs in the checkouts for finalization on check-in.
+    4. Send the FCM and WebSocket notifications in parallel across
+       students, then collect their outcomes.
     
-    If the allowed deadline has passed:
-    1. Mark the checkout as a violation.
-    2. Create a disciplinary record.
-    3. Create a realtime alert.
-    4. Store the IDs in the active checkout for later finalization.
+    Returns:
+        int: Number of violations processed
     """
     if db is None:
         db = get_db()
     
     if db is None:
         print("⚠️ Monitoring skipped - database unavailable")
-        return
+        return 0
+    
+    started = time.perf_counter()
     
     try:
-        print(f"🔄 ACTIVE CHECKOUT MONITOR RUNNING | {get_ist_now()}")
-        
         # Use UTC for database comparison
         now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-        print(f"🕒 MONITOR TIME | UTC={now_utc} | IST={get_ist_now()}")
+        print(f"🔄 ACTIVE CHECKOUT MONITOR RUNNING | UTC={now_utc} | IST={get_ist_now()}")
         
-        # Get all active checkouts
-        active_checkouts = list(db.active_checkouts.find({'status': {'$in': ['active', 'violation']}}))
-        print(f"📊 TOTAL ACTIVE CHECKOUTS: {len(active_checkouts)}")
+        expired = list(db.active_checkouts.find(
+            {
+                'status': 'active',
+                'deadline': {'$lte': now_utc},
+                'alert_sent': False
+            },
+            VIOLATION_PROJECTION
+        ).sort('deadline', 1))
         
-        if not active_checkouts:
-            print("ℹ️ No students currently outside.")
-            return
+        if expired:
+            print(f"📊 EXPIRED CHECKOUTS: {len(expired)}")
+        else:
+            print("ℹ️ No expired checkouts.")
         
-        # Check each active checkout
-        for checkout in active_checkouts:
-            _check_single_checkout(checkout, now_utc, db)
+        processed = 0
+        notifications = []
+        for start in range(0, len(expired), SWEEP_BATCH_SIZE):
+            claimed, futures = _process_violations(expired[start:start + SWEEP_BATCH_SIZE], now_utc, db)
+            processed += claimed
+            notifications.extend(futures)
+        
+        # Collect the notification outcomes once every batch is claimed and stored
+        done, pending = wait(notifications, timeout=VIOLATION_EFFECT_WAIT_SECONDS)
+        outcomes = [future.result() for future in done if future.exception() is None]
+        notify_failed = len(done) - len(outcomes) + sum(
+            1 for outcome in outcomes
+            if outcome['fcm'] == ALERT_FAILED or not outcome['websocket']
+        )
+        notify_skipped = sum(1 for outcome in outcomes if outcome['fcm'] == ALERT_SKIPPED)
+        
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        _record_sweep(
+            now_utc, duration_ms, len(expired), processed,
+            len(done), notify_failed, notify_skipped, len(pending)
+        )
+        
+        if expired:
+            print(
+                f"🚨 VIOLATION SWEEP COMPLETE | Expired={len(expired)} | Processed={processed} | "
+                f"NotifyFailed={notify_failed} | NotifySkipped={notify_skipped} | "
+                f"NotifyPending={len(pending)} | {duration_ms} ms"
+            )
+        return processed
             
     except Exception as e:
         print(f"❌ ERROR IN ACTIVE CHECKOUT MONITORING | {type(e).__name__}: {e}")
+        return 0
+
+
+def _record_sweep(now_utc, duration_ms, expired, processed, notified, notify_failed, notify_skipped,
+                  notify_pending):
+    _sweep_stats['sweeps'] += 1
+    _sweep_stats['last_sweep'] = {
+        'at': now_utc.isoformat(),
+        'duration_ms': duration_ms,
+        'expired': expired,
+        'processed': processed,
+        'notified': notified,
+        'notify_failed': notify_failed,
+        'notify_skipped': notify_skipped,
+        'notify_pending': notify_pending
+    }
+
+
+def _process_violations(checkouts, now_utc, db):
+    """
+    Claim, alert and store a batch of expired checkouts, then queue
+    their notifications. Returns (number claimed, notification futures).
+    """
+    claim_token = uuid.uuid4().hex
+    checkout_ids = [checkout['_id'] for checkout in checkouts]
+    
+    # Claim only those still unalerted; another sweep or the deadline
+    # scheduler may have processed some of them meanwhile.
+    claim_result = db.active_checkouts.update_many(
+        {
+            '_id': {'$in': checkout_ids},
+            'status': 'active',
+            'alert_sent': False
+        },
+        {
+            '$set': {
+                'status': 'violation',
+                'alert_sent': True,
+                'alert_sent_at': now_utc,
+                'updated_at': now_utc,
+                'violation_claim': claim_token
+            }
+        }
+    )
+    
+    if claim_result.modified_count == len(checkout_ids):
+        claimed = checkouts
+    else:
+        claimed_ids = {
+            checkout['_id']
+            for checkout in db.active_checkouts.find(
+                {'_id': {'$in': checkout_ids}, 'violation_claim': claim_token},
+                {'_id': 1}
+            )
+        }
+        claimed = [checkout for checkout in checkouts if checkout['_id'] in claimed_ids]
+    
+    violations = []
+    for checkout in claimed:
+        violation = _violation_details(checkout, now_utc)
+        if violation is not None:
+            violations.append((checkout, violation))
+    
+    if not violations:
+        return len(claimed), []
+    
+    alert_result = db.realtime_alerts.insert_many(
+        [_build_violation_alert(checkout, violation, now_utc) for checkout, violation in violations],
+        ordered=False
+    )
+    
+    alert_ids = alert_result.inserted_ids
+    
+    db.active_checkouts.bulk_write([
+        UpdateOne(
+            {'_id': checkout['_id']},
+            {'$set': {
+                'updated_at': now_utc,
+                'alert_id': alert_id,
+                'proactive_exceeded_minutes': violation['exceeded_minutes']
+            }}
+        )
+        for (checkout, violation), alert_id in zip(violations, alert_ids)
+    ], ordered=False)
+    
+    print(f"💾 STORED ALERTS IN ACTIVE CHECKOUTS | Count={len(violations)}")
+    
+    futures = [
+        _dispatch_violation(checkout, violation, alert_id, now_utc)
+        for (checkout, violation), alert_id in zip(violations, alert_ids)
+    ]
+    
+    return len(claimed), futures
+
+
+def _to_utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _violation_details(checkout, now_utc):
+    """Out time and minutes exceeded for a claimed violation, or None without an out_time"""
+    roll_no = checkout.get('roll_no')
+    out_time = checkout.get('out_time')
+    allowed_minutes = float(checkout.get('allowed_minutes', 480))
+    
+    if out_time is None:
+        print(f"⚠️ No out_time found for {roll_no}. Skipping disciplinary calculation.")
+        return None
+    
+    out_time_utc = _to_utc_naive(out_time)
+    
+    actual_minutes = (now_utc - out_time_utc).total_seconds() / 60
+    exceeded_minutes = max(0, round(actual_minutes - allowed_minutes, 2))
+    
+    print(f"⏰ TIME VIOLATION | Roll={roll_no} | Exceeded={exceeded_minutes} min")
+    
+    return {
+        'out_time_utc': out_time_utc,
+        'allowed_minutes': allowed_minutes,
+        'exceeded_minutes': exceeded_minutes
+    }
 
 
 def _check_single_checkout(checkout, now_utc, db):
@@ -122,18 +540,13 @@ def _check_single_checkout(checkout, now_utc, db):
         )
         return
     deadline = checkout.get('deadline')
-    out_time = checkout.get('out_time')
-    allowed_minutes = float(checkout.get('allowed_minutes', 480))
     
     if deadline is None:
         print(f"⚠️ No deadline found for {roll_no}. Skipping.")
         return
     
     # Normalize deadline for comparison
-    if deadline.tzinfo is not None:
-        deadline_utc = deadline.astimezone(timezone.utc).replace(tzinfo=None)
-    else:
-        deadline_utc = deadline
+    deadline_utc = _to_utc_naive(deadline)
     
     # Check if deadline has passed
     if now_utc < deadline_utc:
@@ -167,37 +580,69 @@ def _check_single_checkout(checkout, now_utc, db):
         print(f"⚠️ Violation already processed for {roll_no}. Skipping.")
         return
     
-    # Calculate exceeded time
-    if out_time is None:
-        print(f"⚠️ No out_time found for {roll_no}. Skipping disciplinary calculation.")
+    violation = _violation_details(checkout, now_utc)
+    if violation is None:
         return
     
-    # Normalize out_time
-    if out_time.tzinfo is not None:
-        out_time_utc = out_time.astimezone(timezone.utc).replace(tzinfo=None)
-    else:
-        out_time_utc = out_time
-    
-    actual_minutes = (now_utc - out_time_utc).total_seconds() / 60
-    exceeded_minutes = max(0, round(actual_minutes - allowed_minutes, 2))
-    
-    print(f"⏰ TIME VIOLATION | Roll={roll_no} | Exceeded={exceeded_minutes} min")
-    
-
-    
     # ============================================================
     # CREATE REALTIME ALERT WITH ID
     # ============================================================
-    alert_id = _create_violation_alert(
-        roll_no, checkout, out_time_utc, allowed_minutes, 
-        exceeded_minutes, now_utc, db
+    alert_id = _create_violation_alert(checkout, violation, now_utc, db)
+
+    # ============================================================
+    # STORE ALERT ID + PROACTIVE EXCEEDED TIME
+    # IMPORTANT:
+    # Do NOT create/store a disciplinary record here.
+    # The disciplinary record is created/finalized on CHECK-IN,
+    # using the complete OUT -> IN duration.
+    # ============================================================
+    if alert_id:
+        update_data = {
+            'updated_at': now_utc,
+            'alert_id': alert_id,
+            'proactive_exceeded_minutes': violation['exceeded_minutes']
+        }
+
+        db.active_checkouts.update_one(
+            {'_id': checkout['_id']},
+            {'$set': update_data}
+        )
+
+        print(
+            f"💾 STORED ALERT IN ACTIVE CHECKOUT | "
+            f"Roll={roll_no} | "
+            f"AlertID={alert_id} | "
+            f"ProactiveExceeded={violation['exceeded_minutes']:.2f}"
+        )
+
+    # Notifications run on the side-effect pool; the caller does not wait
+    _dispatch_violation(checkout, violation, alert_id, now_utc)
+    
+    print(f"🚨 PROACTIVE VIOLATION COMPLETE | Student={roll_no} | Exceeded={violation['exceeded_minutes']} min")
+
+
+def _dispatch_violation(checkout, violation, alert_id, now_utc):
+    """Queue the notifications of a claimed violation behind earlier ones of its student"""
+    return _violation_effects.submit(
+        checkout.get('roll_no'),
+        _notify_violation, checkout, violation, alert_id, now_utc
     )
 
+
+def _notify_violation(checkout, violation, alert_id, now_utc):
+    """
+    Hostel FCM notification and WebSocket alert for a claimed violation.
+    Returns {'fcm': ALERT_SENT, ALERT_SKIPPED or ALERT_FAILED, 'websocket': bool}.
+    """
+    roll_no = checkout.get('roll_no')
+    exceeded_minutes = violation['exceeded_minutes']
+    outcome = {'fcm': ALERT_FAILED, 'websocket': False}
+
     # ============================================================
     # SEND HOSTEL-SPECIFIC FCM NOTIFICATION
     # ============================================================
     try:
-        send_hostel_alert(
+        outcome['fcm'] = send_hostel_alert(
             hostel=checkout.get('student_hostel'),
             roll_no=roll_no,
             student_name=checkout.get('student_name', 'Unknown'),
@@ -222,8 +667,8 @@ def _check_single_checkout(checkout, now_utc, db):
             'hostel': str(
                 checkout.get('student_hostel', 'Unknown')
             ),
-            'out_time': out_time_utc.isoformat(),
-            'allowed_minutes': allowed_minutes,
+            'out_time': violation['out_time_utc'].isoformat(),
+            'allowed_minutes': violation['allowed_minutes'],
             'deadline': (
                 checkout.get('deadline').isoformat()
                 if checkout.get('deadline')
@@ -234,62 +679,31 @@ def _check_single_checkout(checkout, now_utc, db):
             'priority': 'high',
             'timestamp': now_utc.isoformat(),
         })
+        outcome['websocket'] = True
     except Exception as e:
         print(
             f"❌ WebSocket notification failed for {roll_no}: "
             f"{type(e).__name__}: {e}"
         )
 
-
-    # ============================================================
-    # STORE ALERT ID + PROACTIVE EXCEEDED TIME
-    # IMPORTANT:
-    # Do NOT create/store a disciplinary record here.
-    # The disciplinary record is created/finalized on CHECK-IN,
-    # using the complete OUT -> IN duration.
-    # ============================================================
-    if alert_id:
-        update_data = {
-            'updated_at': now_utc,
-            'alert_id': alert_id,
-            'proactive_exceeded_minutes': exceeded_minutes
-        }
-
-        db.active_checkouts.update_one(
-            {'_id': checkout['_id']},
-            {'$set': update_data}
-        )
-
-        print(
-            f"💾 STORED ALERT IN ACTIVE CHECKOUT | "
-            f"Roll={roll_no} | "
-            f"AlertID={alert_id} | "
-            f"ProactiveExceeded={exceeded_minutes:.2f}"
-        )
-    
-    print(f"🚨 PROACTIVE VIOLATION COMPLETE | Student={roll_no} | Exceeded={exceeded_minutes} min")
-
+    return outcome
 
 
-
-def _create_violation_alert(roll_no, checkout, out_time_utc, allowed_minutes, 
-                            exceeded_minutes, now_utc, db):
-    """
-    Create a realtime alert for time violation.
-    Returns the ObjectId of the created alert.
-    """
-    alert_message = {
+def _build_violation_alert(checkout, violation, now_utc):
+    """Realtime alert document for a time violation"""
+    roll_no = checkout.get('roll_no')
+    return {
         'type': 'allowed_time_violation',
         'message': f'🚨 Student {roll_no} exceeded allowed time outside',
         'details': {
             'roll_no': roll_no,
             'student_name': checkout.get('student_name', 'Unknown'),
             'student_hostel': checkout.get('student_hostel', 'Unknown'),
-            'out_time': out_time_utc,
-            'allowed_minutes': allowed_minutes,
+            'out_time': violation['out_time_utc'],
+            'allowed_minutes': violation['allowed_minutes'],
             'deadline': checkout.get('deadline'),
-            'exceeded_minutes': exceeded_minutes,
-            'proactive_exceeded_minutes': exceeded_minutes,
+            'exceeded_minutes': violation['exceeded_minutes'],
+            'proactive_exceeded_minutes': violation['exceeded_minutes'],
             'final_exceeded_minutes': None,  # Will be updated on check-in
             'actual_duration_minutes': None,  # Will be updated on check-in
             'violation_status': 'pending_confirmation',
@@ -301,13 +715,21 @@ def _create_violation_alert(roll_no, checkout, out_time_utc, allowed_minutes,
         'proactive_monitoring': True,
         'finalized_at': None
     }
-    
-    result = db.realtime_alerts.insert_one(alert_message)
+
+
+def _create_violation_alert(checkout, violation, now_utc, db):
+    """
+    Create a realtime alert for time violation.
+    Returns the ObjectId of the created alert.
+    """
+    result = db.realtime_alerts.insert_one(
+        _build_violation_alert(checkout, violation, now_utc)
+    )
     alert_id = result.inserted_id
     
     print(
         f"🔔 REALTIME ALERT CREATED | "
-        f"Roll={roll_no} | "
+        f"Roll={checkout.get('roll_no')} | "
         f"AlertID={alert_id}"
     )
     
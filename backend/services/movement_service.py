@@ -13,50 +13,151 @@ import uuid
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.time_utils import INDIA_TZ,get_ist_now, normalize_datetime_to_ist, calculate_duration_minutes
 from utils.db_utils import get_db
+from utils.lru_cache import LRUCache
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 # Import monitoring service for active checkout
-from services.monitoring_service import create_active_checkout
+from services.monitoring_service import (
+    build_active_checkout_document,
+    schedule_checkout_deadline,
+    cancel_checkout_deadline
+)
 from services.websocket_service import emit_movement_update
+from services.student_directory import get_student
+from services.outbox_service import new_effect, dispatch_effects, register_effect_handler
+
+# Recently processed OUT and IN event IDs, keyed by (action, event_id).
+# Offline devices replay scans after reconnecting; a hit answers the
+# replay without a database round trip.
+_recent_events = LRUCache(
+    capacity=int(os.environ.get('EVENT_ID_CACHE_SIZE', 50000))
+)
+
+# Cleared at startup when the unique (in_event_id, roll_no) index
+# cannot be built; check-ins then look for a replay before claiming.
+_in_event_index_ready = True
+
+ACTIVE_STATUSES = ['active', 'violation']
+
+CONCURRENT_CHANGE_RESPONSE = (
+    {'message': 'Student movement changed during scan. Please scan again.'},
+    409
+)
 
 
 def process_security_scan(user_role, data, db=None):
     """
     Process a security scan (check-in or check-out)
-    
+
     Args:
         user_role: The role of the user performing the scan (e.g., 'security_a')
         data: Request data containing roll_no, action, etc.
         db: Database connection (optional, will get from utils if None)
-    
+
     Returns:
         tuple: (response_data, status_code)
     """
     if db is None:
         db = get_db()
-    
+
     # Extract data
     roll_no = data.get('roll_no')
     action = data.get('action')  # 'in' or 'out'
     event_id = data.get('event_id') or str(uuid.uuid4())
     is_offline_sync = data.get('offline_sync', False)
     original_timestamp = data.get('original_timestamp')
-    
+
     # Get user's hostel from role
-    user_hostel = user_role.split('_')[1].upper() if '_' in user_role else 'ALL'
-    
+    user_hostel = get_user_hostel(user_role)
+
     # Validate required fields
+    invalid = _validate_scan_fields(roll_no, action)
+    if invalid is not None:
+        return invalid
+
+    invalid = _validate_scan_time(is_offline_sync, original_timestamp)
+    if invalid is not None:
+        return invalid
+
+    # Replayed offline scans short-circuit before touching Mongo
+    if data.get('event_id'):
+        cached_response = _cached_replay(roll_no, action, event_id, user_role, user_hostel)
+        if cached_response is not None:
+            return cached_response
+
+    # Get student from the in-process directory
+    student = get_student(roll_no, db)
+
+    denied = _check_student_access(student, action, user_role, user_hostel)
+    if denied is not None:
+        return denied
+
+    # Determine current time (handle offline sync)
+    now = resolve_scan_time(is_offline_sync, original_timestamp)
+
+    # Process based on action
+    if action == 'out':
+        response_data, status_code = _process_check_out(student, roll_no, now, user_role, is_offline_sync,event_id, db)
+    else:
+        response_data, status_code = _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id, db)
+
+    if status_code == 200:
+        _remember_event(action, event_id, roll_no, student.get('hostel'), response_data)
+
+    return response_data, status_code
+
+
+def get_user_hostel(user_role):
+    """Hostel letter of a hostel-specific role, or 'ALL'"""
+    return user_role.split('_')[1].upper() if '_' in user_role else 'ALL'
+
+
+def resolve_scan_time(is_offline_sync, original_timestamp):
+    """Scan time in IST; offline scans keep their original device timestamp"""
+    if is_offline_sync and original_timestamp:
+        # Convert UTC timestamp to IST
+        utc_time = datetime.fromtimestamp(original_timestamp / 1000, tz=timezone.utc)
+        return utc_time.astimezone(INDIA_TZ)
+    return get_ist_now()
+
+
+def _validate_scan_fields(roll_no, action):
     if not roll_no:
         return {'message': 'Roll number is required'}, 400
-    
+
+    if not isinstance(roll_no, str):
+        return {'message': 'Invalid roll number'}, 400
+
     if action not in ['in', 'out']:
         return {'message': 'Invalid action. Must be "in" or "out"'}, 400
-    
-    # Get student from database
-    student = db.students.find_one({'roll_no': roll_no})
-    
+
+    return None
+
+
+def _validate_scan_time(is_offline_sync, original_timestamp):
+    """Reject an offline timestamp that is not epoch milliseconds"""
+    if not (is_offline_sync and original_timestamp):
+        return None
+
+    invalid = {'message': 'Invalid original_timestamp. Must be milliseconds since the epoch'}, 400
+
+    if isinstance(original_timestamp, bool) or not isinstance(original_timestamp, (int, float)):
+        return invalid
+
+    try:
+        resolve_scan_time(is_offline_sync, original_timestamp)
+    except (OverflowError, OSError, ValueError):
+        return invalid
+
+    return None
+
+
+def _check_student_access(student, action, user_role, user_hostel):
     if not student:
         return {'message': 'Student not found'}, 404
-    
+
     # Check hostel access for IN scans (OUT scans allowed from any hostel)
     if action == 'in' and '_' in user_role and student.get('hostel') != user_hostel:
         return {
@@ -65,79 +166,116 @@ def process_security_scan(user_role, data, db=None):
             'user_hostel': user_hostel,
             'access_denied': True
         }, 403
-    
-    # Determine current time (handle offline sync)
-    if is_offline_sync and original_timestamp:
-        # Convert UTC timestamp to IST
-        utc_time = datetime.fromtimestamp(original_timestamp / 1000, tz=timezone.utc)
-        now = utc_time.astimezone(INDIA_TZ)
-    else:
-        now = get_ist_now()
-    
-    # Process based on action
-    if action == 'out':
-        return _process_check_out(student, roll_no, now, user_role, is_offline_sync,event_id, db)
-    elif action == 'in':
-        return _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id, db)
-    
-    return {'message': 'Invalid action'}, 400
 
+    return None
 
-def _process_check_out(student, roll_no, now, user_role, is_offline_sync,event_id, db):
-    """Process a check-out operation using movement_records."""
 
-    # Idempotency check
-    existing_event = db.movement_records.find_one({
-        'event_id': event_id
+def _cached_replay(roll_no, action, event_id, user_role, user_hostel):
+    """
+    Answer a replayed scan from the recent event cache.
+
+    Returns None when the event is unknown, belongs to another student,
+    or would be rejected by the hostel check; the normal path then
+    produces the response.
+    """
+    entry = _recent_events.get((action, event_id))
+
+    if entry is None or entry['roll_no'] != roll_no:
+        return None
+
+    if action == 'in' and '_' in user_role and entry['hostel'] != user_hostel:
+        return None
+
+    response_data = dict(entry['response'])
+    response_data.update({
+        'success': True,
+        'message': (
+            'Check out already recorded'
+            if action == 'out'
+            else 'Check in already recorded'
+        ),
+        'already_processed': True
     })
-    if existing_event:
-        if existing_event.get('roll_no') != roll_no:
-            return {
-                'success': False,
-                'message': 'Event ID already belongs to another student'
-            }, 409
-
-        if existing_event.get('action') == 'out':
-            return {
-                'success': True,
-                'message': 'Check out already recorded',
-                'student_name': student.get('name', 'Unknown'),
-                'roll_no': roll_no,
-                'time': (
-                    existing_event.get('out_time').strftime(
-                        '%Y-%m-%d %H:%M:%S'
-                    )
-                    if existing_event.get('out_time')
-                    else None
-                ),
-                'action': 'out',
-                'event_id': event_id,
-                'offline_sync': existing_event.get(
-                    'offline_sync', False
-                ),
-                'already_processed': True
-            }, 200
-            
-    # Check whether the student already has an active checkout.
-    active_checkout = db.active_checkouts.find_one({
+
+    return response_data, 200
+
+
+def _remember_event(action, event_id, roll_no, hostel, response_data):
+    """Cache a committed (or already recorded) scan for replay short-circuits"""
+    _recent_events.put((action, event_id), {
         'roll_no': roll_no,
-        'status': {'$in': ['active', 'violation']}
+        'hostel': hostel,
+        'response': dict(response_data)
     })
 
-    if active_checkout:
-        existing_out_time = active_checkout.get('out_time')
 
-        return {
-            'message': 'Student is already checked out',
-            'out_time': (
-                existing_out_time.strftime('%Y-%m-%d %H:%M:%S')
-                if existing_out_time
-                else None
-            )
-        }, 400
+def get_event_cache_stats():
+    """Hit-rate counters of the recent event cache"""
+    return _recent_events.stats()
+
+
+# ============================================================
+# CHECK-OUT
+# ============================================================
+
+def _process_check_out(student, roll_no, now, user_role, is_offline_sync,event_id, db):
+    """
+    Process a check-out operation using movement_records.
+
+    The happy path costs two round trips. The unique roll_no index on
+    active_checkouts and the unique event_id index on movement_records
+    do the duplicate detection, so nothing is read before writing.
+    Replays and rejected scans pay one extra lookup to build the
+    same response the sequential checks used to return.
+    """
+
+    # Side effects run from the outbox after the response is sent.
+    effects = [
+        new_effect('movement_update', _movement_payload(
+            student, roll_no, 'out', now, user_role, event_id
+        ))
+    ]
+
+    movement_record = _build_out_movement_record(
+        roll_no, now, user_role, is_offline_sync, event_id, effects
+    )
+
+    active_checkout = build_active_checkout_document(
+        roll_no=roll_no,
+        student=student,
+        out_time=now,
+        user_role=user_role,
+        offline_sync=is_offline_sync,
+        movement_id=event_id
+    )
+
+    # Round trip 1: record the movement.
+    # The unique event_id index rejects replayed events before any
+    # active checkout exists that an IN scan could claim.
+    try:
+        db.movement_records.insert_one(movement_record)
+    except DuplicateKeyError:
+        return _replayed_check_out(student, roll_no, event_id, db)
+
+    # Round trip 2: claim the student's active checkout slot.
+    # The unique roll_no index rejects a second concurrent checkout.
+    try:
+        db.active_checkouts.insert_one(active_checkout)
+    except DuplicateKeyError:
+        # No checkout points at this movement, so nothing else can have used it.
+        db.movement_records.delete_one({'_id': movement_record['_id']})
+        return _rejected_check_out(student, roll_no, event_id, db)
+
+    schedule_checkout_deadline(roll_no, active_checkout['deadline'])
+
+    dispatch_effects(event_id, effects, db)
 
-    # Create movement record.
-    movement_record = {
+    return _check_out_response(student, roll_no, now, event_id, is_offline_sync)
+
+
+def _build_out_movement_record(roll_no, now, user_role, is_offline_sync, event_id, effects):
+    """Movement record for a new check-out, carrying its outbox entries"""
+    return {
         'event_id': event_id,
         'roll_no': roll_no,
         'action': 'out',
@@ -148,134 +286,246 @@ def _process_check_out(student, roll_no, now, user_role, is_offline_sync,event_i
         'status': 'outside',
         'offline_sync': is_offline_sync,
         'created_at': now,
-        'updated_at': now
+        'updated_at': now,
+        'pending_effects': effects
     }
 
-    # Insert into the new collection.
-    result = db.movement_records.insert_one(movement_record)
-
-    # Create active checkout for proactive monitoring.
-    create_active_checkout(
-        roll_no=roll_no,
-        student=student,
-        out_time=now,
-        user_role=user_role,
-        offline_sync=is_offline_sync,
-        movement_id=event_id,
-        db=db
-    )
 
-    emit_movement_update({
-        'type': 'student_movement_updated',
-        'roll_no': roll_no,
+def _check_out_response(student, roll_no, now, event_id, is_offline_sync):
+    return {
+        'message': 'Check out recorded successfully',
         'student_name': student.get('name', 'Unknown'),
-        'hostel': student.get('hostel'),
+        'roll_no': roll_no,
+        'time': now.strftime('%Y-%m-%d %H:%M:%S'),
         'action': 'out',
-        'time': now.isoformat(),
-        'recorded_by': user_role,
         'event_id': event_id,
-    })
+        'offline_sync': is_offline_sync
+    }, 200
 
-    print(
-        f"OUT MOVEMENT CREATED | "
-        f"Roll={roll_no} | "
-        f"EventID={event_id} | "
-        f"Time={now}"
+
+def _already_checked_out_response(existing_out_time):
+    return {
+        'message': 'Student is already checked out',
+        'out_time': (
+            existing_out_time.strftime('%Y-%m-%d %H:%M:%S')
+            if existing_out_time
+            else None
+        )
+    }, 400
+
+
+def _rejected_check_out(student, roll_no, event_id, db):
+    """
+    Build the response for a check-out whose active checkout slot
+    is already taken by this student.
+    """
+    existing_checkout = db.active_checkouts.find_one(
+        {'roll_no': roll_no},
+        {'movement_id': 1, 'out_time': 1}
     )
 
+    if existing_checkout is None:
+        # The student checked in between our insert and this lookup.
+        return CONCURRENT_CHANGE_RESPONSE
+
+    if existing_checkout.get('movement_id') == event_id:
+        # Replay of the checkout that is still open.
+        return _replayed_check_out(student, roll_no, event_id, db)
+
+    # The event ID may already be recorded, for this or another student.
+    existing_event = db.movement_records.find_one({
+        'event_id': event_id
+    })
+
+    if existing_event is not None:
+        return _check_out_replay_response(student, roll_no, event_id, existing_event)
+
+    return _already_checked_out_response(existing_checkout.get('out_time'))
+
+
+def _replayed_check_out(student, roll_no, event_id, db):
+    """Build the idempotent response for an already recorded OUT event."""
+    existing_event = db.movement_records.find_one({
+        'event_id': event_id
+    })
+
+    if existing_event is None:
+        return CONCURRENT_CHANGE_RESPONSE
+
+    return _check_out_replay_response(student, roll_no, event_id, existing_event)
+
+
+def _check_out_replay_response(student, roll_no, event_id, existing_event):
+    """Response for an OUT event that is already stored in movement_records."""
+    if existing_event.get('roll_no') != roll_no:
+        return {
+            'success': False,
+            'message': 'Event ID already belongs to another student'
+        }, 409
+
     return {
-        'message': 'Check out recorded successfully',
+        'success': True,
+        'message': 'Check out already recorded',
         'student_name': student.get('name', 'Unknown'),
         'roll_no': roll_no,
-        'time': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'time': (
+            existing_event.get('out_time').strftime(
+                '%Y-%m-%d %H:%M:%S'
+            )
+            if existing_event.get('out_time')
+            else None
+        ),
         'action': 'out',
         'event_id': event_id,
-        'offline_sync': is_offline_sync
+        'offline_sync': existing_event.get(
+            'offline_sync', False
+        ),
+        'already_processed': True
     }, 200
 
 
+# ============================================================
+# CHECK-IN
+# ============================================================
 
 def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id, db):
-    """Process a check-in operation using movement_records."""
+    """
+    Process a check-in operation using movement_records.
+
+    The active checkout is claimed and removed in one atomic
+    find_one_and_delete, and the movement record is closed with a
+    single conditional update. A check-in within the allowed time
+    costs two round trips; a violated check-in adds one write to the
+    student's disciplinary record. The realtime alert finalization is
+    deferred off the response path.
+
+    Any early exit after the claim puts the active checkout back,
+    so a rejected scan leaves the student outside as before, unless
+    another gate's check-in has closed the movement meanwhile.
+    """
 
-    # Idempotency check:
-    # If this exact IN event was already processed,
-    # return the original successful result.
-    existing_in_event = db.movement_records.find_one({
-        'in_event_id': event_id,
-        'roll_no': roll_no
-    })
+    if not _in_event_index_ready:
+        # Without the index a replay would close the student's next
+        # movement, so look for the IN event first.
+        replay = _replayed_check_in(student, roll_no, event_id, db)
+        if replay is not None:
+            return replay
 
-    if existing_in_event:
-        return {
-            'success': True,
-            'message': 'Check in already recorded',
-            'student_name': student.get('name', 'Unknown'),
-            'roll_no': roll_no,
-            'time': (
-                existing_in_event.get('in_time').isoformat()
-                if existing_in_event.get('in_time')
-                else None
-            ),
-            'action': 'in',
-            'event_id': event_id,
-            'movement_id': existing_in_event.get('event_id'),
-            'time_spent_minutes': existing_in_event.get(
-                'time_spent_minutes', 0
-            ),
-            'offline_sync': existing_in_event.get(
-                'offline_sync', False
-            ),
-            'already_processed': True
-        }, 200
-
-    # Find the active checkout.
-    active_checkout = db.active_checkouts.find_one({
+    # Round trip 1: claim and remove the active checkout.
+    active_checkout = db.active_checkouts.find_one_and_delete({
         'roll_no': roll_no,
-        'status': {'$in': ['active', 'violation']}
+        'status': {'$in': ACTIVE_STATUSES}
     })
 
     if active_checkout is None:
+        # Idempotency check:
+        # If this exact IN event was already processed,
+        # return the original successful result.
+        replay = _replayed_check_in(student, roll_no, event_id, db)
+        if replay is not None:
+            return replay
+
         return {'message': 'No active check out record found'}, 400
 
+    cancel_checkout_deadline(roll_no)
+
+    plan, rejection = _plan_check_in(
+        student, roll_no, now, user_role, is_offline_sync, event_id, active_checkout
+    )
+
+    if rejection is not None:
+        _restore_active_checkout(active_checkout, db)
+        return rejection
+
+    movement_id = plan['movement_id']
+
+    # Round trip 2: close the movement record and commit its outbox.
+    # The unique (in_event_id, roll_no) index rejects a replayed IN
+    # event even when the student has since gone out again.
+    try:
+        update_result = db.movement_records.update_one(
+            {
+                'event_id': movement_id,
+                'roll_no': roll_no,
+                'in_time': None
+            },
+            {
+                '$set': plan['movement_fields'],
+                '$push': {
+                    'pending_effects': {'$each': plan['effects']}
+                }
+            }
+        )
+    except DuplicateKeyError:
+        _restore_active_checkout(active_checkout, db)
+        replay = _replayed_check_in(student, roll_no, event_id, db)
+        if replay is not None:
+            return replay
+        return CONCURRENT_CHANGE_RESPONSE
+
+    if update_result.modified_count != 1:
+        print(
+            f"Failed to update movement record for {roll_no}"
+        )
+
+        # Find out why, to keep the original error responses.
+        movement_record = db.movement_records.find_one(
+            {'event_id': movement_id, 'roll_no': roll_no},
+            {'in_time': 1}
+        )
+
+        # A movement closed by another gate's check-in means the
+        # student is inside; only an open one gets its checkout back.
+        if movement_record is None or movement_record.get('in_time') is None:
+            _restore_active_checkout(active_checkout, db)
+
+        return _movement_close_rejection(movement_record)
+
+    # Round trip 3 (violations only): the disciplinary record.
+    if plan['disciplinary_update'] is not None:
+        db.students.update_one(*plan['disciplinary_update'])
+
+    dispatch_effects(movement_id, plan['effects'], db)
+
+    return plan['response']
+
+
+def set_in_event_index_ready(ready):
+    """Record whether the unique (in_event_id, roll_no) index exists"""
+    global _in_event_index_ready
+    _in_event_index_ready = ready
+
+
+def _plan_check_in(student, roll_no, now, user_role, is_offline_sync, event_id, active_checkout):
+    """
+    Work out everything a check-in writes, without touching the database.
+
+    Shared by the single-scan path and the bulk engine.
+
+    Returns:
+        tuple: (plan, rejection) - exactly one of them is None
+    """
     # Get movement ID associated with this checkout.
     movement_id = active_checkout.get('movement_id')
 
     if not movement_id:
-        return {
+        return None, ({
             'message': 'Active checkout is missing movement ID'
-        }, 500
-
-    # Find the corresponding movement record.
-    movement_record = db.movement_records.find_one({
-        'event_id': movement_id,
-        'roll_no': roll_no
-    })
-
-    if movement_record is None:
-        return {
-            'message': 'Movement record not found'
-        }, 500
-
-    # Make sure this movement is actually still outside.
-    if movement_record.get('in_time') is not None:
-        return {
-            'message': 'Movement record is already checked in'
-        }, 400
+        }, 500)
 
     # Normalize OUT time.
-    raw_out_time = movement_record.get('out_time')
+    raw_out_time = active_checkout.get('out_time')
 
     if raw_out_time is None:
-        return {
+        return None, ({
             'message': 'Invalid movement record: out_time is missing'
-        }, 500
+        }, 500)
 
     try:
         out_time = normalize_datetime_to_ist(raw_out_time)
     except Exception as e:
         print(f"Error normalizing OUT time: {e}")
-        return {'message': 'Invalid OUT timestamp'}, 500
+        return None, ({'message': 'Invalid OUT timestamp'}, 500)
 
     # Calculate duration.
     time_spent_minutes = calculate_duration_minutes(
@@ -300,42 +550,14 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
         )
 
         if time_spent_minutes < 0:
-            return {
+            return None, ({
                 'success': False,
                 'message': 'Invalid scan time: IN time is earlier than OUT time.',
                 'out_time': out_time.isoformat(),
                 'in_time': now.isoformat(),
                 'time_spent_minutes': round(time_spent_minutes, 2),
                 'offline_sync': is_offline_sync
-            }, 400
-
-    # Update movement record.
-    update_result = db.movement_records.update_one(
-        {
-            'event_id': movement_id,
-            'roll_no': roll_no,
-            'in_time': None
-        },
-        {
-            '$set': {
-                'in_time': now,
-                'in_event_id': event_id,
-                'time_spent_minutes': round(time_spent_minutes, 4),
-                'action': 'in',
-                'status': 'inside',
-                'offline_sync': is_offline_sync,
-                'updated_at': now
-            }
-        }
-    )
-
-    if update_result.modified_count != 1:
-        print(
-            f"Failed to update movement record for {roll_no}"
-        )
-        return {
-            'message': 'Failed to update check-in record'
-        }, 500
+            }, 400)
 
     # Get allowed time.
     max_allowed_time = float(
@@ -347,9 +569,32 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
         2
     )
 
+    proactive_exceeded = active_checkout.get(
+        'proactive_exceeded_minutes',
+        0
+    )
+
+    # Side effects run from the outbox after the response is sent.
+    effects = [
+        new_effect('movement_update', _movement_payload(
+            student, roll_no, 'in', now, user_role, movement_id,
+            time_spent_minutes=round(time_spent_minutes, 2)
+        ))
+    ]
+
+    if active_checkout.get('status') == 'violation' and active_checkout.get('alert_id'):
+        effects.append(new_effect('violation_alert_finalize', {
+            'alert_id': active_checkout.get('alert_id'),
+            'in_time': now,
+            'time_spent_minutes': time_spent_minutes,
+            'final_exceeded_minutes': final_exceeded_minutes,
+            'proactive_exceeded_minutes': proactive_exceeded
+        }))
+
     # ============================================================
     # FINALIZE EXISTING PROACTIVE VIOLATION
     # ============================================================
+    disciplinary_update = None
 
     if active_checkout.get('status') == 'violation':
 
@@ -357,13 +602,6 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
             'disciplinary_record_id'
         )
 
-        alert_id = active_checkout.get('alert_id')
-
-        proactive_exceeded = active_checkout.get(
-            'proactive_exceeded_minutes',
-            0
-        )
-
         print(
             f"PROACTIVE VIOLATION FOUND | "
             f"Roll={roll_no} | "
@@ -372,53 +610,16 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
         )
 
         if disciplinary_record_id:
-
-            from bson import ObjectId
-
-            if isinstance(disciplinary_record_id, str):
-                disciplinary_record_id = ObjectId(
-                    disciplinary_record_id
-                )
-
-            final_note = (
-                f"Proactive detection: "
-                f"{proactive_exceeded:.2f} min exceeded. "
-                f"Final: "
-                f"{final_exceeded_minutes:.2f} min exceeded. "
-                f"Actual duration: "
-                f"{time_spent_minutes:.2f} min."
-            )
-
-            db.students.update_one(
-                {
-                    'roll_no': roll_no,
-                    'disciplinary_records._id':
-                        disciplinary_record_id
-                },
-                {
-                    '$set': {
-                        'disciplinary_records.$.actual_duration_minutes':
-                            round(time_spent_minutes, 4),
-                        'disciplinary_records.$.final_exceeded_minutes':
-                            final_exceeded_minutes,
-                        'disciplinary_records.$.time_exceeded_minutes':
-                            final_exceeded_minutes,
-                        'disciplinary_records.$.violation_status':
-                            'confirmed',
-                        'disciplinary_records.$.in_time':
-                            now,
-                        'disciplinary_records.$.finalized_at':
-                            now,
-                        'disciplinary_records.$.proactive_exceeded_minutes':
-                            proactive_exceeded,
-                        'disciplinary_records.$.final_note':
-                            final_note
-                    }
-                }
+            disciplinary_update = _disciplinary_finalize_update(
+                roll_no,
+                disciplinary_record_id,
+                now,
+                time_spent_minutes,
+                final_exceeded_minutes,
+                proactive_exceeded
             )
-
         else:
-            _create_fallback_disciplinary_record(
+            disciplinary_update = _fallback_disciplinary_update(
                 roll_no,
                 out_time,
                 now,
@@ -426,53 +627,10 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
                 time_spent_minutes,
                 final_exceeded_minutes,
                 user_role,
-                is_offline_sync,
-                db
+                is_offline_sync
             )
 
-        if alert_id:
-
-            from bson import ObjectId
-
-            if isinstance(alert_id, str):
-                alert_id = ObjectId(alert_id)
-
-            db.realtime_alerts.update_one(
-                {'_id': alert_id},
-                {
-                    '$set': {
-                        'details.actual_duration_minutes':
-                            round(time_spent_minutes, 4),
-                        'details.final_exceeded_minutes':
-                            final_exceeded_minutes,
-                        'details.violation_status':
-                            'confirmed',
-                        'details.in_time':
-                            now,
-                        'details.proactive_exceeded_minutes':
-                            proactive_exceeded,
-                        'finalized_at':
-                            now,
-                        'final_note':
-                            (
-                                f"Proactive: "
-                                f"{proactive_exceeded:.2f} min. "
-                                f"Final: "
-                                f"{final_exceeded_minutes:.2f} min."
-                            )
-                    }
-                }
-            )
-
-    elif final_exceeded_minutes <= 0:
-
-        print(
-            f"CHECK-IN WITHIN ALLOWED TIME | "
-            f"Roll={roll_no} | "
-            f"Duration={time_spent_minutes:.2f} min"
-        )
-
-    else:
+    elif final_exceeded_minutes > 0:
 
         print(
             f"FALLBACK VIOLATION | "
@@ -480,7 +638,7 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
             f"Exceeded={final_exceeded_minutes:.2f} min"
         )
 
-        _create_fallback_disciplinary_record(
+        disciplinary_update = _fallback_disciplinary_update(
             roll_no,
             out_time,
             now,
@@ -488,31 +646,9 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
             time_spent_minutes,
             final_exceeded_minutes,
             user_role,
-            is_offline_sync,
-            db
+            is_offline_sync
         )
 
-    # Remove from active monitoring.
-    db.active_checkouts.delete_one({
-        '_id': active_checkout['_id']
-    })
-
-    emit_movement_update({
-        'type': 'student_movement_updated',
-        'roll_no': roll_no,
-        'student_name': student.get('name', 'Unknown'),
-        'hostel': student.get('hostel'),
-        'action': 'in',
-        'time': now.isoformat(),
-        'recorded_by': user_role,
-        'event_id': movement_id,
-        'time_spent_minutes': round(time_spent_minutes, 2),
-    })
-
-    print(
-        f"Active checkout removed after IN: {roll_no}"
-    )
-
     response_data = {
         'success': True,
         'message': 'Check in recorded successfully',
@@ -528,19 +664,174 @@ def _process_check_in(student, roll_no, now, user_role, is_offline_sync,event_id
         'time_exceeded_minutes': final_exceeded_minutes
     }
 
-    return response_data, 200
+    return {
+        'movement_id': movement_id,
+        'in_time': now,
+        'movement_fields': {
+            'in_time': now,
+            'in_event_id': event_id,
+            'time_spent_minutes': round(time_spent_minutes, 4),
+            'action': 'in',
+            'status': 'inside',
+            'offline_sync': is_offline_sync,
+            'updated_at': now
+        },
+        'effects': effects,
+        'disciplinary_update': disciplinary_update,
+        'response': (response_data, 200)
+    }, None
 
 
-def _create_fallback_disciplinary_record(roll_no, out_time, now, max_allowed_time,
-                                         time_spent_minutes, final_exceeded_minutes,
-                                         user_role, is_offline_sync, db):
+def _movement_close_rejection(movement_record):
+    """Response when the movement record behind a checkout cannot be closed"""
+    if movement_record is None:
+        return {
+            'message': 'Movement record not found'
+        }, 500
+
+    if movement_record.get('in_time') is not None:
+        return {
+            'message': 'Movement record is already checked in'
+        }, 400
+
+    return {
+        'message': 'Failed to update check-in record'
+    }, 500
+
+
+def _replayed_check_in(student, roll_no, event_id, db):
     """
-    Create a fallback disciplinary record when proactive monitoring didn't catch it
+    Build the idempotent response for an already recorded IN event.
+
+    Returns None when the event has not been processed yet.
+    """
+    existing_in_event = db.movement_records.find_one({
+        'in_event_id': event_id,
+        'roll_no': roll_no
+    })
+
+    if existing_in_event is None:
+        return None
+
+    return _check_in_replay_response(student, roll_no, event_id, existing_in_event)
+
+
+def _check_in_replay_response(student, roll_no, event_id, existing_in_event):
+    """Response for an IN event that already closed a movement record."""
+    return {
+        'success': True,
+        'message': 'Check in already recorded',
+        'student_name': student.get('name', 'Unknown'),
+        'roll_no': roll_no,
+        'time': (
+            existing_in_event.get('in_time').isoformat()
+            if existing_in_event.get('in_time')
+            else None
+        ),
+        'action': 'in',
+        'event_id': event_id,
+        'movement_id': existing_in_event.get('event_id'),
+        'time_spent_minutes': existing_in_event.get(
+            'time_spent_minutes', 0
+        ),
+        'offline_sync': existing_in_event.get(
+            'offline_sync', False
+        ),
+        'already_processed': True
+    }, 200
+
+
+def _restore_active_checkout(active_checkout, db):
+    """Put back an active checkout claimed by a check-in that was rejected."""
+    try:
+        db.active_checkouts.insert_one(active_checkout)
+        if active_checkout.get('status') == 'active':
+            schedule_checkout_deadline(active_checkout.get('roll_no'), active_checkout.get('deadline'))
+    except DuplicateKeyError:
+        print(
+            f"⚠️ Active checkout already recreated | "
+            f"Roll={active_checkout.get('roll_no')}"
+        )
+
+
+def _movement_payload(student, roll_no, action, now, user_role, event_id, time_spent_minutes=None):
+    """WebSocket payload announcing a committed movement"""
+    payload = {
+        'type': 'student_movement_updated',
+        'roll_no': roll_no,
+        'student_name': student.get('name', 'Unknown'),
+        'hostel': student.get('hostel'),
+        'action': action,
+        'time': now.isoformat(),
+        'recorded_by': user_role,
+        'event_id': event_id,
+    }
+
+    if time_spent_minutes is not None:
+        payload['time_spent_minutes'] = time_spent_minutes
+
+    return payload
+
+
+# ============================================================
+# DISCIPLINARY RECORDS
+# ============================================================
+
+def _disciplinary_finalize_update(roll_no, disciplinary_record_id, now, time_spent_minutes,
+                                  final_exceeded_minutes, proactive_exceeded):
+    """(filter, update) finalizing the disciplinary record of a proactive violation"""
+    if isinstance(disciplinary_record_id, str):
+        disciplinary_record_id = ObjectId(
+            disciplinary_record_id
+        )
+
+    final_note = (
+        f"Proactive detection: "
+        f"{proactive_exceeded:.2f} min exceeded. "
+        f"Final: "
+        f"{final_exceeded_minutes:.2f} min exceeded. "
+        f"Actual duration: "
+        f"{time_spent_minutes:.2f} min."
+    )
+
+    return (
+        {
+            'roll_no': roll_no,
+            'disciplinary_records._id':
+                disciplinary_record_id
+        },
+        {
+            '$set': {
+                'disciplinary_records.$.actual_duration_minutes':
+                    round(time_spent_minutes, 4),
+                'disciplinary_records.$.final_exceeded_minutes':
+                    final_exceeded_minutes,
+                'disciplinary_records.$.time_exceeded_minutes':
+                    final_exceeded_minutes,
+                'disciplinary_records.$.violation_status':
+                    'confirmed',
+                'disciplinary_records.$.in_time':
+                    now,
+                'disciplinary_records.$.finalized_at':
+                    now,
+                'disciplinary_records.$.proactive_exceeded_minutes':
+                    proactive_exceeded,
+                'disciplinary_records.$.final_note':
+                    final_note
+            }
+        }
+    )
+
+
+def _fallback_disciplinary_update(roll_no, out_time, now, max_allowed_time,
+                                  time_spent_minutes, final_exceeded_minutes,
+                                  user_role, is_offline_sync):
+    """
+    (filter, update) creating a fallback disciplinary record when
+    proactive monitoring didn't catch it
     """
-    from bson import ObjectId
-    
     disciplinary_record_id = ObjectId()
-    
+
     disciplinary_record = {
         '_id': disciplinary_record_id,
         'date': now,
@@ -568,14 +859,86 @@ def _create_fallback_disciplinary_record(roll_no, out_time, now, max_allowed_tim
         'finalized_at': now,
         'detection_method': 'fallback_on_checkin'
     }
-    
-    db.students.update_one(
+
+    return (
         {'roll_no': roll_no},
         {'$push': {'disciplinary_records': disciplinary_record}}
     )
 
 
+def _create_fallback_disciplinary_record(roll_no, out_time, now, max_allowed_time,
+                                         time_spent_minutes, final_exceeded_minutes,
+                                         user_role, is_offline_sync, db):
+    """
+    Create a fallback disciplinary record when proactive monitoring didn't catch it
+    """
+    db.students.update_one(*_fallback_disciplinary_update(
+        roll_no, out_time, now, max_allowed_time,
+        time_spent_minutes, final_exceeded_minutes,
+        user_role, is_offline_sync
+    ))
+
+
+# ============================================================
+# OUTBOX HANDLERS
+# Delivery is at-least-once, so every handler must be idempotent.
+# ============================================================
+
+def _movement_update_effect(payload, db):
+    """Fan a committed movement out to supervisors and admins"""
+    emit_movement_update(payload)
+
+    print(
+        f"{payload.get('action', '').upper()} MOVEMENT COMMITTED | "
+        f"Roll={payload.get('roll_no')} | "
+        f"EventID={payload.get('event_id')} | "
+        f"Time={payload.get('time')}"
+    )
+
+
+def _violation_alert_finalize_effect(payload, db):
+    """Finalize the realtime alert of a proactive violation after check-in"""
+    alert_id = payload['alert_id']
+    time_spent_minutes = payload['time_spent_minutes']
+    final_exceeded_minutes = payload['final_exceeded_minutes']
+    proactive_exceeded = payload['proactive_exceeded_minutes']
+
+    if isinstance(alert_id, str):
+        alert_id = ObjectId(alert_id)
+
+    db.realtime_alerts.update_one(
+        {'_id': alert_id},
+        {
+            '$set': {
+                'details.actual_duration_minutes':
+                    round(time_spent_minutes, 4),
+                'details.final_exceeded_minutes':
+                    final_exceeded_minutes,
+                'details.violation_status':
+                    'confirmed',
+                'details.in_time':
+                    payload['in_time'],
+                'details.proactive_exceeded_minutes':
+                    proactive_exceeded,
+                'finalized_at':
+                    payload['in_time'],
+                'final_note':
+                    (
+                        f"Proactive: "
+                        f"{proactive_exceeded:.2f} min. "
+                        f"Final: "
+                        f"{final_exceeded_minutes:.2f} min."
+                    )
+            }
+        }
+    )
+
+
+register_effect_handler('movement_update', _movement_update_effect)
+register_effect_handler('violation_alert_finalize', _violation_alert_finalize_effect)
+
+
 # Keep the original function name for backward compatibility
 def handle_security_scan(selected_role, data, db=None):
     """Legacy wrapper for backward compatibility"""
-    return process_security_scan(selected_role, data, db)
\ No newline at end of file
+    return process_security_scan(selected_role, data, db)
@@ -24,6 +24,11 @@ from utils.db_utils import get_db
 
 load_dotenv()
 
+# Outcomes of send_hostel_alert
+ALERT_SENT = "sent"
+ALERT_SKIPPED = "skipped"
+ALERT_FAILED = "failed"
+
 
 # ============================================================
 # FIREBASE INITIALIZATION
@@ -237,6 +242,10 @@ def send_hostel_alert(
         FCM device notification
 
     Admin users are never selected by this function.
+
+    Returns:
+        str: ALERT_SENT, ALERT_SKIPPED when no supervisor device can be
+        notified, or ALERT_FAILED when FCM rejects the message
     """
 
     initialize_firebase()
@@ -252,7 +261,7 @@ def send_hostel_alert(
             f"⚠️ FCM notification skipped. "
             f"Invalid hostel: {hostel}"
         )
-        return None
+        return ALERT_SKIPPED
 
     # --------------------------------------------------------
     # Find responsible supervisor
@@ -267,7 +276,7 @@ def send_hostel_alert(
             f"⚠️ FCM notification skipped. "
             f"No supervisor for Hostel {normalized_hostel}"
         )
-        return None
+        return ALERT_SKIPPED
 
     # Explicit safety check:
     # only role=super is allowed here.
@@ -277,7 +286,7 @@ def send_hostel_alert(
             f"Selected user is not a supervisor: "
             f"{supervisor.get('username')}"
         )
-        return None
+        return ALERT_SKIPPED
 
     # --------------------------------------------------------
     # Find supervisor's active device
@@ -292,7 +301,7 @@ def send_hostel_alert(
             f"Hostel={normalized_hostel} | "
             f"No device_id assigned"
         )
-        return None
+        return ALERT_SKIPPED
 
     db = get_db()
 
@@ -310,7 +319,7 @@ def send_hostel_alert(
             f"Device={device_id} | "
             f"Device not found/inactive"
         )
-        return None
+        return ALERT_SKIPPED
 
     # --------------------------------------------------------
     # Get FCM token
@@ -326,7 +335,7 @@ def send_hostel_alert(
             f"Device={device_id} | "
             f"No FCM token registered"
         )
-        return None
+        return ALERT_SKIPPED
 
     # --------------------------------------------------------
     # Build notification
@@ -362,7 +371,17 @@ def send_hostel_alert(
     # Send directly to supervisor's device
     # --------------------------------------------------------
 
-    response = messaging.send(message)
+    try:
+        response = messaging.send(message)
+    except Exception as e:
+        print(
+            f"❌ FCM NOTIFICATION FAILED | "
+            f"Hostel={normalized_hostel} | "
+            f"Device={device_id} | "
+            f"Roll={roll_no} | "
+            f"{type(e).__name__}: {e}"
+        )
+        return ALERT_FAILED
 
     print(
         f"📱 FCM NOTIFICATION SENT | "
@@ -373,4 +392,4 @@ def send_hostel_alert(
         f"MessageID={response}"
     )
 
-    return response
\ No newline at end of file
+    return ALERT_SENT
\ No newline at end of file
@@ -0,0 +1,255 @@
+# services/outbox_service.py
+"""
+Outbox Service - Durable, asynchronous side effects of scans
+
+Side effects of a committed movement (WebSocket fan-out, alert
+bookkeeping, audit lines) used to run inline before the gate device
+got its response. They are now written as outbox entries in the
+movement record itself, in the `pending_effects` array:
+
+- The entry is committed by the same write that records the movement,
+  so it costs no extra round trip and cannot be lost.
+- The entry is handed to a dispatcher thread pool right away.
+- A successful handler removes the entry with $pull.
+- A recovery sweep re-dispatches entries left behind by failures or
+  restarts, so delivery is at-least-once and handlers must be
+  idempotent. Only the leader worker runs the sweep.
+- Each failure is counted in the entry's `attempts`. After
+  MAX_ATTEMPTS failures the entry is parked: moved from
+  `pending_effects` to `dead_effects` with its last error, where the
+  sweep no longer retries it.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import PyMongoError
+
+from utils.db_utils import get_db
+from services.leader_lease import leader_lease
+
+DISPATCH_WORKERS = int(os.environ.get('OUTBOX_DISPATCH_WORKERS', 8))
+SWEEP_SECONDS = int(os.environ.get('OUTBOX_SWEEP_SECONDS', 15))
+# Entries younger than this are assumed to be in flight in some worker.
+RETRY_AFTER_SECONDS = int(os.environ.get('OUTBOX_RETRY_AFTER_SECONDS', 30))
+SWEEP_BATCH = 500
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+
+_handlers = {}
+_executor = ThreadPoolExecutor(
+    max_workers=DISPATCH_WORKERS,
+    thread_name_prefix='outbox-dispatch'
+)
+_in_flight = set()
+_running = 0
+_lock = threading.Lock()
+_latencies_ms = deque(maxlen=1000)
+_counters = {
+    'enqueued': 0,
+    'dispatched': 0,
+    'failed': 0,
+    'recovered': 0,
+    'parked': 0
+}
+_sweeper = None
+
+
+def register_effect_handler(kind, handler):
+    """Register handler(payload, db) for an outbox entry kind"""
+    _handlers[kind] = handler
+
+
+def new_effect(kind, payload):
+    """Build an outbox entry to be stored in movement_records.pending_effects"""
+    return {
+        'effect_id': uuid.uuid4().hex,
+        'kind': kind,
+        'payload': payload,
+        'enqueued_at': datetime.now(timezone.utc)
+    }
+
+
+def dispatch_effects(event_id, effects, db=None):
+    """
+    Hand committed outbox entries of one movement to the dispatcher.
+
+    Args:
+        event_id: event_id of the movement record holding the entries
+        effects: Entries built with new_effect()
+        db: Database connection (optional)
+    """
+    if db is None:
+        db = get_db()
+
+    for effect in effects:
+        with _lock:
+            if effect['effect_id'] in _in_flight:
+                continue
+            _in_flight.add(effect['effect_id'])
+            _counters['enqueued'] += 1
+
+        _executor.submit(_run_effect, event_id, effect, db)
+
+
+def _run_effect(event_id, effect, db):
+    global _running
+
+    with _lock:
+        _running += 1
+
+    handler = _handlers.get(effect['kind'])
+
+    try:
+        if handler is None:
+            raise LookupError(f"no handler for outbox kind {effect['kind']}")
+
+        handler(effect['payload'], db)
+
+        db.movement_records.update_one(
+            {'event_id': event_id},
+            {'$pull': {'pending_effects': {'effect_id': effect['effect_id']}}}
+        )
+
+        enqueued_at = effect['enqueued_at']
+        if enqueued_at.tzinfo is None:
+            enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+
+        with _lock:
+            _counters['dispatched'] += 1
+            _latencies_ms.append(
+                (datetime.now(timezone.utc) - enqueued_at).total_seconds() * 1000
+            )
+
+    except Exception as e:
+        with _lock:
+            _counters['failed'] += 1
+        attempts = effect.get('attempts', 0) + 1
+        print(
+            f"❌ OUTBOX DISPATCH FAILED | Event={event_id} | "
+            f"Kind={effect.get('kind')} | Attempt={attempts}/{MAX_ATTEMPTS} | "
+            f"{type(e).__name__}: {e}"
+        )
+        _record_failure(event_id, effect, attempts, e, db)
+
+    finally:
+        with _lock:
+            _in_flight.discard(effect['effect_id'])
+            _running -= 1
+
+
+def _record_failure(event_id, effect, attempts, error, db):
+    """Count a failed attempt on the entry, or park it after MAX_ATTEMPTS"""
+    try:
+        if attempts < MAX_ATTEMPTS:
+            db.movement_records.update_one(
+                {'event_id': event_id, 'pending_effects.effect_id': effect['effect_id']},
+                {'$inc': {'pending_effects.$.attempts': 1}}
+            )
+            return
+
+        parked = dict(
+            effect,
+            attempts=attempts,
+            last_error=f"{type(error).__name__}: {error}",
+            parked_at=datetime.now(timezone.utc)
+        )
+        result = db.movement_records.update_one(
+            {'event_id': event_id, 'pending_effects.effect_id': effect['effect_id']},
+            {
+                '$pull': {'pending_effects': {'effect_id': effect['effect_id']}},
+                '$push': {'dead_effects': parked}
+            }
+        )
+        if result.modified_count:
+            with _lock:
+                _counters['parked'] += 1
+            print(f"🪦 OUTBOX ENTRY PARKED | Event={event_id} | Kind={effect.get('kind')}")
+
+    except PyMongoError as e:
+        print(f"⚠️ Could not record outbox failure | Event={event_id} | {e}")
+
+
+def recover_pending_effects(db=None):
+    """Re-dispatch outbox entries older than the retry window"""
+    if db is None:
+        db = get_db()
+
+    if db is None:
+        return 0
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=RETRY_AFTER_SECONDS)
+
+    recovered = 0
+    cursor = db.movement_records.find(
+        {'pending_effects.enqueued_at': {'$lt': cutoff}},
+        {'_id': 0, 'event_id': 1, 'pending_effects': 1}
+    ).limit(SWEEP_BATCH)
+
+    for record in cursor:
+        effects = [
+            effect for effect in record.get('pending_effects', [])
+            if _as_utc(effect['enqueued_at']) < cutoff
+        ]
+        if effects:
+            dispatch_effects(record['event_id'], effects, db)
+            recovered += len(effects)
+
+    if recovered:
+        with _lock:
+            _counters['recovered'] += recovered
+        print(f"♻️ OUTBOX RECOVERY | Redispatched={recovered}")
+
+    return recovered
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def start_outbox_sweeper(db):
+    """Start the background recovery sweep"""
+    global _sweeper
+
+    if _sweeper is not None:
+        return
+
+    def _sweep():
+        while True:
+            time.sleep(SWEEP_SECONDS)
+            if not leader_lease.is_leader():
+                continue
+            try:
+                recover_pending_effects(db)
+            except PyMongoError as e:
+                print(f"⚠️ Outbox recovery sweep failed: {e}")
+
+    _sweeper = threading.Thread(target=_sweep, name='outbox-sweeper', daemon=True)
+    _sweeper.start()
+
+
+def get_outbox_stats():
+    """Queue depth and dispatch latency for the metrics endpoint"""
+    with _lock:
+        latencies = sorted(_latencies_ms)
+        stats = dict(_counters)
+        stats['in_flight'] = len(_in_flight)
+        stats['queue_depth'] = len(_in_flight) - _running
+
+    if latencies:
+        stats['dispatch_latency_ms'] = {
+            'p50': round(latencies[len(latencies) // 2], 2),
+            'p99': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+            'max': round(latencies[-1], 2),
+            'samples': len(latencies)
+        }
+    else:
+        stats['dispatch_latency_ms'] = None
+
+    return stats
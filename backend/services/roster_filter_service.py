@@ -0,0 +1,192 @@
+# services/roster_filter_service.py
+"""
+Roster Filter Service - Per-hostel Bloom filters of roll numbers
+
+Offline devices that only need to know whether a roll number exists,
+and in which hostel, can keep one small filter per hostel instead of
+the full roster (see utils/bloom_filter.py for the format).
+
+Each worker keeps the filters in memory, built from the student
+directory:
+
+- New students (and students moving in) are added to their hostel's
+  filter as the directory sees them, without a rebuild.
+- Bloom filters cannot remove items, so a hostel whose filter would
+  need a removal (delete, move out, roll number change), or that has
+  outgrown the size it was built for, is rebuilt on its next request.
+
+Filters are copy-on-write: a change builds or modifies a copy and
+swaps it in, so a filter handed to an endpoint never changes while
+it is serialized, and its bytes (hence its ETag) always match.
+"""
+
+import os
+import threading
+import time
+
+from utils.bloom_filter import BloomFilter, DEFAULT_FALSE_POSITIVE_RATE
+from utils.db_utils import get_db
+from services.student_directory import student_directory
+from services.roster_service import ROSTER_HOSTELS, get_roster_version
+
+FALSE_POSITIVE_RATE = float(os.environ.get('ROSTER_FILTER_FALSE_POSITIVE_RATE', DEFAULT_FALSE_POSITIVE_RATE))
+
+# Room for students added between rebuilds before the rate degrades.
+CAPACITY_HEADROOM = 0.10
+MIN_CAPACITY = 256
+
+
+class RosterFilterStore:
+    """Per-worker Bloom filter for each hostel"""
+
+    def __init__(self):
+        self._filters = {}
+        self._stale = set()
+        # Directory changes seen per hostel; a build that overlaps one stays stale.
+        self._changes = {hostel: 0 for hostel in ROSTER_HOSTELS}
+        self._lock = threading.Lock()
+        self._started = False
+        self.builds = 0
+        self.incremental_adds = 0
+        self.last_build_ms = None
+
+    def start(self):
+        """Keep the filters in step with the student directory"""
+        if self._started:
+            return
+        self._started = True
+
+        student_directory.add_listener(self._on_student_change)
+
+    def _on_student_change(self, operation, document, previous_entry):
+        with self._lock:
+            if operation == 'resync':
+                self._stale.update(ROSTER_HOSTELS)
+                for hostel in ROSTER_HOSTELS:
+                    self._changes[hostel] += 1
+                return
+
+            if previous_entry is not None and (
+                document is None
+                or previous_entry.roll_no != document.get('roll_no')
+                or previous_entry.hostel != document.get('hostel')
+            ):
+                self._stale.add(previous_entry.hostel)
+                self._changed(previous_entry.hostel)
+
+            if document is None:
+                return
+
+            hostel = document.get('hostel')
+            self._changed(hostel)
+
+            bloom = self._filters.get(hostel)
+            if bloom is None:
+                return
+
+            added = previous_entry is None or (
+                previous_entry.roll_no != document.get('roll_no')
+                or previous_entry.hostel != hostel
+            )
+            roster_version = document.get('roster_version')
+            newer = roster_version is not None and roster_version > bloom.roster_version
+            if not (added or newer):
+                return
+
+            # Installed filters are never modified; endpoints may be serializing them.
+            bloom = bloom.copy()
+            if added:
+                bloom.add(document.get('roll_no'))
+                self.incremental_adds += 1
+                if bloom.full:
+                    self._stale.add(hostel)
+            if newer:
+                bloom.roster_version = roster_version
+            self._filters[hostel] = bloom
+
+    def _changed(self, hostel):
+        if hostel in self._changes:
+            self._changes[hostel] += 1
+
+    def get(self, hostel, db=None):
+        """
+        Current BloomFilter for hostel (A-D), rebuilt if stale.
+        None until the student directory is loaded.
+
+        The returned filter is never modified afterwards; changes
+        install a new one.
+        """
+        if hostel not in ROSTER_HOSTELS or not student_directory.loaded:
+            return None
+
+        with self._lock:
+            bloom = self._filters.get(hostel)
+            if bloom is not None and hostel not in self._stale:
+                return bloom
+            changes = self._changes[hostel]
+
+        # Built outside the lock so the directory listener is never kept waiting on MongoDB
+        bloom = self._build(hostel, db)
+
+        with self._lock:
+            self._filters[hostel] = bloom
+            if self._changes[hostel] == changes:
+                self._stale.discard(hostel)
+
+        return bloom
+
+    def _build(self, hostel, db):
+        if db is None:
+            db = get_db()
+
+        started = time.perf_counter()
+
+        # Read before the roster so changes made meanwhile show up in the next delta
+        roster_version = get_roster_version(db)
+        roll_nos = [entry.roll_no for entry in student_directory.entries(hostel)]
+
+        capacity = max(MIN_CAPACITY, int(len(roll_nos) * (1 + CAPACITY_HEADROOM)))
+        bloom = BloomFilter.from_roll_numbers(roll_nos, capacity, FALSE_POSITIVE_RATE)
+        bloom.roster_version = roster_version
+
+        self.builds += 1
+        self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        print(f"🧮 ROSTER FILTER BUILT | Hostel={hostel} | Students={len(roll_nos)} | "
+              f"Size={len(bloom.bits)}B | {self.last_build_ms}ms")
+
+        return bloom
+
+    def stats(self):
+        with self._lock:
+            filters = {
+                hostel: {
+                    'count': bloom.count,
+                    'size_bytes': len(bloom.bits),
+                    'stale': hostel in self._stale
+                }
+                for hostel, bloom in self._filters.items()
+            }
+        return {
+            'filters': filters,
+            'builds': self.builds,
+            'incremental_adds': self.incremental_adds,
+            'last_build_ms': self.last_build_ms
+        }
+
+
+def describe_filter(bloom):
+    """JSON-friendly description of a filter (bits not included)"""
+    return {
+        'roster_version': bloom.roster_version,
+        'count': bloom.count,
+        'bit_count': bloom.bit_count,
+        'hash_count': bloom.hash_count,
+        'size_bytes': len(bloom.bits),
+        'target_false_positive_rate': FALSE_POSITIVE_RATE,
+        'expected_false_positive_rate': round(bloom.expected_false_positive_rate(), 6)
+    }
+
+
+# Process-wide filters used by the roster filter endpoint
+roster_filters = RosterFilterStore()
@@ -0,0 +1,127 @@
+# services/roster_push_service.py
+"""
+Roster Push Service - Roster deltas pushed to security and canteen devices
+
+Devices in a hostel's roster room (see websocket_service) receive a
+`roster_changed` event shortly after students are added, renamed,
+moved or removed, instead of polling the roster endpoints:
+
+    {
+        "hostel": "A",
+        "roster_version": 1234,
+        "upserted": [{"roll_no": ..., "name": ..., "hostel": "A"}],
+        "deleted": ["23CS00042"],
+        "fetch_delta": false
+    }
+
+Changes are collected for PUSH_DELAY_MS so a bulk edit goes out as
+one event per hostel. When more than MAX_PUSH_STUDENTS students
+changed, or many were versioned at once by a reconcile, the event has
+`fetch_delta: true` and no lists; the device then calls the roster
+endpoint with ?since=<its roster_version>. Devices should also do that
+after reconnecting, since events sent while offline are not replayed.
+"""
+
+import os
+import threading
+import time
+
+from services.roster_service import ROSTER_HOSTELS, add_roster_listener
+from services.websocket_service import emit_roster_delta
+
+PUSH_DELAY_MS = int(os.environ.get('ROSTER_PUSH_DELAY_MS', 500))
+MAX_PUSH_STUDENTS = int(os.environ.get('ROSTER_PUSH_MAX_STUDENTS', 200))
+
+
+class _HostelChanges:
+    __slots__ = ('roster_version', 'upserted', 'deleted', 'fetch_delta')
+
+    def __init__(self):
+        self.roster_version = 0
+        self.upserted = {}
+        self.deleted = set()
+        self.fetch_delta = False
+
+    def payload(self, hostel):
+        fetch_delta = self.fetch_delta or len(self.upserted) + len(self.deleted) > MAX_PUSH_STUDENTS
+        return {
+            'hostel': hostel,
+            'roster_version': self.roster_version,
+            'upserted': [] if fetch_delta else sorted(self.upserted.values(), key=lambda s: s['roll_no'] or ''),
+            'deleted': [] if fetch_delta else sorted(self.deleted),
+            'fetch_delta': fetch_delta
+        }
+
+
+class RosterPushBuffer:
+    """Per-hostel roster changes waiting to be pushed"""
+
+    def __init__(self):
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._flusher = None
+        self.events = 0
+        self.changes = 0
+
+    def start(self):
+        if self._flusher is not None:
+            return
+
+        add_roster_listener(self._on_roster_change)
+
+        self._flusher = threading.Thread(
+            target=self._run,
+            name='roster-push',
+            daemon=True
+        )
+        self._flusher.start()
+
+    def _on_roster_change(self, operation, hostel, roster_version, student):
+        hostels = ROSTER_HOSTELS if operation == 'resync' else [hostel]
+
+        with self._condition:
+            for name in hostels:
+                if name not in ROSTER_HOSTELS:
+                    continue
+
+                changes = self._pending.setdefault(name, _HostelChanges())
+                changes.roster_version = max(changes.roster_version, roster_version)
+
+                if operation == 'resync':
+                    changes.fetch_delta = True
+                elif operation == 'delete':
+                    changes.upserted.pop(student['roll_no'], None)
+                    changes.deleted.add(student['roll_no'])
+                else:
+                    changes.deleted.discard(student['roll_no'])
+                    changes.upserted[student['roll_no']] = dict(student)
+
+            self.changes += 1
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+            # Let the rest of a bulk edit arrive before pushing
+            time.sleep(PUSH_DELAY_MS / 1000)
+
+            with self._condition:
+                pending, self._pending = self._pending, {}
+
+            for hostel, changes in pending.items():
+                emit_roster_delta(hostel, changes.payload(hostel))
+                self.events += 1
+
+    def stats(self):
+        return {
+            'events': self.events,
+            'changes': self.changes,
+            'pending_hostels': len(self._pending)
+        }
+
+
+# Process-wide push buffer
+roster_push = RosterPushBuffer()
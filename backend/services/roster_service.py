@@ -0,0 +1,503 @@
+# services/roster_service.py
+"""
+Roster Service - Versioned student roster for delta sync
+
+Offline devices cache the roster (roll_no, name, hostel). Instead of
+re-downloading it on every sync they send the last roster version
+they applied and receive only what changed since:
+
+- Every student carries `roster_version` and `roster_stamp` (the
+  roll_no/name/hostel the version was assigned for). A change to any
+  of those fields gets a new version from a counter.
+- Students that leave a hostel (deleted, moved, roll number changed)
+  leave a tombstone in `roster_tombstones` for the old hostel.
+- Changes are picked up from the student directory's change stream,
+  and reconciled with one query after every directory reload, so
+  edits made directly in MongoDB are versioned too.
+- Only the leader worker stamps, so each change gets one version; a
+  newly elected leader reconciles first to pick up what it missed.
+
+Roster listeners (see add_roster_listener), which push changes to
+devices, are fed on every worker from the directory's change events:
+the stamp written by the leader reaches every worker's directory, so
+devices get pushes whichever worker they are connected to.
+
+Each worker also keeps a digest of every hostel's roster, computed
+from the directory and dropped when that hostel changes, so roster
+endpoints can answer conditional GETs without querying MongoDB.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from utils.db_utils import get_db
+from services.student_directory import student_directory
+from services.leader_lease import leader_lease
+
+ROSTER_COUNTER_ID = 'roster_version'
+ROSTER_HOSTELS = ['A', 'B', 'C', 'D']
+ROSTER_FIELDS = ('roll_no', 'name', 'hostel')
+# Aggregation form of _current_stamp. $ifNull keeps a missing field as
+# null, as document.get() does; a bare '$name' would drop it from the
+# stamp and the student would look changed on every reconcile.
+ROSTER_STAMP_EXPRESSION = {field: {'$ifNull': [f'${field}', None]} for field in ROSTER_FIELDS}
+
+_stamp_lock = threading.Lock()
+_started = False
+_roster_listeners = []
+
+# Last stamped (roster_version, roster_stamp) seen per student _id,
+# and the version committed when this worker started; only the
+# directory thread touches them.
+_pushed_stamps = {}
+_push_baseline = 0
+
+# Newest committed version this worker has written or read.
+_known_version = None
+_version_lock = threading.Lock()
+
+_digests = {}
+_digest_generation = 0
+_digest_lock = threading.Lock()
+_digests_started = False
+
+
+def ensure_roster_indexes(db):
+    """Indexes backing delta roster queries"""
+    db.students.create_index([('roster_version', 1)])
+    db.roster_tombstones.create_index([('hostel', 1), ('roster_version', 1)])
+    db.roster_tombstones.create_index([('created_at', 1)])
+
+
+def start_roster_versioning(db):
+    """Version roster changes seen by the student directory"""
+    global _started
+
+    if _started:
+        return
+    _started = True
+
+    def _on_student_change(operation, document, previous_entry):
+        if not leader_lease.is_leader():
+            return
+
+        if operation == 'resync':
+            reconcile_roster(db)
+        elif operation == 'delete':
+            if previous_entry is not None:
+                _record_removal(db, previous_entry.roll_no, previous_entry.hostel, 'deleted')
+        elif document is not None:
+            _stamp_if_changed(db, document)
+
+    global _push_baseline
+    try:
+        _push_baseline = get_roster_version(db)
+    except PyMongoError as e:
+        print(f"⚠️ Roster version unavailable, pushing every stamped change: {e}")
+
+    student_directory.add_listener(_on_student_change)
+    student_directory.add_listener(_remember_directory_version)
+    # After the stamping listener, so a leader reports its own versions
+    student_directory.add_listener(_push_directory_change)
+    leader_lease.on_elected(lambda: reconcile_roster(db))
+
+
+def add_roster_listener(listener):
+    """
+    Register listener(operation, hostel, roster_version, student).
+
+    Called on every worker, from the directory thread:
+    - 'upsert': student ({'roll_no', 'name', 'hostel'}) is now in
+      hostel, as stamped with roster_version
+    - 'delete': student ({'roll_no', 'hostel'}) left hostel; on a
+      follower roster_version is the newest one it knows, which may
+      be older than the removal's
+    - 'resync': the directory reloaded and changes may have been
+      missed; hostel and student are None and devices should fetch
+      the delta
+    """
+    _roster_listeners.append(listener)
+
+
+def _remember_directory_version(operation, document, previous_entry):
+    """Keep a follower's known version current from the leader's stamps"""
+    if document is not None and document.get('roster_version') is not None:
+        _remember_version(document['roster_version'])
+
+
+def _push_directory_change(operation, document, previous_entry):
+    """Roster pushes derived from a directory change event"""
+    if operation == 'resync':
+        _notify('resync', None, get_known_roster_version() or 0)
+        return
+
+    if operation == 'delete':
+        if previous_entry is not None:
+            _notify('delete', previous_entry.hostel, get_known_roster_version() or 0, {
+                'roll_no': previous_entry.roll_no,
+                'hostel': previous_entry.hostel
+            })
+        return
+
+    if document is None:
+        return
+
+    version = document.get('roster_version')
+    stamp = document.get('roster_stamp')
+    if version is None or not stamp:
+        return
+
+    previous = _pushed_stamps.get(document['_id'])
+
+    if stamp != _current_stamp(document):
+        # An edit the leader has not versioned yet; its stamp is the
+        # state devices were last told about.
+        if previous is None or previous[0] < version:
+            _pushed_stamps[document['_id']] = (version, stamp)
+        return
+
+    if previous is not None and previous[0] >= version:
+        # Some other field changed; the roster did not.
+        return
+
+    _pushed_stamps[document['_id']] = (version, stamp)
+
+    if previous is None and version <= _push_baseline:
+        return
+
+    if previous is not None and (
+        previous[1].get('roll_no') != stamp['roll_no']
+        or previous[1].get('hostel') != stamp['hostel']
+    ):
+        _notify('delete', previous[1].get('hostel'), version, {
+            'roll_no': previous[1].get('roll_no'),
+            'hostel': previous[1].get('hostel')
+        })
+    _notify('upsert', stamp['hostel'], version, dict(stamp))
+
+
+def _notify(operation, hostel, roster_version, student=None):
+    for listener in _roster_listeners:
+        try:
+            listener(operation, hostel, roster_version, student)
+        except Exception as e:
+            print(f"⚠️ Roster listener failed: {type(e).__name__}: {e}")
+
+
+# ============================================================
+# VERSIONS
+# ============================================================
+
+def get_roster_version(db=None):
+    """Highest roster version whose changes are fully written"""
+    if db is None:
+        db = get_db()
+
+    counter = db.counters.find_one({'_id': ROSTER_COUNTER_ID})
+    version = counter.get('committed', 0) if counter else 0
+    _remember_version(version)
+    return version
+
+
+def get_known_roster_version():
+    """
+    Roster version as last seen by this worker, without a query.
+    None until the version has been written, read or seen on a
+    stamped student once. Removals carry no stamp, so a follower only
+    learns of their versions with the next stamped change.
+    """
+    return _known_version
+
+
+def _remember_version(version):
+    global _known_version
+
+    with _version_lock:
+        if _known_version is None or version > _known_version:
+            _known_version = version
+
+
+def _allocate_version(db):
+    counter = db.counters.find_one_and_update(
+        {'_id': ROSTER_COUNTER_ID},
+        {'$inc': {'value': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['value']
+
+
+def _commit_version(db, version):
+    db.counters.update_one(
+        {'_id': ROSTER_COUNTER_ID},
+        {'$max': {'committed': version}}
+    )
+    _remember_version(version)
+
+
+def _current_stamp(document):
+    return {field: document.get(field) for field in ROSTER_FIELDS}
+
+
+def _stamp_if_changed(db, document):
+    stamp = _current_stamp(document)
+    previous_stamp = document.get('roster_stamp')
+
+    if previous_stamp == stamp and document.get('roster_version') is not None:
+        return None
+
+    moved = bool(previous_stamp) and (
+        previous_stamp.get('roll_no') != stamp['roll_no']
+        or previous_stamp.get('hostel') != stamp['hostel']
+    )
+
+    with _stamp_lock:
+        version = _allocate_version(db)
+
+        if moved:
+            _insert_tombstone(
+                db, previous_stamp.get('roll_no'), previous_stamp.get('hostel'),
+                version, 'moved'
+            )
+
+        # Only stamp the version we looked at; a newer edit gets its own event.
+        db.students.update_one(
+            dict(_id=document['_id'], **stamp),
+            {'$set': {'roster_version': version, 'roster_stamp': stamp}}
+        )
+
+        _commit_version(db, version)
+
+    return version
+
+
+def _record_removal(db, roll_no, hostel, reason):
+    with _stamp_lock:
+        version = _allocate_version(db)
+        _insert_tombstone(db, roll_no, hostel, version, reason)
+        _commit_version(db, version)
+
+
+def _insert_tombstone(db, roll_no, hostel, version, reason):
+    db.roster_tombstones.insert_one({
+        'roll_no': roll_no,
+        'hostel': hostel,
+        'roster_version': version,
+        'reason': reason,
+        'created_at': datetime.now(timezone.utc)
+    })
+
+
+def reconcile_roster(db=None):
+    """
+    Stamp students that were never versioned or whose roster fields
+    changed without the directory seeing it (server down, stream gap).
+    """
+    if db is None:
+        db = get_db()
+
+    stamped = 0
+
+    # Backfill: never-versioned students share one version, in one write.
+    if db.students.find_one({'roster_version': {'$exists': False}}, {'_id': 1}):
+        with _stamp_lock:
+            version = _allocate_version(db)
+            stamped = db.students.update_many(
+                {'roster_version': {'$exists': False}},
+                [{'$set': {'roster_version': version, 'roster_stamp': ROSTER_STAMP_EXPRESSION}}]
+            ).modified_count
+            _commit_version(db, version)
+
+    stale = db.students.find(
+        {'$expr': {'$ne': ['$roster_stamp', ROSTER_STAMP_EXPRESSION]}},
+        {'_id': 1, 'roll_no': 1, 'name': 1, 'hostel': 1, 'roster_version': 1, 'roster_stamp': 1}
+    )
+
+    for document in stale:
+        if _stamp_if_changed(db, document) is not None:
+            stamped += 1
+
+    if stamped:
+        print(f"🗂️ ROSTER RECONCILED | Stamped={stamped} | Version={get_roster_version(db)}")
+
+    return stamped
+
+
+def prune_roster_tombstones(cutoff_time, db=None):
+    """
+    Remove tombstones older than cutoff_time. Devices whose version
+    predates the newest removed tombstone must do a full resync.
+    """
+    if db is None:
+        db = get_db()
+
+    newest = db.roster_tombstones.find_one(
+        {'created_at': {'$lt': cutoff_time}},
+        sort=[('roster_version', -1)]
+    )
+
+    if newest is None:
+        return 0
+
+    db.counters.update_one(
+        {'_id': ROSTER_COUNTER_ID},
+        {'$max': {'delta_floor': newest['roster_version']}},
+        upsert=True
+    )
+
+    return db.roster_tombstones.delete_many(
+        {'roster_version': {'$lte': newest['roster_version']}}
+    ).deleted_count
+
+
+# ============================================================
+# DIGESTS
+# ============================================================
+
+def start_roster_digests():
+    """Drop cached hostel digests when the directory sees a roster change"""
+    global _digests_started
+
+    if _digests_started:
+        return
+    _digests_started = True
+
+    student_directory.add_listener(_on_roster_change)
+
+
+def _on_roster_change(operation, document, previous_entry):
+    global _digest_generation
+
+    if operation == 'resync':
+        hostels = None
+    elif document is None:
+        hostels = {previous_entry.hostel} if previous_entry is not None else set()
+    else:
+        current = _current_stamp(document)
+        if previous_entry is not None and current == {
+            'roll_no': previous_entry.roll_no,
+            'name': previous_entry.name,
+            'hostel': previous_entry.hostel
+        }:
+            return
+        hostels = {current['hostel']}
+        if previous_entry is not None:
+            hostels.add(previous_entry.hostel)
+
+    with _digest_lock:
+        _digest_generation += 1
+        if hostels is None:
+            _digests.clear()
+        else:
+            for hostel in hostels:
+                _digests.pop(hostel, None)
+
+
+def get_roster_digest(hostel):
+    """
+    Digest of a hostel's roster (roll_no, name) from the directory,
+    or None when the directory is not loaded. 'ALL' combines the
+    digests of every hostel.
+    """
+    if not student_directory.loaded:
+        return None
+
+    if hostel is None or hostel == 'ALL':
+        combined = hashlib.sha256()
+        for name in ROSTER_HOSTELS:
+            combined.update(get_roster_digest(name).encode())
+        return combined.hexdigest()
+
+    with _digest_lock:
+        digest = _digests.get(hostel)
+        generation = _digest_generation
+
+    if digest is not None:
+        return digest
+
+    hasher = hashlib.sha256()
+    for roll_no, name in sorted(
+        (entry.roll_no, entry.name or '') for entry in student_directory.entries(hostel)
+    ):
+        hasher.update(f'{roll_no}\x1f{name}\n'.encode())
+    digest = hasher.hexdigest()
+
+    with _digest_lock:
+        # Do not cache a digest that raced with an invalidation.
+        if generation == _digest_generation:
+            _digests[hostel] = digest
+
+    return digest
+
+
+# ============================================================
+# DELTAS
+# ============================================================
+
+def get_roster_delta(since, hostel=None, db=None):
+    """
+    Roster changes after version `since`.
+
+    Args:
+        since: Last roster version the device applied
+        hostel: A, B, C, D, or None/'ALL' for every hostel
+        db: Database connection (optional)
+
+    Returns:
+        dict: upserted students, deleted roll numbers and the new
+        roster_version. Devices apply `deleted` before `upserted`.
+        When `full_resync_required` is set the delta is not available
+        and the device must download the full roster.
+    """
+    if db is None:
+        db = get_db()
+
+    counter = db.counters.find_one({'_id': ROSTER_COUNTER_ID}) or {}
+    version = counter.get('committed', 0)
+    _remember_version(version)
+
+    response = {
+        'success': True,
+        'mode': 'delta',
+        'since': since,
+        'roster_version': version
+    }
+
+    if since > version or since < counter.get('delta_floor', 0):
+        response['full_resync_required'] = True
+        return response
+
+    if hostel and hostel != 'ALL':
+        hostel_filter = hostel
+    else:
+        hostel_filter = {'$in': ROSTER_HOSTELS}
+
+    window = {'$gt': since, '$lte': version}
+
+    upserted = list(db.students.find(
+        {'roster_version': window, 'hostel': hostel_filter},
+        {'_id': 0, 'roll_no': 1, 'name': 1, 'hostel': 1}
+    ).sort([('hostel', 1), ('roll_no', 1)]))
+
+    upserted_rolls = {student['roll_no'] for student in upserted}
+
+    deleted = sorted({
+        tombstone['roll_no']
+        for tombstone in db.roster_tombstones.find(
+            {'roster_version': window, 'hostel': hostel_filter},
+            {'_id': 0, 'roll_no': 1}
+        )
+    } - upserted_rolls)
+
+    response.update({
+        'upserted': upserted,
+        'deleted': deleted,
+        'count_upserted': len(upserted),
+        'count_deleted': len(deleted)
+    })
+
+    return response
@@ -0,0 +1,398 @@
+# services/roster_snapshot_service.py
+"""
+Roster Snapshot Service - Prebuilt, precompressed roster responses
+
+Full-roster downloads (a hostel, or ALL) used to be queried,
+serialized and gzipped inside the request thread on every call. Each
+worker now keeps one immutable snapshot per roster:
+
+- The JSON body and the binary roster (utils/roster_codec.py), each
+  with gzip (and zstd, if `zstandard` is installed) encodings, built
+  from the in-process student directory.
+- Rebuilt in a background thread shortly after the roster changes,
+  and on demand if a request finds its snapshot stale.
+- Held as bytes, or memory-mapped from ROSTER_SNAPSHOT_DIR when that
+  is set, so the encodings live in the page cache instead of the heap.
+
+Requests only pick a representation and an encoding and write the
+stored bytes.
+"""
+
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+
+from utils.time_utils import get_ist_now
+from utils.db_utils import get_db
+from utils.roster_codec import encode_roster, ROSTER_BINARY_MIMETYPE
+from services.student_directory import student_directory
+from services.roster_service import ROSTER_HOSTELS, get_roster_digest, get_roster_version
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Directory for memory-mapped snapshot files; unset keeps them in memory.
+SNAPSHOT_DIR = os.environ.get('ROSTER_SNAPSHOT_DIR')
+
+# Wait this long after a change so a bulk edit triggers one rebuild.
+REBUILD_DEBOUNCE_SECONDS = float(os.environ.get('ROSTER_SNAPSHOT_DEBOUNCE_SECONDS', 2))
+
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+
+# Preferred first when the client accepts several.
+ENCODINGS = ('zstd', 'gzip', 'identity') if zstandard else ('gzip', 'identity')
+
+REPRESENTATIONS = {
+    'json': 'application/json',
+    'binary': ROSTER_BINARY_MIMETYPE
+}
+
+ROSTER_FIELDS_INCLUDED = ['roll_no', 'name', 'hostel']
+MINIMAL_FIELDS_EXCLUDED = ['room_no', 'course', 'branch', 'contact_no', 'email',
+                           'guardian_name', 'guardian_phone', 'home_address',
+                           'fee_status', 'admission_date', 'in_out_records',
+                           'disciplinary_records', 'medical_info']
+
+
+# ============================================================
+# RESPONSE BODIES
+# ============================================================
+
+def estimate_roster_kb(students):
+    """Approximate JSON size of a roster without serializing it"""
+    # {"roll_no": "", "name": "", "hostel": ""}, is 44 bytes of structure
+    return sum(
+        44 + len(student.get('roll_no') or '') + len(student.get('name') or '') + len(student.get('hostel') or '')
+        for student in students
+    ) / 1024
+
+
+def build_hostel_roster_body(hostel, result, roster_version, timestamp=None):
+    """Body of /api/students/hostel/<hostel> for a get_students_by_hostel result"""
+    page_size = result['page_size'] if isinstance(result['page_size'], int) else 0
+
+    if page_size <= 0:
+        showing = f"ALL {result['total_count']}"
+    elif result['page'] is None:
+        # Cursor pages have no position to show
+        showing = f"{len(result['students'])} of {result['total_count']}"
+    else:
+        first = ((result['page'] - 1) * page_size) + 1
+        last = ((result['page'] - 1) * page_size) + len(result['students'])
+        showing = f"{first}-{last} of {result['total_count']}"
+
+    return {
+        'success': True,
+        'purpose': 'offline_caching',
+        'roster_version': roster_version,
+        'count': len(result['students']),
+        'total_count': result['total_count'],
+        'hostel': hostel,
+        'hostel_display': 'ALL (A, B, C, D)' if hostel == 'ALL' else hostel,
+        'fields_included': ROSTER_FIELDS_INCLUDED,
+        'note': 'Only minimal fields included to reduce storage. Additional data available via /api/student/<roll_no>/<role>',
+        'pagination': {
+            'page': result['page'],
+            'page_size': result['page_size'],
+            'total_pages': result['total_pages'],
+            'has_more': result.get('has_more', False),
+            'next_cursor': result.get('next_cursor'),
+            'showing': showing
+        },
+        'estimated_size_kb': round(estimate_roster_kb(result['students']), 2),
+        'timestamp': (timestamp or get_ist_now()).isoformat(),
+        'students': result['students']
+    }
+
+
+def build_minimal_roster_body(students, roster_version, timestamp=None):
+    """Body of /api/students/all-minimal"""
+    return {
+        'success': True,
+        'purpose': 'offline_caching_minimal',
+        'roster_version': roster_version,
+        'count': len(students),
+        'fields_included': ROSTER_FIELDS_INCLUDED,
+        'fields_excluded': MINIMAL_FIELDS_EXCLUDED,
+        'students': students,
+        'estimated_size_kb': round(estimate_roster_kb(students), 2),
+        'timestamp': (timestamp or get_ist_now()).isoformat()
+    }
+
+
+def _directory_students(hostel):
+    """Roster rows from the directory, in the (hostel, roll_no) order of the Mongo queries"""
+    if hostel == 'ALL':
+        entries = [entry for entry in student_directory.entries() if entry.hostel in ROSTER_HOSTELS]
+    else:
+        entries = student_directory.entries(hostel)
+
+    entries.sort(key=lambda entry: (entry.hostel, entry.roll_no))
+
+    return [
+        {key: value for key, value in entry.to_dict().items() if value is not None}
+        for entry in entries
+    ]
+
+
+# ============================================================
+# SNAPSHOTS
+# ============================================================
+
+def negotiate_encoding(accept_encodings):
+    """Best stored encoding for a werkzeug Accept-Encoding header"""
+    for encoding in ENCODINGS:
+        if encoding != 'identity' and accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+
+def negotiate_representation(accept_mimetypes):
+    """'binary' only if the client prefers the binary roster over JSON"""
+    if accept_mimetypes[ROSTER_BINARY_MIMETYPE] > accept_mimetypes['application/json']:
+        return 'binary'
+    return 'json'
+
+
+def snapshot_etag(digest, representation, encoding):
+    """Strong ETag of one stored body of a roster snapshot"""
+    return f"{digest[:40]}-{representation}-{encoding}"
+
+
+class RosterSnapshot:
+    """One roster response, encoded once; never modified after build"""
+
+    __slots__ = ('key', 'hostel', 'digest', 'roster_version', 'count',
+                 'built_at', 'bodies', 'metadata_header')
+
+    def __init__(self, key, hostel, digest, roster_version, count, built_at, bodies, metadata_header):
+        self.key = key
+        self.hostel = hostel
+        self.digest = digest
+        self.roster_version = roster_version
+        self.count = count
+        self.built_at = built_at
+        self.bodies = bodies
+        self.metadata_header = metadata_header
+
+    def etag(self, representation, encoding):
+        return snapshot_etag(self.digest, representation, encoding)
+
+    def body(self, representation, encoding):
+        return self.bodies[(representation, encoding)]
+
+
+class RosterSnapshotStore:
+    """Per-worker snapshots keyed by 'hostel:<X>' and 'minimal'"""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._dirty = threading.Event()
+        self._builder = None
+        self.builds = 0
+        self.last_build_ms = None
+
+    def start(self, db):
+        """Prebuild every snapshot and rebuild them when the roster changes"""
+        if self._builder is not None:
+            return
+
+        student_directory.add_listener(lambda *change: self._dirty.set())
+
+        self._builder = threading.Thread(
+            target=self._run,
+            args=(db,),
+            name='roster-snapshots',
+            daemon=True
+        )
+        self._builder.start()
+
+    def _run(self, db):
+        self._refresh_all(db)
+        while True:
+            self._dirty.wait()
+            time.sleep(REBUILD_DEBOUNCE_SECONDS)
+            self._dirty.clear()
+            self._refresh_all(db)
+
+    def _refresh_all(self, db):
+        for hostel in ROSTER_HOSTELS + ['ALL']:
+            self._safe_get(f'hostel:{hostel}', db)
+        self._safe_get('minimal', db)
+
+    def _safe_get(self, key, db):
+        try:
+            self.get(key, db)
+        except Exception as e:
+            print(f"⚠️ Roster snapshot build failed | Key={key} | {type(e).__name__}: {e}")
+
+    def hostel(self, hostel, db=None):
+        return self.get(f'hostel:{hostel}', db)
+
+    def minimal(self, db=None):
+        return self.get('minimal', db)
+
+    def peek(self, key):
+        """Latest built snapshot for key, current or not, without building"""
+        return self._snapshots.get(key)
+
+    def get(self, key, db=None):
+        """Current snapshot for key, rebuilt if stale; None until the directory is loaded"""
+        hostel = key.split(':', 1)[1] if key.startswith('hostel:') else 'ALL'
+
+        digest = get_roster_digest(hostel)
+        if digest is None:
+            return None
+
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.digest == digest:
+            return snapshot
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # One build per key at a time; late arrivals reuse its result.
+        with build_lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.digest == digest:
+                return snapshot
+
+            snapshot = self._build(key, hostel, digest, db)
+            self._snapshots[key] = snapshot
+
+        return snapshot
+
+    def _build(self, key, hostel, digest, db):
+        started = time.perf_counter()
+
+        if db is None:
+            db = get_db()
+
+        roster_version = get_roster_version(db)
+        built_at = get_ist_now()
+        students = _directory_students(hostel)
+
+        if key == 'minimal':
+            body = build_minimal_roster_body(students, roster_version, built_at)
+        else:
+            body = build_hostel_roster_body(hostel, {
+                'students': students,
+                'total_count': len(students),
+                'page': 1,
+                'page_size': 'ALL',
+                'total_pages': 1,
+                'has_more': False,
+                'next_cursor': None
+            }, roster_version, built_at)
+
+        raw = {
+            'json': json.dumps(body, separators=(',', ':')).encode('utf-8'),
+            'binary': encode_roster(students, roster_version)
+        }
+
+        encoded = {}
+        for representation, data in raw.items():
+            encoded[(representation, 'identity')] = data
+            encoded[(representation, 'gzip')] = gzip.compress(data, compresslevel=GZIP_LEVEL)
+            if zstandard is not None:
+                encoded[(representation, 'zstd')] = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+        bodies = {
+            variant: self._store(key, digest, variant, data)
+            for variant, data in encoded.items()
+        }
+
+        # Legacy compress=true clients read the metadata from a header.
+        json_size = len(raw['json'])
+        gzip_size = len(encoded[('json', 'gzip')])
+        metadata = {k: v for k, v in body.items() if k != 'students'}
+        metadata.update({
+            'compression_applied': True,
+            'original_size_kb': round(json_size / 1024, 2),
+            'compressed_size_kb': round(gzip_size / 1024, 2),
+            'compression_ratio': f"{100 - (gzip_size * 100 / json_size):.1f}%"
+        })
+
+        snapshot = RosterSnapshot(
+            key=key,
+            hostel=hostel,
+            digest=digest,
+            roster_version=roster_version,
+            count=len(students),
+            built_at=built_at,
+            bodies=bodies,
+            metadata_header=json.dumps(metadata)
+        )
+
+        self.builds += 1
+        self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        print(
+            f"📦 ROSTER SNAPSHOT BUILT | Key={key} | Students={len(students)} | "
+            f"Sizes={ {'/'.join(variant): len(data) for variant, data in encoded.items()} } | "
+            f"{self.last_build_ms} ms"
+        )
+
+        return snapshot
+
+    def _store(self, key, digest, variant, data):
+        """Keep data as bytes, or as a read-only memory map of a cache file"""
+        if not SNAPSHOT_DIR:
+            return data
+
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+        representation, encoding = variant
+        prefix = f"{key.replace(':', '-')}.{representation}.{encoding}."
+        path = os.path.join(SNAPSHOT_DIR, f"{prefix}{digest[:16]}")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Older files stay readable through existing maps until those are released.
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.startswith(prefix) and not name.endswith('.tmp') and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(SNAPSHOT_DIR, name))
+                except OSError:
+                    pass
+
+        return mapped
+
+    def stats(self):
+        return {
+            'builds': self.builds,
+            'last_build_ms': self.last_build_ms,
+            'storage': 'mmap' if SNAPSHOT_DIR else 'memory',
+            'encodings': list(ENCODINGS),
+            'representations': list(REPRESENTATIONS),
+            'snapshots': {
+                key: {
+                    'students': snapshot.count,
+                    'roster_version': snapshot.roster_version,
+                    'built_at': snapshot.built_at.isoformat(),
+                    'bytes': {
+                        '/'.join(variant): len(body)
+                        for variant, body in snapshot.bodies.items()
+                    }
+                }
+                for key, snapshot in list(self._snapshots.items())
+            }
+        }
+
+
+# Process-wide snapshot store
+roster_snapshots = RosterSnapshotStore()
@@ -0,0 +1,404 @@
+# services/student_directory.py
+"""
+Student Directory - Compact in-process roster used by the scan paths
+
+Scan endpoints only need roll_no, name, hostel and the custom allowed
+time. Fetching the full student document (with the unbounded
+disciplinary_records array) on every scan is wasted work, so each
+worker keeps a read-through directory of compact entries:
+
+- Loaded once at startup with a projection.
+- Kept fresh by a change stream on `students`. The directory is
+  reloaded each time the stream is opened, after it is open, so no
+  change falls between the load and the stream.
+- Falls back to a periodic reload when change streams are not
+  available (standalone MongoDB without a replica set).
+
+Other services can subscribe to the changes the directory sees with
+add_listener() instead of opening their own change stream.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from utils.db_utils import get_db
+
+# Fields kept per student; everything else stays in MongoDB.
+DIRECTORY_PROJECTION = {
+    '_id': 1,
+    'roll_no': 1,
+    'name': 1,
+    'hostel': 1,
+    'custom_allowed_time_minutes': 1
+}
+
+# Reload interval used when change streams are unavailable.
+REFRESH_SECONDS = int(os.environ.get('STUDENT_DIRECTORY_REFRESH_SECONDS', 60))
+
+# Error code returned by MongoDB when change streams are not supported.
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+
+class StudentEntry:
+    """
+    Compact student record.
+
+    Exposes `get()` like the student dicts it replaces, so scan code
+    can keep using student.get('name', 'Unknown').
+    """
+
+    __slots__ = ('roll_no', 'name', 'hostel', 'custom_allowed_time_minutes')
+
+    def __init__(self, roll_no, name=None, hostel=None, custom_allowed_time_minutes=None):
+        self.roll_no = roll_no
+        self.name = name
+        self.hostel = hostel
+        self.custom_allowed_time_minutes = custom_allowed_time_minutes
+
+    @classmethod
+    def from_document(cls, document):
+        return cls(
+            roll_no=document.get('roll_no'),
+            name=document.get('name'),
+            hostel=document.get('hostel'),
+            custom_allowed_time_minutes=document.get('custom_allowed_time_minutes')
+        )
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def to_dict(self):
+        return {
+            'roll_no': self.roll_no,
+            'name': self.name,
+            'hostel': self.hostel
+        }
+
+
+class StudentDirectory:
+    """Read-through, roll_no keyed directory of StudentEntry objects"""
+
+    def __init__(self):
+        self._entries = {}
+        self._roll_by_id = {}
+        self._hostel_counts = Counter()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._listeners = []
+        self.loaded = False
+        self.mode = 'read_through'
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    # ============================================================
+    # LOOKUPS
+    # ============================================================
+
+    def get(self, roll_no, db=None):
+        """Return the StudentEntry for roll_no, or None if the student does not exist"""
+        entry = self._entries.get(roll_no)
+
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+
+        if db is None:
+            db = get_db()
+
+        if db is None:
+            return None
+
+        document = db.students.find_one({'roll_no': roll_no}, DIRECTORY_PROJECTION)
+
+        if document is None:
+            return None
+
+        return self._store(document)
+
+    def get_many(self, roll_nos, db=None):
+        """Return {roll_no: StudentEntry} for the known students, fetching misses with one $in"""
+        found = {}
+        missing = []
+
+        for roll_no in set(roll_nos):
+            entry = self._entries.get(roll_no)
+            if entry is not None:
+                found[roll_no] = entry
+            else:
+                missing.append(roll_no)
+
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if not missing:
+            return found
+
+        if db is None:
+            db = get_db()
+
+        if db is None:
+            return found
+
+        for document in db.students.find({'roll_no': {'$in': missing}}, DIRECTORY_PROJECTION):
+            entry = self._store(document)
+            found[entry.roll_no] = entry
+
+        return found
+
+    def add_listener(self, listener):
+        """
+        Register listener(operation, document, previous_entry).
+
+        Called from the directory thread for every change:
+        - 'insert' / 'update' / 'replace': document is the changed
+          student (directory fields plus roster_version/roster_stamp)
+        - 'delete': document is None, previous_entry is the last known
+          entry (None if the student was never seen)
+        - 'resync': after the first load, and after a reload that
+          found entries the changes above did not account for;
+          document and previous_entry are None
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, operation, document=None, previous_entry=None):
+        for listener in self._listeners:
+            try:
+                listener(operation, document, previous_entry)
+            except Exception as e:
+                print(f"⚠️ Student directory listener failed: {type(e).__name__}: {e}")
+
+    def invalidate(self, roll_no):
+        """Drop one entry so the next lookup reads it from MongoDB"""
+        with self._lock:
+            entry = self._entries.pop(roll_no, None)
+            if entry is not None:
+                self._hostel_counts[entry.hostel] -= 1
+
+    def entries(self, hostel=None):
+        """Snapshot of the loaded entries, optionally of one hostel"""
+        with self._lock:
+            entries = list(self._entries.values())
+        if hostel is None:
+            return entries
+        return [entry for entry in entries if entry.hostel == hostel]
+
+    def hostel_counts(self):
+        """{hostel: number of loaded students}, kept up to date as entries change"""
+        with self._lock:
+            return {hostel: count for hostel, count in self._hostel_counts.items() if count > 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'mode': self.mode,
+            'loaded': self.loaded,
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    # ============================================================
+    # LOADING AND FRESHNESS
+    # ============================================================
+
+    def load(self, db):
+        """Load the full directory with a projection and swap it in"""
+        entries = {}
+        roll_by_id = {}
+
+        for document in db.students.find({}, DIRECTORY_PROJECTION).batch_size(2000):
+            entry = StudentEntry.from_document(document)
+            entries[entry.roll_no] = entry
+            roll_by_id[document['_id']] = entry.roll_no
+
+        hostel_counts = Counter(entry.hostel for entry in entries.values())
+
+        with self._lock:
+            previous_entries = self._entries
+            previous_roll_by_id = self._roll_by_id
+            self._entries = entries
+            self._roll_by_id = roll_by_id
+            self._hostel_counts = hostel_counts
+
+        was_loaded = self.loaded
+        self.loaded = True
+        self.reloads += 1
+        print(f"📇 STUDENT DIRECTORY LOADED | Students={len(entries)}")
+
+        if not self._listeners:
+            return
+
+        if was_loaded:
+            if roll_by_id == previous_roll_by_id and _same_entries(previous_entries, entries):
+                # Nothing was missed; listeners already saw every change
+                return
+
+            # Deletes are not visible in the new snapshot; report them from the diff.
+            for student_id, roll_no in previous_roll_by_id.items():
+                if student_id not in roll_by_id:
+                    self._notify('delete', None, previous_entries.get(roll_no))
+
+        self._notify('resync')
+
+    def start(self, db):
+        """Load the directory and start the background freshness thread"""
+        if self._watcher is not None:
+            return
+
+        try:
+            self.load(db)
+        except PyMongoError as e:
+            print(f"⚠️ Student directory load failed, using read-through only: {e}")
+
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(db,),
+            name='student-directory',
+            daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _store(self, document):
+        entry = StudentEntry.from_document(document)
+        with self._lock:
+            previous = self._entries.get(entry.roll_no)
+            if previous is not None:
+                self._hostel_counts[previous.hostel] -= 1
+            self._hostel_counts[entry.hostel] += 1
+            self._entries[entry.roll_no] = entry
+            if '_id' in document:
+                self._roll_by_id[document['_id']] = entry.roll_no
+        return entry
+
+    def _remove_by_id(self, student_id):
+        with self._lock:
+            roll_no = self._roll_by_id.pop(student_id, None)
+            if roll_no is not None:
+                entry = self._entries.pop(roll_no, None)
+                if entry is not None:
+                    self._hostel_counts[entry.hostel] -= 1
+                return entry
+        return None
+
+    def _watch(self, db):
+        """Follow the students change stream; fall back to polling if unsupported"""
+        pipeline = [{
+            '$project': {
+                'operationType': 1,
+                'documentKey': 1,
+                'fullDocument._id': 1,
+                'fullDocument.roll_no': 1,
+                'fullDocument.name': 1,
+                'fullDocument.hostel': 1,
+                'fullDocument.custom_allowed_time_minutes': 1,
+                'fullDocument.roster_version': 1,
+                'fullDocument.roster_stamp': 1
+            }
+        }]
+
+        while not self._stop.is_set():
+            try:
+                with db.students.watch(pipeline, full_document='updateLookup') as stream:
+                    self.mode = 'change_stream'
+                    # Reload once the stream is open so no change falls between the two
+                    self.load(db)
+                    for change in stream:
+                        self._apply_change(change)
+                        if self._stop.is_set():
+                            return
+
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    print("ℹ️ Change streams unavailable; student directory will poll")
+                    self._poll(db)
+                    return
+                print(f"⚠️ Student directory stream error, resyncing: {e}")
+
+            except PyMongoError as e:
+                print(f"⚠️ Student directory stream error, resyncing: {e}")
+
+            # The stream was interrupted or invalidated; reopening it reloads in full.
+            time.sleep(5)
+
+    def _apply_change(self, change):
+        operation = change.get('operationType')
+
+        if operation in ('insert', 'update', 'replace'):
+            document = change.get('fullDocument')
+            if document is None:
+                # Deleted before the lookup ran.
+                previous_entry = self._remove_by_id(change['documentKey']['_id'])
+                self._notify('delete', None, previous_entry)
+                return
+
+            previous_roll = self._roll_by_id.get(document['_id'])
+            previous_entry = self._entries.get(previous_roll)
+            if previous_roll is not None and previous_roll != document.get('roll_no'):
+                self._remove_by_id(document['_id'])
+            self._store(document)
+            self._notify(operation, document, previous_entry)
+
+        elif operation == 'delete':
+            previous_entry = self._remove_by_id(change['documentKey']['_id'])
+            self._notify('delete', None, previous_entry)
+
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            raise PyMongoError(f"students change stream {operation}")
+
+    def _poll(self, db):
+        self.mode = 'polling'
+        while not self._stop.wait(REFRESH_SECONDS):
+            try:
+                self.load(db)
+            except PyMongoError as e:
+                print(f"⚠️ Student directory reload failed: {e}")
+
+
+def _entry_fields(entry):
+    return (entry.roll_no, entry.name, entry.hostel, entry.custom_allowed_time_minutes)
+
+
+def _same_entries(previous_entries, entries):
+    """True if two loads hold the same students with the same fields"""
+    if previous_entries.keys() != entries.keys():
+        return False
+    return all(
+        _entry_fields(previous_entries[roll_no]) == _entry_fields(entry)
+        for roll_no, entry in entries.items()
+    )
+
+
+# Process-wide directory used by all scan paths
+student_directory = StudentDirectory()
+
+
+def get_student(roll_no, db=None):
+    """Look up a student's scan fields through the directory"""
+    return student_directory.get(roll_no, db)
@@ -4,10 +4,20 @@ Student Service - Handles all student-related operations
 Extracted from backend.py for better maintainability
 """
 
+import base64
+import json
+import threading
 from datetime import datetime, date, timedelta, timezone
 from bson import ObjectId
 from utils.time_utils import INDIA_TZ, get_ist_now, normalize_datetime_to_ist
 from utils.db_utils import get_db
+from services.student_directory import student_directory, get_student
+from services.active_checkout_registry import active_checkout_registry
+from services.roster_service import get_roster_version
+
+# Roster total counts keyed by (hostel, roster_version)
+_roster_counts = {}
+_roster_count_lock = threading.Lock()
 
 def _get_recent_movement_records(roll_no, days=30, db=None):
     """
@@ -243,18 +253,68 @@ def search_students(query, hostel=None, limit=20, db=None):
     return students
 
 
-def get_students_by_hostel(hostel, page=1, page_size=100, db=None):
+def encode_roster_cursor(hostel, roll_no):
+    """Opaque keyset cursor for the row after (hostel, roll_no)"""
+    raw = json.dumps([hostel, roll_no], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_roster_cursor(cursor):
+    """(hostel, roll_no) from a cursor; raises ValueError if it is not one of ours"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        hostel, roll_no = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(hostel, str) or not isinstance(roll_no, str):
+        raise ValueError('Invalid cursor')
+    return hostel, roll_no
+
+
+def _roster_count(hostel, query, db):
+    """Students matching a roster query, counted once per roster version"""
+    roster_version = get_roster_version(db)
+    key = (hostel, roster_version)
+
+    with _roster_count_lock:
+        count = _roster_counts.get(key)
+
+    if count is not None:
+        return count
+
+    count = db.students.count_documents(query)
+
+    with _roster_count_lock:
+        # Counts of older versions are never asked for again; a request
+        # that read the version before a newer one was cached keeps out.
+        if all(k[1] <= roster_version for k in _roster_counts):
+            for stale_key in [k for k in _roster_counts if k[1] != roster_version]:
+                del _roster_counts[stale_key]
+            _roster_counts[key] = count
+
+    return count
+
+
+def get_students_by_hostel(hostel, page=1, page_size=100, db=None, cursor=None):
     """
     Get all students for a specific hostel (for offline caching)
     
+    Pages are read with a keyset on (hostel, roll_no): pass the
+    `next_cursor` of one page as `cursor` to get the next one. The
+    legacy `page` number still works but costs O(offset).
+    
     Args:
         hostel: Hostel name (A, B, C, D, or ALL)
-        page: Page number (1-indexed)
+        page: Page number (1-indexed), ignored when cursor is given
         page_size: Number of records per page
         db: Database connection (optional)
+        cursor: next_cursor from the previous page (optional)
     
     Returns:
         dict: Students with pagination metadata
+
+    Raises:
+        ValueError: If the cursor is invalid
     """
     if db is None:
         db = get_db()
@@ -276,29 +336,46 @@ def get_students_by_hostel(hostel, page=1, page_size=100, db=None):
         'hostel': 1
     }
     
-    # Get total count
-    total_count = db.students.count_documents(query)
+    # Get total count (cached per roster version)
+    total_count = _roster_count(hostel, query, db)
     
-    # Apply pagination
-    skip = (page - 1) * page_size if page_size > 0 else 0
-    limit = page_size if page_size > 0 else 0
+    find_filter = query
+    if cursor:
+        after_hostel, after_roll_no = decode_roster_cursor(cursor)
+        find_filter = {'$and': [query, {'$or': [
+            {'hostel': {'$gt': after_hostel}},
+            {'hostel': after_hostel, 'roll_no': {'$gt': after_roll_no}}
+        ]}]}
     
-    # Execute query with sorting
-    find_query = db.students.find(query, projection).sort([('hostel', 1), ('roll_no', 1)])
+    # Execute query with sorting (served by the (hostel, roll_no) index)
+    find_query = db.students.find(find_filter, projection).sort([('hostel', 1), ('roll_no', 1)])
     
-    if skip > 0:
-        find_query = find_query.skip(skip)
-    if limit > 0:
-        find_query = find_query.limit(limit)
+    # Legacy page numbers skip; cursors start right after the previous page
+    if not cursor and page_size > 0 and page > 1:
+        find_query = find_query.skip((page - 1) * page_size)
+    if page_size > 0:
+        # One extra row tells whether another page exists
+        find_query = find_query.limit(page_size + 1)
     
     students = list(find_query)
     
+    has_more = page_size > 0 and len(students) > page_size
+    if has_more:
+        students = students[:page_size]
+    
+    next_cursor = None
+    if has_more:
+        last = students[-1]
+        next_cursor = encode_roster_cursor(last.get('hostel'), last.get('roll_no'))
+    
     return {
         'students': students,
         'total_count': total_count,
-        'page': page,
+        'page': None if cursor else page,
         'page_size': page_size if page_size > 0 else 'ALL',
-        'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 1
+        'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 1,
+        'has_more': has_more,
+        'next_cursor': next_cursor
     }
 
 
@@ -376,6 +453,7 @@ def update_student_allowed_time(roll_no, new_allowed_time, admin_user, db=None):
         {'roll_no': roll_no},
         {'$set': update_data}
     )
+    student_directory.invalidate(roll_no)
     
     return {
         'success': True,
@@ -419,6 +497,7 @@ def reset_student_allowed_time(roll_no, admin_user, db=None):
             'allowed_time_updated_by': ""
         }}
     )
+    student_directory.invalidate(roll_no)
     
     return {
         'success': True,
@@ -447,10 +526,7 @@ def validate_student_offline(roll_no, db=None):
     if db is None:
         return {'valid': False, 'error': 'Database unavailable'}
     
-    student = db.students.find_one(
-        {'roll_no': roll_no},
-        {'roll_no': 1, 'name': 1, 'hostel': 1, '_id': 0}
-    )
+    student = get_student(roll_no, db)
     
     if student:
         return {
@@ -484,8 +560,14 @@ def get_student_counts(db=None):
     counts = {}
     total = 0
     
+    # The student directory keeps per-hostel counts in memory once loaded
+    directory_counts = student_directory.hostel_counts() if student_directory.loaded else None
+    
     for hostel in ['A', 'B', 'C', 'D']:
-        count = db.students.count_documents({'hostel': hostel})
+        if directory_counts is not None:
+            count = directory_counts.get(hostel, 0)
+        else:
+            count = db.students.count_documents({'hostel': hostel})
         counts[hostel] = count
         total += count
     
@@ -497,6 +579,39 @@ def get_student_counts(db=None):
     }
 
 
+def iter_students_minimal(query, limit=0, sort=True, batch_size=1000, db=None):
+    """
+    Cursor over students with minimal fields (roll_no, name, hostel only)
+    
+    Documents are fetched from MongoDB in batches as the cursor is
+    iterated, so callers can stream a roster without holding it.
+    
+    Args:
+        query: MongoDB filter
+        limit: Maximum number of students (0 for no limit)
+        sort: Sort by (hostel, roll_no)
+        batch_size: Documents per getMore round trip
+        db: Database connection (optional)
+    
+    Returns:
+        Cursor: Iterable of student dicts
+    """
+    if db is None:
+        db = get_db()
+    
+    cursor = db.students.find(
+        query,
+        {'_id': 0, 'roll_no': 1, 'name': 1, 'hostel': 1}
+    ).batch_size(batch_size)
+    
+    if sort:
+        cursor = cursor.sort([('hostel', 1), ('roll_no', 1)])
+    if limit > 0:
+        cursor = cursor.limit(limit)
+    
+    return cursor
+
+
 def get_all_students_minimal(db=None):
     """
     Get ALL students with minimal fields (roll_no, name, hostel only)
@@ -529,28 +644,42 @@ def get_all_students_minimal(db=None):
     return students
 
 
-def get_active_students_outside(db=None):
+def get_active_students_outside(hostel=None, include_violations=False, db=None):
     """
     Get all students currently outside
     
+    Served from the in-memory active checkout registry once it is
+    loaded; MongoDB is only queried before that.
+    
     Args:
+        hostel: Only students of this hostel (optional)
+        include_violations: Also include students past their allowed time
         db: Database connection (optional)
     
     Returns:
         list: List of students currently outside
     """
+    statuses = ('active', 'violation') if include_violations else ('active',)
+    
+    if active_checkout_registry.loaded:
+        return active_checkout_registry.outside(hostel, statuses)
+    
     if db is None:
         db = get_db()
     
     if db is None:
         return []
     
+    query = {'status': {'$in': list(statuses)}}
+    if hostel:
+        query['student_hostel'] = hostel
+    
     # Get all active checkouts
     active_checkouts = list(db.active_checkouts.find(
-        {'status': 'active'},
+        query,
         {'_id': 0, 'roll_no': 1, 'student_name': 1, 'student_hostel': 1, 
-         'out_time': 1, 'deadline': 1, 'allowed_minutes': 1}
-    ))
+         'out_time': 1, 'deadline': 1, 'allowed_minutes': 1, 'status': 1, 'alert_sent': 1}
+    ).sort('out_time', 1))
     
     return active_checkouts
 
@@ -0,0 +1,95 @@
+# services/sync_manifest_service.py
+"""
+Sync Manifest Service - Everything a device needs to plan a roster sync
+
+Devices used to poll /api/students/count (four count_documents) and
+/api/sync/check-student-data/<hostel> before deciding what to
+download. The manifest answers all of that in one response, built
+only from state each worker already keeps in memory:
+
+- counts from the student directory
+- the roster version and per-hostel digests from roster_service
+- byte sizes of every stored encoding from the roster snapshots
+- Bloom filter sizes from the roster filters
+"""
+
+from utils.time_utils import get_ist_now
+from services.student_directory import student_directory
+from services.roster_service import (
+    ROSTER_HOSTELS,
+    get_known_roster_version,
+    get_roster_digest,
+    get_roster_version
+)
+from services.roster_snapshot_service import roster_snapshots, snapshot_etag
+from services.roster_filter_service import roster_filters
+
+
+def _snapshot_manifest(key, digest):
+    snapshot = roster_snapshots.peek(key)
+    if snapshot is None:
+        return {'available': False}
+
+    sizes = {}
+    for (representation, encoding), body in snapshot.bodies.items():
+        sizes.setdefault(representation, {})[encoding] = len(body)
+
+    return {
+        'available': True,
+        # A stale snapshot is rebuilt when requested; sizes are from the last build
+        'current': snapshot.digest == digest,
+        'roster_version': snapshot.roster_version,
+        'etag': snapshot_etag(snapshot.digest, 'json', 'identity'),
+        'bytes': sizes
+    }
+
+
+def get_sync_manifest(db=None):
+    """
+    Per-hostel count, roster version, digest and download sizes.
+
+    Returns:
+        tuple: (response_dict, status_code); 503 until the student
+        directory is loaded
+    """
+    if not student_directory.loaded:
+        return {
+            'success': False,
+            'message': 'Roster not loaded yet, retry shortly'
+        }, 503
+
+    roster_version = get_known_roster_version()
+    if roster_version is None:
+        # Only the first manifest of a worker that has not seen the counter yet
+        roster_version = get_roster_version(db)
+
+    counts = student_directory.hostel_counts()
+    filter_stats = roster_filters.stats()['filters']
+
+    hostels = {}
+    for hostel in ROSTER_HOSTELS:
+        digest = get_roster_digest(hostel)
+        hostels[hostel] = {
+            'count': counts.get(hostel, 0),
+            'roster_version': roster_version,
+            'digest': digest,
+            'snapshot': _snapshot_manifest(f'hostel:{hostel}', digest),
+            'filter_bytes': filter_stats.get(hostel, {}).get('size_bytes')
+        }
+
+    all_digest = get_roster_digest('ALL')
+    total = sum(hostel['count'] for hostel in hostels.values())
+
+    return {
+        'success': True,
+        'roster_version': roster_version,
+        'total_students': total,
+        'hostels': hostels,
+        'all': {
+            'count': total,
+            'digest': all_digest,
+            'snapshot': _snapshot_manifest('hostel:ALL', all_digest),
+            'minimal_snapshot': _snapshot_manifest('minimal', all_digest)
+        },
+        'timestamp': get_ist_now().isoformat()
+    }, 200
@@ -3,12 +3,17 @@
 Sync Service - Handles offline synchronization
 Extracted from backend.py for better maintainability
 """
+import uuid
 from datetime import datetime, timezone
 
+from pymongo.errors import BulkWriteError
+
 from utils.time_utils import INDIA_TZ, get_ist_now
 from utils.db_utils import get_db
 from services.movement_service import process_security_scan
-from services.alert_service import create_unauthorized_alert
+from services.bulk_scan_service import process_security_scans_bulk, BULK_CHUNK_SIZE
+from services.alert_service import create_unauthorized_alerts
+from services.student_directory import student_directory
 
 
 def sync_security_scans(scans, user_role, db=None):
@@ -20,6 +25,13 @@ def sync_security_scans(scans, user_role, db=None):
         movement_records
         active_checkouts
         proactive monitoring
+
+    Each student's scans are replayed in original_timestamp order and
+    the upload goes through the bulk scan engine one chunk at a time.
+    A chunk that fails is retried scan by scan; earlier chunks have
+    committed and keep their results. Scans without an event_id get
+    one here, so the retry replays the same event instead of
+    recording it again. Results are returned in upload order.
     """
 
     if db is None:
@@ -31,15 +43,25 @@ def sync_security_scans(scans, user_role, db=None):
             'error': 'Database unavailable'
         }]
 
-    results = []
+    results = [None] * len(scans)
+    positions = []
+    scan_batch = []
 
-    for scan in scans:
+    for index, scan in enumerate(scans):
 
         if not isinstance(scan, dict):
-            results.append({
+            results[index] = {
                 'success': False,
                 'error': 'Invalid scan format'
-            })
+            }
+            continue
+
+        roll_no = scan.get('roll_no')
+        if roll_no is not None and not isinstance(roll_no, str):
+            results[index] = {
+                'success': False,
+                'error': 'Invalid roll number'
+            }
             continue
 
         # Copy scan so we do not modify the original object.
@@ -48,37 +70,113 @@ def sync_security_scans(scans, user_role, db=None):
         # All records entering this function came from offline sync.
         scan_data['offline_sync'] = True
 
+        # Fixed before the first attempt so a retry is a replay.
+        scan_data['event_id'] = scan_data.get('event_id') or str(uuid.uuid4())
+
+        positions.append(index)
+        scan_batch.append(scan_data)
+
+    positions, scan_batch = _order_scans_per_student(positions, scan_batch)
+
+    outcomes = []
+
+    for start in range(0, len(scan_batch), BULK_CHUNK_SIZE):
+        chunk = scan_batch[start:start + BULK_CHUNK_SIZE]
         try:
-            response_data, status_code = process_security_scan(
+            outcomes.extend(process_security_scans_bulk(
                 user_role=user_role,
-                data=scan_data,
+                scans=chunk,
                 db=db
+            ))
+        except Exception as e:
+            print(f"⚠️ Bulk scan sync failed for scans {start}-{start + len(chunk) - 1}, "
+                  f"falling back to single scans: {e}")
+            outcomes.extend(
+                _sync_single_scan(scan_data, user_role, db)
+                for scan_data in chunk
             )
 
-            result = dict(response_data)
+    for index, scan_data, outcome in zip(positions, scan_batch, outcomes):
+        if isinstance(outcome, dict):
+            results[index] = outcome
+            continue
 
-            result['status_code'] = status_code
-            result['success'] = (
-                200 <= status_code < 300
-            )
+        response_data, status_code = outcome
 
-            results.append(result)
+        result = dict(response_data)
 
-        except Exception as e:
-            results.append({
-                'success': False,
-                'roll_no': scan.get('roll_no'),
-                'error': str(e)
-            })
+        result['status_code'] = status_code
+        result['success'] = (
+            200 <= status_code < 300
+        )
+
+        results[index] = result
 
     return results
 
 
+def _order_scans_per_student(positions, scan_batch):
+    """
+    Sort each student's scans by original_timestamp (stable).
+
+    Scans of one student are reordered among the upload slots that
+    student already occupies; other students are not affected. Scans
+    without a timestamp are stamped with the server time, so they go
+    last.
+    """
+    slots_by_roll = {}
+    for slot, scan_data in enumerate(scan_batch):
+        slots_by_roll.setdefault(scan_data.get('roll_no'), []).append(slot)
+
+    ordered_positions = list(positions)
+    ordered_batch = list(scan_batch)
+
+    for slots in slots_by_roll.values():
+        if len(slots) < 2:
+            continue
+
+        by_time = sorted(slots, key=lambda slot: _scan_sort_key(scan_batch[slot]))
+
+        for target, source in zip(slots, by_time):
+            ordered_positions[target] = positions[source]
+            ordered_batch[target] = scan_batch[source]
+
+    return ordered_positions, ordered_batch
+
+
+def _scan_sort_key(scan_data):
+    timestamp = scan_data.get('original_timestamp')
+    if not timestamp or not isinstance(timestamp, (int, float)):
+        return (1, 0)
+    return (0, timestamp)
+
+
+def _sync_single_scan(scan_data, user_role, db):
+    try:
+        return process_security_scan(
+            user_role=user_role,
+            data=scan_data,
+            db=db
+        )
+    except Exception as e:
+        return {
+            'success': False,
+            'roll_no': scan_data.get('roll_no'),
+            'error': str(e)
+        }
+
+
 
 def sync_canteen_visits(visits, user_role, db=None):
     """
     Sync offline canteen visits from mobile devices
     
+    Students are fetched with one $in through the directory, visits
+    are written with one unordered insert_many and the resulting
+    unauthorized-visit alerts with a second one. A visit whose
+    event_id is already recorded is a replay: it succeeds without
+    being written or alerted again.
+    
     Args:
         visits: List of canteen visit records from device
         user_role: Role of the user performing sync
@@ -94,9 +192,21 @@ def sync_canteen_visits(visits, user_role, db=None):
         return [{'success': False, 'error': 'Database unavailable'}]
     
     user_hostel = user_role.split('_')[1].upper() if '_' in user_role else 'ALL'
-    results = []
+    results = [None] * len(visits)
     
-    for visit in visits:
+    students = student_directory.get_many(
+        [visit.get('roll_no') for visit in visits if isinstance(visit, dict)],
+        db
+    )
+    
+    visit_records = []
+    record_positions = []
+    
+    for index, visit in enumerate(visits):
+        if not isinstance(visit, dict):
+            results[index] = {'success': False, 'error': 'Invalid visit format'}
+            continue
+        
         roll_no = visit.get('roll_no')
         original_timestamp = visit.get('original_timestamp')
         
@@ -106,10 +216,10 @@ def sync_canteen_visits(visits, user_role, db=None):
         else:
             now = get_ist_now()
         
-        student = db.students.find_one({'roll_no': roll_no})
+        student = students.get(roll_no)
         
         if not student:
-            results.append({'success': False, 'roll_no': roll_no, 'error': 'Student not found'})
+            results[index] = {'success': False, 'roll_no': roll_no, 'error': 'Student not found'}
             continue
         
         student_hostel = student.get('hostel', 'Unknown')
@@ -129,12 +239,47 @@ def sync_canteen_visits(visits, user_role, db=None):
             'day_of_week': now.strftime('%A'),
             'offline_sync': True
         }
+        if isinstance(visit.get('event_id'), str):
+            visit_record['event_id'] = visit['event_id']
+        
+        visit_records.append(visit_record)
+        record_positions.append(index)
+    
+    failed = {}
+    replayed = set()
+    
+    if visit_records:
+        try:
+            db.canteen_visits.insert_many(visit_records, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                if write_error.get('code') == 11000:
+                    replayed.add(write_error['index'])
+                else:
+                    failed[write_error['index']] = write_error.get('errmsg', 'Write failed')
+    
+    unauthorized_visits = []
+    
+    for record_index, (index, visit_record) in enumerate(zip(record_positions, visit_records)):
+        if record_index in failed:
+            results[index] = {
+                'success': False,
+                'roll_no': visit_record['roll_no'],
+                'error': failed[record_index]
+            }
+            continue
         
-        db.canteen_visits.insert_one(visit_record)
-        results.append({'success': True, 'roll_no': roll_no})
+        results[index] = {'success': True, 'roll_no': visit_record['roll_no']}
         
-        if is_unauthorized:
-            create_unauthorized_alert(visit_record, db)
+        if record_index in replayed:
+            results[index]['already_recorded'] = True
+            continue
+        
+        if visit_record['is_unauthorized']:
+            unauthorized_visits.append(visit_record)
+    
+    if unauthorized_visits:
+        create_unauthorized_alerts(unauthorized_visits, db)
     
     return results
 
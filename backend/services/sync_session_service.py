@@ -0,0 +1,327 @@
+# services/sync_session_service.py
+"""
+Sync Session Service - Resumable, chunked offline sync
+
+A device uploads its offline backlog as a session of numbered chunks
+instead of one unbounded JSON array:
+
+1. begin    - open (or resume) the device's session for a sync kind
+2. chunk N  - upload chunk N (0-based); applied only if N follows
+              the session's high-watermark
+3. commit   - close the session once every chunk is applied
+
+The session document in `sync_sessions` keeps the high-watermark of
+applied chunks. A device that lost its connection asks for the
+session again and continues after the watermark; chunks at or below
+it are acknowledged without being reprocessed.
+
+A chunk whose claim expired mid-apply is applied again by the next
+upload. Every record without an event_id gets one derived from the
+session, chunk and position, so the second apply replays the same
+events: scans are deduplicated by the movement indexes and canteen
+visits by the unique event_id index on canteen_visits.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.db_utils import get_db
+from services.sync_service import sync_security_scans, sync_canteen_visits
+
+# Records accepted per chunk; bounds memory per request.
+MAX_CHUNK_RECORDS = int(os.environ.get('SYNC_CHUNK_MAX_RECORDS', 500))
+
+# A chunk claimed longer ago than this is assumed abandoned (worker died).
+CHUNK_CLAIM_SECONDS = int(os.environ.get('SYNC_CHUNK_CLAIM_SECONDS', 120))
+
+# Sessions untouched for this long are removed by the TTL index.
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+SYNC_KINDS = {
+    'security-scans': sync_security_scans,
+    'canteen-visits': sync_canteen_visits
+}
+
+
+def ensure_sync_session_indexes(db):
+    """Indexes backing sync sessions"""
+    db.sync_sessions.create_index([('session_id', 1)], unique=True)
+    # At most one open session per device and sync kind
+    db.sync_sessions.create_index(
+        [('device_id', 1), ('kind', 1)],
+        unique=True,
+        partialFilterExpression={'status': 'open'}
+    )
+    db.sync_sessions.create_index(
+        [('updated_at', 1)],
+        expireAfterSeconds=SESSION_TTL_SECONDS
+    )
+    # A re-applied chunk must not record its canteen visits twice
+    db.canteen_visits.create_index(
+        [('event_id', 1)],
+        unique=True,
+        partialFilterExpression={'event_id': {'$type': 'string'}}
+    )
+
+
+def begin_sync_session(device_id, user_role, kind, db=None):
+    """
+    Open a sync session, or resume the device's open one.
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    if db is None:
+        db = get_db()
+
+    if kind not in SYNC_KINDS:
+        return {
+            'message': 'Invalid sync kind',
+            'valid_kinds': list(SYNC_KINDS)
+        }, 400
+
+    now = datetime.now(timezone.utc)
+    new_session_id = uuid.uuid4().hex
+
+    try:
+        session = db.sync_sessions.find_one_and_update(
+            {'device_id': device_id, 'kind': kind, 'status': 'open'},
+            {
+                '$setOnInsert': {
+                    'session_id': new_session_id,
+                    'device_id': device_id,
+                    'kind': kind,
+                    'status': 'open',
+                    'high_watermark': -1,
+                    'applied_records': 0,
+                    'applying_chunk': None,
+                    'created_at': now
+                },
+                '$set': {'user_role': user_role, 'updated_at': now}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another request of the same device opened it first.
+        session = db.sync_sessions.find_one(
+            {'device_id': device_id, 'kind': kind, 'status': 'open'}
+        )
+
+    resumed = session['session_id'] != new_session_id
+    print(
+        f"🔄 SYNC SESSION {'RESUMED' if resumed else 'OPENED'} | "
+        f"Device={device_id} | Kind={kind} | Watermark={session['high_watermark']}"
+    )
+
+    return _session_summary(session, resumed=resumed), 200
+
+
+def get_sync_session(session_id, device_id, db=None):
+    """Current state of a session, for resuming after a reconnect"""
+    if db is None:
+        db = get_db()
+
+    session = db.sync_sessions.find_one({'session_id': session_id})
+
+    denied = _check_session(session, device_id)
+    if denied is not None:
+        return denied
+
+    return _session_summary(session), 200
+
+
+def upload_sync_chunk(session_id, device_id, seq, records, db=None):
+    """
+    Apply chunk `seq` of a session.
+
+    Chunks must arrive in order: a chunk at or below the watermark is
+    acknowledged as already applied, a chunk beyond watermark + 1 is
+    rejected with the expected sequence number.
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    if db is None:
+        db = get_db()
+
+    if not isinstance(records, list):
+        return {'message': 'records must be a list'}, 400
+
+    if len(records) > MAX_CHUNK_RECORDS:
+        return {'message': f'At most {MAX_CHUNK_RECORDS} records per chunk'}, 413
+
+    now = datetime.now(timezone.utc)
+    claim_expired = now - timedelta(seconds=CHUNK_CLAIM_SECONDS)
+
+    # Claim the chunk: only the next one, and only if nobody else holds it.
+    session = db.sync_sessions.find_one_and_update(
+        {
+            'session_id': session_id,
+            'device_id': device_id,
+            'status': 'open',
+            'high_watermark': seq - 1,
+            '$or': [
+                {'applying_chunk': None},
+                {'applying_since': {'$lt': claim_expired}}
+            ]
+        },
+        {'$set': {'applying_chunk': seq, 'applying_since': now, 'updated_at': now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+    if session is None:
+        return _unclaimed_chunk_response(session_id, device_id, seq, db)
+
+    records = _with_event_ids(records, session_id, seq)
+
+    try:
+        results = SYNC_KINDS[session['kind']](records, session['user_role'], db)
+    except Exception:
+        db.sync_sessions.update_one(
+            {'session_id': session_id, 'applying_chunk': seq},
+            {'$set': {'applying_chunk': None}}
+        )
+        raise
+
+    session = db.sync_sessions.find_one_and_update(
+        {'session_id': session_id, 'applying_chunk': seq},
+        {
+            '$set': {
+                'high_watermark': seq,
+                'applying_chunk': None,
+                'updated_at': datetime.now(timezone.utc)
+            },
+            '$inc': {'applied_records': len(records)}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+    if session is None:
+        # Our claim expired and another upload of this chunk took over.
+        session = db.sync_sessions.find_one({'session_id': session_id})
+
+    print(
+        f"📦 SYNC CHUNK APPLIED | Session={session_id} | Chunk={seq} | "
+        f"Records={len(records)}"
+    )
+
+    response = _session_summary(session)
+    response.update({'seq': seq, 'applied': True, 'results': results})
+    return response, 200
+
+
+def commit_sync_session(session_id, device_id, total_chunks=None, db=None):
+    """
+    Close a session. If total_chunks is given, every chunk up to it
+    must have been applied.
+
+    Returns:
+        tuple: (response_data, status_code)
+    """
+    if db is None:
+        db = get_db()
+
+    session = db.sync_sessions.find_one({'session_id': session_id})
+
+    denied = _check_session(session, device_id, allow_committed=True)
+    if denied is not None:
+        return denied
+
+    if session['status'] == 'committed':
+        return _session_summary(session), 200
+
+    if total_chunks is not None and session['high_watermark'] != total_chunks - 1:
+        response = _session_summary(session)
+        response.update({
+            'message': 'Session has missing chunks',
+            'expected_seq': session['high_watermark'] + 1
+        })
+        return response, 409
+
+    now = datetime.now(timezone.utc)
+    session = db.sync_sessions.find_one_and_update(
+        {'session_id': session_id, 'status': 'open', 'applying_chunk': None},
+        {'$set': {'status': 'committed', 'committed_at': now, 'updated_at': now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+    if session is None:
+        return {'message': 'A chunk is still being applied. Retry commit.'}, 409
+
+    print(
+        f"✅ SYNC SESSION COMMITTED | Session={session_id} | "
+        f"Chunks={session['high_watermark'] + 1} | Records={session['applied_records']}"
+    )
+
+    return _session_summary(session), 200
+
+
+def _with_event_ids(records, session_id, seq):
+    """Records with an event_id that is the same every time the chunk is applied"""
+    return [
+        dict(record, event_id=record.get('event_id') or f"{session_id}:{seq}:{index}")
+        if isinstance(record, dict) else record
+        for index, record in enumerate(records)
+    ]
+
+
+def _unclaimed_chunk_response(session_id, device_id, seq, db):
+    session = db.sync_sessions.find_one({'session_id': session_id})
+
+    denied = _check_session(session, device_id, allow_committed=True)
+    if denied is not None:
+        return denied
+
+    response = _session_summary(session)
+
+    if seq <= session['high_watermark']:
+        response.update({'seq': seq, 'applied': False, 'already_applied': True})
+        return response, 200
+
+    if session['status'] != 'open':
+        response['message'] = 'Session is already committed'
+        return response, 409
+
+    if seq == session['high_watermark'] + 1:
+        response['message'] = 'Chunk is being applied by another request'
+        return response, 409
+
+    response.update({
+        'message': 'Chunk out of order',
+        'expected_seq': session['high_watermark'] + 1
+    })
+    return response, 409
+
+
+def _check_session(session, device_id, allow_committed=False):
+    if session is None:
+        return {'message': 'Sync session not found'}, 404
+
+    if session['device_id'] != device_id:
+        return {'message': 'Sync session belongs to another device'}, 403
+
+    if session['status'] != 'open' and not allow_committed:
+        return {'message': 'Sync session is already committed'}, 409
+
+    return None
+
+
+def _session_summary(session, resumed=False):
+    summary = {
+        'success': True,
+        'session_id': session['session_id'],
+        'kind': session['kind'],
+        'status': session['status'],
+        'high_watermark': session['high_watermark'],
+        'next_seq': session['high_watermark'] + 1,
+        'applied_records': session.get('applied_records', 0),
+        'max_chunk_records': MAX_CHUNK_RECORDS
+    }
+    if resumed:
+        summary['resumed'] = True
+    return summary
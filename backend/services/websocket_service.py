@@ -25,6 +25,11 @@ def handle_join_hostel(data):
     Admin:
         admin -> admin_all
 
+    Security / canteen (roster updates only):
+        security_a / canteen_a -> roster_A
+        Devices that cache other hostels' rosters may also send
+        {"rosters": ["B", "C"]} or {"rosters": "ALL"}.
+
     The hostel supplied by the client is NOT trusted.
     The server derives the authorized room from the JWT role.
     """
@@ -64,6 +69,13 @@ def handle_join_hostel(data):
 
             return
 
+        # =========================================================
+        # SECURITY / CANTEEN
+        # =========================================================
+        if user_role.startswith('security_') or user_role.startswith('canteen_'):
+            _join_roster_rooms(user_role, device_id, data)
+            return
+
         # =========================================================
         # SUPERVISORS
         # =========================================================
@@ -111,6 +123,82 @@ def handle_join_hostel(data):
         )
 
 
+def _join_roster_rooms(user_role, device_id, data):
+    """
+    Join the roster room of the role's hostel, plus any other hostels
+    the device asked for. Security and canteen staff can already
+    download every hostel's roster, so those requests are allowed.
+    """
+    role_parts = user_role.split('_')
+
+    if len(role_parts) != 2 or role_parts[1].strip().upper() not in VALID_HOSTELS:
+        print(
+            f"❌ WebSocket join rejected: "
+            f"invalid staff role {user_role}"
+        )
+        return
+
+    hostels = {role_parts[1].strip().upper()}
+
+    requested = data.get('rosters') if isinstance(data, dict) else None
+    if isinstance(requested, str) and requested.strip().upper() == 'ALL':
+        hostels.update(VALID_HOSTELS)
+    elif isinstance(requested, list):
+        hostels.update(
+            str(hostel).strip().upper()
+            for hostel in requested
+            if str(hostel).strip().upper() in VALID_HOSTELS
+        )
+
+    rooms = sorted(f"roster_{hostel}" for hostel in hostels)
+
+    for room in rooms:
+        join_room(room)
+
+    print(
+        f"🔌 WEBSOCKET ROSTER ROOMS JOINED | "
+        f"Role={user_role} | "
+        f"Rooms={','.join(rooms)} | "
+        f"Device={device_id}"
+    )
+
+
+def emit_roster_delta(hostel, delta):
+    """
+    Send a roster change to the devices caching that hostel's roster.
+    """
+
+    try:
+        hostel = str(hostel).strip().upper()
+
+        if hostel not in VALID_HOSTELS:
+            return
+
+        room = f"roster_{hostel}"
+
+        socketio.emit(
+            'roster_changed',
+            delta,
+            room=room
+        )
+
+        print(
+            f"🔌 WEBSOCKET ROSTER DELTA EMITTED | "
+            f"Hostel={hostel} | "
+            f"Version={delta.get('roster_version')} | "
+            f"Upserted={len(delta.get('upserted', []))} | "
+            f"Deleted={len(delta.get('deleted', []))} | "
+            f"FetchDelta={delta.get('fetch_delta')} | "
+            f"Room={room}"
+        )
+
+    except Exception as e:
+        print(
+            f"❌ WebSocket roster delta emission failed: "
+            f"{type(e).__name__}: {e}"
+        )
+
+
 def emit_violation_alert(alert_data):
     """
     Send violation WebSocket event to:
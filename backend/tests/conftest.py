@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Services import their siblings as top-level packages (services.*, utils.*)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
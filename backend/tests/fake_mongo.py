@@ -0,0 +1,188 @@
+"""In-memory stand-in for the pymongo collection calls the scan paths make"""
+
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+def matches(document, query):
+    """Equality, $in, $ne, $exists and $or; a missing field equals None"""
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+
+        value = document.get(field)
+        if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            for operator, argument in condition.items():
+                if operator == '$in':
+                    if value not in argument:
+                        return False
+                elif operator == '$ne':
+                    if value == argument:
+                        return False
+                elif operator == '$exists':
+                    if (field in document) != argument:
+                        return False
+                else:
+                    raise NotImplementedError(operator)
+        elif value != condition:
+            return False
+    return True
+
+
+def apply_update(document, update):
+    updated = copy.deepcopy(document)
+    for field, value in update.get('$set', {}).items():
+        updated[field] = value
+    for field, value in update.get('$inc', {}).items():
+        updated[field] = updated.get(field, 0) + value
+    for field, value in update.get('$push', {}).items():
+        values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+        updated.setdefault(field, []).extend(values)
+    return updated
+
+
+class FakeCollection:
+    """
+    Documents kept in a list. `unique` lists the unique indexes as
+    field tuples; like partial indexes, documents with a None in the
+    key are not indexed. Writes are appended to `log` as
+    (name, operation) so tests can check their order, and
+    `before_bulk_write(collection, operations)` runs ahead of each
+    bulk_write to stage a concurrent change.
+    """
+
+    def __init__(self, name, documents=(), unique=(), log=None):
+        self.name = name
+        self.documents = []
+        self.unique = unique
+        self.log = log if log is not None else []
+        self.before_bulk_write = None
+        for document in documents:
+            self._insert(dict(document))
+
+    def _violates_unique(self, document, ignore=None):
+        for fields in self.unique:
+            key = tuple(document.get(field) for field in fields)
+            if None in key:
+                continue
+            for other in self.documents:
+                if other is not ignore and tuple(other.get(field) for field in fields) == key:
+                    return True
+        return False
+
+    def _insert(self, document):
+        document.setdefault('_id', ObjectId())
+        if self._violates_unique(document) or any(d.get('_id') == document['_id'] for d in self.documents):
+            raise DuplicateKeyError(f'E11000 duplicate key in {self.name}')
+        self.documents.append(copy.deepcopy(document))
+
+    def find(self, query=None, projection=None):
+        return [copy.deepcopy(d) for d in self.documents if matches(d, query or {})]
+
+    def find_one(self, query=None, projection=None):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def insert_one(self, document):
+        self._insert(document)
+        self.log.append((self.name, 'insert'))
+        return SimpleNamespace(inserted_id=document['_id'])
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                self.insert_one(document)
+            except DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'nInserted': len(documents) - len(errors), 'writeErrors': errors})
+        return SimpleNamespace(inserted_ids=[document['_id'] for document in documents])
+
+    def delete_one(self, query):
+        self.log.append((self.name, 'delete'))
+        for document in self.documents:
+            if matches(document, query):
+                self.documents.remove(document)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def find_one_and_delete(self, query):
+        self.log.append((self.name, 'delete'))
+        for document in self.documents:
+            if matches(document, query):
+                self.documents.remove(document)
+                return document
+        return None
+
+    def update_one(self, query, update):
+        self.log.append((self.name, 'update'))
+        for index, document in enumerate(self.documents):
+            if matches(document, query):
+                updated = apply_update(document, update)
+                if self._violates_unique(updated, ignore=document):
+                    raise DuplicateKeyError(f'E11000 duplicate key in {self.name}')
+                self.documents[index] = updated
+                return SimpleNamespace(matched_count=1, modified_count=int(updated != document))
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    def bulk_write(self, operations, ordered=True):
+        if self.before_bulk_write is not None:
+            self.before_bulk_write(self, operations)
+
+        counts = {'nInserted': 0, 'nRemoved': 0, 'nMatched': 0, 'nModified': 0}
+        errors = []
+
+        for index, operation in enumerate(operations):
+            try:
+                if isinstance(operation, InsertOne):
+                    self.insert_one(operation._doc)
+                    counts['nInserted'] += 1
+                elif isinstance(operation, DeleteOne):
+                    counts['nRemoved'] += self.delete_one(operation._filter).deleted_count
+                elif isinstance(operation, UpdateOne):
+                    result = self.update_one(operation._filter, operation._doc)
+                    counts['nMatched'] += result.matched_count
+                    counts['nModified'] += result.modified_count
+                elif isinstance(operation, ReplaceOne):
+                    result = self.update_one(operation._filter, {'$set': operation._doc})
+                    counts['nMatched'] += result.matched_count
+                    counts['nModified'] += result.modified_count
+                else:
+                    raise NotImplementedError(type(operation).__name__)
+            except DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+
+        if errors:
+            raise BulkWriteError(dict(counts, writeErrors=errors))
+
+        return SimpleNamespace(
+            inserted_count=counts['nInserted'],
+            deleted_count=counts['nRemoved'],
+            matched_count=counts['nMatched'],
+            modified_count=counts['nModified']
+        )
+
+
+def scan_db(checkouts=(), movements=(), students=()):
+    """active_checkouts, movement_records and students with their unique indexes"""
+    log = []
+    return SimpleNamespace(
+        log=log,
+        active_checkouts=FakeCollection('active_checkouts', checkouts, unique=[('roll_no',)], log=log),
+        movement_records=FakeCollection(
+            'movement_records', movements,
+            unique=[('event_id',), ('in_event_id', 'roll_no')], log=log
+        ),
+        students=FakeCollection('students', students, log=log)
+    )
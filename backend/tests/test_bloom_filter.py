@@ -0,0 +1,106 @@
+"""Roster Bloom filter: membership, false-positive rate and serialization"""
+
+import hashlib
+
+import pytest
+
+from utils.bloom_filter import BloomFilter, BloomFilterError, filter_size
+
+
+def _roll_numbers(count, prefix='23CS'):
+    return [f'{prefix}{i:05d}' for i in range(count)]
+
+
+def test_no_false_negatives():
+    roll_nos = _roll_numbers(2500)
+    bloom = BloomFilter.from_roll_numbers(roll_nos)
+
+    assert all(roll_no in bloom for roll_no in roll_nos)
+    assert bloom.count == 2500
+
+
+@pytest.mark.parametrize('rate', [0.05, 0.01, 0.001])
+def test_false_positive_rate_near_target(rate):
+    bloom = BloomFilter.from_roll_numbers(_roll_numbers(2500), false_positive_rate=rate)
+    probes = 100000
+
+    hits = sum(1 for i in range(probes) if f'XX-NOT-ENROLLED-{i}' in bloom)
+
+    # 1.5x allows for sampling noise at the smallest rate
+    assert hits / probes <= rate * 1.5
+    assert bloom.expected_false_positive_rate() <= rate * 1.1
+
+
+def test_size_per_student():
+    bit_count, hash_count = filter_size(2500, 0.01)
+
+    assert bit_count / 2500 == pytest.approx(9.6, abs=0.1)
+    assert hash_count == 7
+    assert filter_size(0)[0] >= 64
+
+
+def test_incremental_adds_match_a_full_build():
+    roll_nos = _roll_numbers(1000)
+    bloom = BloomFilter.for_capacity(len(roll_nos))
+    for roll_no in roll_nos:
+        bloom.add(roll_no)
+
+    assert bloom.bits == BloomFilter.from_roll_numbers(roll_nos).bits
+    assert not bloom.full
+
+    bloom.add('EXTRA-00001')
+    assert bloom.full
+
+
+def test_copy_is_independent():
+    bloom = BloomFilter.from_roll_numbers(_roll_numbers(10))
+    copy = bloom.copy()
+    copy.add('EXTRA-00001')
+
+    assert 'EXTRA-00001' in copy
+    assert copy.count == bloom.count + 1
+    assert bloom.bits != copy.bits
+
+
+def test_serialization_round_trip():
+    bloom = BloomFilter.from_roll_numbers(_roll_numbers(500))
+    bloom.roster_version = 2 ** 40
+
+    parsed = BloomFilter.from_bytes(bloom.to_bytes())
+
+    assert parsed.bits == bloom.bits
+    assert (parsed.bit_count, parsed.hash_count, parsed.count, parsed.roster_version) == \
+        (bloom.bit_count, bloom.hash_count, bloom.count, 2 ** 40)
+    assert all(roll_no in parsed for roll_no in _roll_numbers(500))
+
+
+def test_bit_positions_follow_the_documented_scheme():
+    # Devices reimplement this from the module docstring
+    bloom = BloomFilter(1000, 5)
+    bloom.add('23CS00001')
+
+    digest = hashlib.sha256('23CS00001'.encode('utf-8')).digest()
+    h1 = int.from_bytes(digest[0:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little') | 1
+    expected = {((h1 + i * h2) % 2 ** 64) % 1000 for i in range(5)}
+
+    set_bits = {j for j in range(1000) if bloom.bits[j // 8] >> (j % 8) & 1}
+    assert set_bits == expected
+
+
+def _data():
+    return BloomFilter.from_roll_numbers(_roll_numbers(10)).to_bytes()
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'RBLM',
+    b'JSON' + _data()[4:],
+    _data()[:4] + b'\x02' + _data()[5:],
+    _data()[:-1],
+    _data() + b'\x00',
+    _data()[:5] + b'\x00' + _data()[6:],
+], ids=['empty', 'magic-only', 'bad-magic', 'bad-version', 'truncated', 'trailing', 'zero-hashes'])
+def test_corrupt_input_is_rejected(data):
+    with pytest.raises(BloomFilterError):
+        BloomFilter.from_bytes(data)
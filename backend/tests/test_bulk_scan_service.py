@@ -0,0 +1,244 @@
+"""Bulk scan engine: write order, claim races and per-student rollback"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pymongo')
+bulk_scan_service = pytest.importorskip('services.bulk_scan_service')
+movement_service = pytest.importorskip('services.movement_service')
+
+from fake_mongo import scan_db
+
+STUDENT = {'roll_no': 'R1', 'name': 'Test Student', 'hostel': 'A'}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = SimpleNamespace(scheduled=[], cancelled=[], dispatched=[])
+
+    monkeypatch.setattr(
+        bulk_scan_service.student_directory, 'get_many',
+        lambda roll_nos, db=None: {roll_no: dict(STUDENT, roll_no=roll_no) for roll_no in roll_nos}
+    )
+    monkeypatch.setattr(movement_service, 'get_student', lambda roll_no, db=None: dict(STUDENT, roll_no=roll_no))
+    for module in (bulk_scan_service, movement_service):
+        monkeypatch.setattr(module, 'schedule_checkout_deadline',
+                            lambda roll_no, deadline: calls.scheduled.append(roll_no))
+        monkeypatch.setattr(module, 'cancel_checkout_deadline',
+                            lambda roll_no: calls.cancelled.append(roll_no))
+        monkeypatch.setattr(module, 'dispatch_effects',
+                            lambda movement_id, effects, db: calls.dispatched.append(movement_id))
+    return calls
+
+
+def _open_checkout():
+    out_time = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=30)
+    movement_id = f"out-{uuid.uuid4()}"
+    checkout = {
+        '_id': f"checkout-{uuid.uuid4()}",
+        'roll_no': 'R1',
+        'student_hostel': 'A',
+        'movement_id': movement_id,
+        'out_time': out_time,
+        'deadline': out_time + timedelta(hours=8),
+        'status': 'active'
+    }
+    movement = {'event_id': movement_id, 'roll_no': 'R1', 'out_time': out_time, 'in_time': None}
+    return checkout, movement
+
+
+def _scan(action, event_id=None):
+    return {'roll_no': 'R1', 'action': action, 'event_id': event_id or f"{action}-{uuid.uuid4()}"}
+
+
+def _run(db, *scans):
+    return bulk_scan_service.process_security_scans_bulk('security_a', list(scans), db)
+
+
+def _movement(db, event_id):
+    return db.movement_records.find_one({'event_id': event_id})
+
+
+def test_check_out_records_movement_before_checkout(calls):
+    db = scan_db()
+    out = _scan('out')
+
+    (response, status), = _run(db, out)
+
+    assert status == 200
+    assert db.log == [('movement_records', 'insert'), ('active_checkouts', 'insert')]
+    assert db.active_checkouts.find_one({'roll_no': 'R1'})['movement_id'] == out['event_id']
+    assert calls.scheduled == ['R1']
+    assert calls.dispatched == [out['event_id']]
+
+
+def test_check_in_claims_checkout_before_closing_movement(calls):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+    scan_in = _scan('in')
+
+    (response, status), = _run(db, scan_in)
+
+    assert status == 200
+    assert db.log == [('active_checkouts', 'delete'), ('movement_records', 'update')]
+    assert db.active_checkouts.documents == []
+    assert _movement(db, movement['event_id'])['in_event_id'] == scan_in['event_id']
+    assert calls.cancelled == ['R1']
+
+
+def test_check_in_lost_to_another_gate_is_rerun(calls):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+    single_in = f"in-{uuid.uuid4()}"
+
+    def single_scan_first(collection, operations):
+        # Another gate checks the student in between planning and writing.
+        collection.before_bulk_write = None
+        movement_service.process_security_scan('security_a', _scan('in', single_in), db)
+
+    db.active_checkouts.before_bulk_write = single_scan_first
+
+    results = _run(db, _scan('in'))
+
+    assert results == [({'message': 'No active check out record found'}, 400)]
+    assert db.active_checkouts.documents == []
+    assert _movement(db, movement['event_id'])['in_event_id'] == single_in
+    assert calls.dispatched == [movement['event_id']]
+
+
+def test_single_scan_keeps_check_in_of_movement_closed_by_bulk(calls):
+    # The single scan claimed the checkout first, so the bulk delete
+    # removed nothing, but the bulk closed the movement first.
+    checkout, movement = _open_checkout()
+    bulk_in = f"in-{uuid.uuid4()}"
+    closed = dict(movement, in_time=movement['out_time'] + timedelta(minutes=20), in_event_id=bulk_in)
+    db = scan_db([checkout], [closed])
+
+    response, status = movement_service.process_security_scan('security_a', _scan('in'), db)
+
+    assert (response, status) == ({'message': 'Movement record is already checked in'}, 400)
+    assert _movement(db, movement['event_id'])['in_event_id'] == bulk_in
+    assert db.active_checkouts.documents == []
+
+
+def test_failed_check_in_close_restores_checkout(calls):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+    scan_in = _scan('in')
+
+    def in_event_taken(collection, operations):
+        # The IN event ID is recorded for this student by another movement.
+        collection.documents.append({'event_id': 'other', 'roll_no': 'R1', 'in_event_id': scan_in['event_id']})
+
+    db.movement_records.before_bulk_write = in_event_taken
+
+    results = _run(db, scan_in)
+
+    assert results == [movement_service.CONCURRENT_CHANGE_RESPONSE]
+    assert [c['_id'] for c in db.active_checkouts.documents] == [checkout['_id']]
+    assert calls.scheduled == ['R1']
+    assert calls.cancelled == []
+    assert calls.dispatched == []
+
+
+def test_failed_close_drops_the_check_out_after_it(calls):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+    scan_in, out = _scan('in'), _scan('out')
+
+    def in_event_taken(collection, operations):
+        collection.documents.append({'event_id': 'other', 'roll_no': 'R1', 'in_event_id': scan_in['event_id']})
+
+    db.movement_records.before_bulk_write = in_event_taken
+
+    results = _run(db, scan_in, out)
+
+    assert results == [movement_service.CONCURRENT_CHANGE_RESPONSE] * 2
+    assert _movement(db, out['event_id']) is None
+    assert [c['_id'] for c in db.active_checkouts.documents] == [checkout['_id']]
+    assert calls.dispatched == []
+
+
+def test_failed_check_out_insert_keeps_the_check_in(calls):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+    scan_in, out = _scan('in'), _scan('out')
+
+    def out_event_taken(collection, operations):
+        collection.documents.append({'event_id': out['event_id'], 'roll_no': 'R2'})
+
+    db.movement_records.before_bulk_write = out_event_taken
+
+    results = _run(db, scan_in, out)
+
+    assert results[0][1] == 200
+    assert results[1] == movement_service.CONCURRENT_CHANGE_RESPONSE
+    assert db.active_checkouts.documents == []
+    assert calls.cancelled == ['R1']
+    assert calls.dispatched == [movement['event_id']]
+
+
+def test_check_out_slot_taken_meanwhile_removes_its_movement(calls):
+    db = scan_db()
+    out = _scan('out')
+    other = {'_id': 'elsewhere', 'roll_no': 'R1', 'movement_id': 'other-out'}
+
+    def checked_out_elsewhere(collection, operations):
+        collection.documents.append(other)
+
+    db.active_checkouts.before_bulk_write = checked_out_elsewhere
+
+    results = _run(db, out)
+
+    assert results == [movement_service.CONCURRENT_CHANGE_RESPONSE]
+    assert _movement(db, out['event_id']) is None
+    assert db.active_checkouts.documents == [other]
+    assert calls.scheduled == []
+    assert calls.dispatched == []
+
+
+@pytest.mark.parametrize('timestamp', ['yesterday', [1], True, 10 ** 20])
+def test_invalid_offline_timestamp_rejects_only_that_scan(calls, timestamp):
+    db = scan_db()
+
+    results = _run(
+        db,
+        {'roll_no': 'R1', 'action': 'in', 'offline_sync': True, 'original_timestamp': timestamp},
+        _scan('in')
+    )
+
+    assert results[0][1] == 400
+    assert 'original_timestamp' in results[0][0]['message']
+    assert results[1] == ({'message': 'No active check out record found'}, 400)
+
+
+@pytest.mark.parametrize('roll_no', [12345, None, ['R1'], {'roll_no': 'R1'}])
+def test_invalid_roll_no_rejects_only_that_scan(calls, roll_no):
+    checkout, movement = _open_checkout()
+    db = scan_db([checkout], [movement])
+
+    results = _run(db, dict(_scan('in'), roll_no=roll_no), _scan('in'))
+
+    assert results[0][1] == 400
+    assert results[1][1] == 200
+
+
+def test_replayed_check_in_without_in_event_index_keeps_next_movement_open(calls, monkeypatch):
+    monkeypatch.setattr(movement_service, '_in_event_index_ready', False)
+    checkout, movement = _open_checkout()
+    replayed_in = f"in-{uuid.uuid4()}"
+    closed = dict(
+        movement, event_id=f"out-{uuid.uuid4()}", in_event_id=replayed_in,
+        in_time=movement['out_time'] - timedelta(hours=1)
+    )
+    db = scan_db([checkout], [closed, movement])
+    db.movement_records.unique = [('event_id',)]
+
+    response, status = movement_service.process_security_scan('security_a', _scan('in', replayed_in), db)
+
+    assert status == 200
+    assert _movement(db, movement['event_id'])['in_time'] is None
+    assert [c['_id'] for c in db.active_checkouts.documents] == [checkout['_id']]
@@ -0,0 +1,62 @@
+"""Group commit buffer: timeouts never leave a write behind"""
+
+import threading
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from utils.group_commit import GroupCommitBuffer, GroupCommitTimeout
+
+
+class FakeCollection:
+    def __init__(self, release=None):
+        self.release = release
+        self.batches = []
+
+    def insert_many(self, documents, ordered=True):
+        if self.release is not None:
+            self.release.wait()
+        for number, document in enumerate(documents):
+            document.setdefault('_id', f'id-{len(self.batches)}-{number}')
+        self.batches.append(list(documents))
+
+
+def test_timeout_while_queued_withdraws_the_document():
+    collection = FakeCollection()
+    buffer = GroupCommitBuffer(lambda: collection, ack_timeout=0.05)
+
+    # No flusher yet: the document stays queued past the timeout
+    with pytest.raises(GroupCommitTimeout):
+        buffer.insert({'roll_no': 'R1'})
+
+    buffer.start()
+    assert buffer.insert({'roll_no': 'R2'}) == 'id-0-0'
+    assert [[document['roll_no'] for document in batch] for batch in collection.batches] == [['R2']]
+    assert buffer.stats()['timeouts'] == 1
+
+
+def test_timeout_during_commit_waits_for_the_outcome():
+    release = threading.Event()
+    collection = FakeCollection(release)
+    buffer = GroupCommitBuffer(lambda: collection, max_wait_ms=0, ack_timeout=0.05)
+    buffer.start()
+
+    threading.Timer(0.2, release.set).start()
+
+    assert buffer.insert({'roll_no': 'R1'}) == 'id-0-0'
+    assert buffer.stats()['timeouts'] == 0
+
+
+def test_submit_to_two_buffers_before_waiting():
+    visits, alerts = FakeCollection(), FakeCollection()
+    visit_buffer = GroupCommitBuffer(lambda: visits, max_wait_ms=0)
+    alert_buffer = GroupCommitBuffer(lambda: alerts, max_wait_ms=0)
+    visit_buffer.start()
+    alert_buffer.start()
+
+    visit = visit_buffer.submit({'roll_no': 'R1'})
+    alert = alert_buffer.submit({'type': 'unauthorized_visit'})
+
+    assert visit_buffer.wait(visit) == 'id-0-0'
+    assert alert_buffer.wait(alert) == 'id-0-0'
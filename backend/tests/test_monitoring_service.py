@@ -0,0 +1,176 @@
+"""Violation monitor: deadline checks off the scheduler thread, alert outcomes"""
+
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+monitoring_service = pytest.importorskip('services.monitoring_service')
+notification_service = pytest.importorskip('services.notification_service')
+
+from services.notification_service import ALERT_FAILED, ALERT_SENT, ALERT_SKIPPED
+
+
+SUPERVISOR = {'username': 'super_a', 'role': 'super', 'device_id': 'DEV1'}
+
+
+class FakeDevices:
+    def find_one(self, query, *args, **kwargs):
+        return {'device_id': 'DEV1', 'is_active': True, 'fcm_token': 'token'}
+
+
+@pytest.fixture
+def firebase(monkeypatch):
+    monkeypatch.setattr(notification_service, 'initialize_firebase', lambda: None)
+    monkeypatch.setattr(notification_service, 'get_supervisor_for_hostel', lambda hostel: SUPERVISOR)
+    monkeypatch.setattr(notification_service, 'get_db', lambda: SimpleNamespace(devices=FakeDevices()))
+    sent = []
+    monkeypatch.setattr(notification_service.messaging, 'send', lambda message: sent.append(message) or 'msg-1')
+    return sent
+
+
+def _alert(hostel='A'):
+    return notification_service.send_hostel_alert(hostel, 'R1', 'Asha', 12.5)
+
+
+def test_hostel_alert_sent(firebase):
+    assert _alert() == ALERT_SENT
+    assert len(firebase) == 1
+
+
+def test_hostel_alert_skipped_without_a_device_to_notify(firebase, monkeypatch):
+    assert _alert(hostel='Z') == ALERT_SKIPPED
+
+    monkeypatch.setattr(notification_service, 'get_supervisor_for_hostel', lambda hostel: None)
+    assert _alert() == ALERT_SKIPPED
+    assert firebase == []
+
+
+def test_hostel_alert_failed_when_fcm_rejects(firebase, monkeypatch):
+    def reject(message):
+        raise RuntimeError('unregistered token')
+
+    monkeypatch.setattr(notification_service.messaging, 'send', reject)
+
+    assert _alert() == ALERT_FAILED
+
+
+def _checkout(roll_no, hostel='A'):
+    return {
+        '_id': f'C-{roll_no}',
+        'roll_no': roll_no,
+        'student_name': 'Asha',
+        'student_hostel': hostel,
+        'deadline': datetime(2026, 1, 1, 18, 0)
+    }
+
+
+VIOLATION = {
+    'exceeded_minutes': 12.5,
+    'allowed_minutes': 120,
+    'out_time_utc': datetime(2026, 1, 1, 16, 0)
+}
+
+
+def test_notify_violation_reports_the_alert_status(monkeypatch):
+    monkeypatch.setattr(monitoring_service, 'send_hostel_alert', lambda **kwargs: ALERT_SKIPPED)
+    monkeypatch.setattr(monitoring_service, 'emit_violation_alert', lambda alert: None)
+
+    outcome = monitoring_service._notify_violation(_checkout('R1'), VIOLATION, None, datetime(2026, 1, 1, 18, 30))
+
+    assert outcome == {'fcm': ALERT_SKIPPED, 'websocket': True}
+
+
+def test_notifications_are_keyed_by_student(monkeypatch):
+    keys = []
+
+    class RecordingExecutor:
+        def submit(self, key, fn, *args):
+            keys.append(key)
+            return Future()
+
+    monkeypatch.setattr(monitoring_service, '_violation_effects', RecordingExecutor())
+
+    for roll_no in ('R1', 'R2', 'R3'):
+        monitoring_service._dispatch_violation(_checkout(roll_no), VIOLATION, None, datetime(2026, 1, 1, 18, 30))
+
+    assert keys == ['R1', 'R2', 'R3']
+
+
+class FakeActiveCheckouts:
+    def __init__(self, checkouts):
+        self.checkouts = checkouts
+
+    def find(self, query, projection=None):
+        return SimpleNamespace(sort=lambda field, direction: list(self.checkouts))
+
+
+def test_sweep_counts_skipped_and_failed_separately(monkeypatch):
+    outcomes = [
+        {'fcm': ALERT_SENT, 'websocket': True},
+        {'fcm': ALERT_SKIPPED, 'websocket': True},
+        {'fcm': ALERT_SKIPPED, 'websocket': True},
+        {'fcm': ALERT_FAILED, 'websocket': True},
+        {'fcm': ALERT_SENT, 'websocket': False}
+    ]
+
+    def process(checkouts, now_utc, db):
+        futures = []
+        for outcome in outcomes:
+            future = Future()
+            future.set_result(outcome)
+            futures.append(future)
+        return len(checkouts), futures
+
+    monkeypatch.setattr(monitoring_service, '_process_violations', process)
+    db = SimpleNamespace(active_checkouts=FakeActiveCheckouts([_checkout(f'R{i}') for i in range(5)]))
+
+    assert monitoring_service.monitor_active_checkouts(db) == 5
+
+    last_sweep = monitoring_service.get_violation_monitor_stats()['last_sweep']
+    assert last_sweep['notified'] == 5
+    assert last_sweep['notify_failed'] == 2
+    assert last_sweep['notify_skipped'] == 2
+    assert last_sweep['notify_pending'] == 0
+
+
+def test_expired_deadline_is_checked_off_the_scheduler_thread(monkeypatch):
+    checked = []
+    monkeypatch.setattr(monitoring_service.leader_lease, 'is_leader', lambda: True)
+    monkeypatch.setattr(
+        monitoring_service, 'check_checkout_deadline',
+        lambda roll_no: checked.append((roll_no, threading.current_thread().name))
+    )
+
+    monitoring_service._on_deadline('R1')
+    monitoring_service._deadline_checks.submit('R1', lambda: None).result(timeout=5)
+
+    (roll_no, thread_name), = checked
+    assert roll_no == 'R1'
+    assert thread_name.startswith('deadline-checks')
+
+
+def test_follower_ignores_expired_deadlines(monkeypatch):
+    monkeypatch.setattr(monitoring_service.leader_lease, 'is_leader', lambda: False)
+    submitted_before = monitoring_service._deadline_checks.stats()['submitted']
+
+    monitoring_service._on_deadline('R1')
+
+    assert monitoring_service._deadline_checks.stats()['submitted'] == submitted_before
+
+
+def test_full_deadline_pool_does_not_block_the_scheduler_thread(monkeypatch):
+    release = threading.Event()
+    checks = monitoring_service.KeyedExecutor(max_workers=1, max_pending=1)
+    monkeypatch.setattr(monitoring_service, '_deadline_checks', checks)
+    monkeypatch.setattr(monitoring_service.leader_lease, 'is_leader', lambda: True)
+    monkeypatch.setattr(monitoring_service, 'check_checkout_deadline', lambda roll_no: release.wait(5))
+
+    monitoring_service._on_deadline('R1')
+    monitoring_service._on_deadline('R2')
+    release.set()
+
+    assert checks.stats()['submitted'] == 1
+    assert checks.stats()['rejected'] == 1
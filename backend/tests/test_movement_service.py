@@ -0,0 +1,91 @@
+"""Single-scan check-out: the movement is recorded before the checkout"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pymongo')
+movement_service = pytest.importorskip('services.movement_service')
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+
+class FakeCollection:
+    def __init__(self, duplicate=False, existing=None):
+        self.duplicate = duplicate
+        self.existing = existing
+        self.inserted = []
+        self.deleted = []
+
+    def insert_one(self, document):
+        if self.duplicate:
+            raise DuplicateKeyError('E11000 duplicate key')
+        document.setdefault('_id', ObjectId())
+        self.inserted.append(document)
+        return SimpleNamespace(inserted_id=document['_id'])
+
+    def delete_one(self, query):
+        self.deleted.append(query)
+
+    def find_one(self, query, projection=None):
+        return self.existing
+
+
+STUDENT = {'roll_no': 'R1', 'name': 'Test Student', 'hostel': 'A'}
+
+
+@pytest.fixture(autouse=True)
+def quiet_side_effects(monkeypatch):
+    monkeypatch.setattr(movement_service, 'schedule_checkout_deadline', lambda roll_no, deadline: None)
+    monkeypatch.setattr(movement_service, 'dispatch_effects', lambda event_id, effects, db: None)
+
+
+def _check_out(db, event_id='E1'):
+    return movement_service._process_check_out(
+        STUDENT, 'R1', datetime.now(timezone.utc), 'security_a', False, event_id, db
+    )
+
+
+def test_replayed_out_event_never_creates_a_checkout():
+    recorded = {'event_id': 'E1', 'roll_no': 'R1', 'out_time': datetime(2026, 1, 1), 'in_time': None}
+    db = SimpleNamespace(
+        movement_records=FakeCollection(duplicate=True, existing=recorded),
+        active_checkouts=FakeCollection()
+    )
+
+    response, status = _check_out(db)
+
+    assert status == 200
+    assert response['already_processed']
+    assert db.active_checkouts.inserted == []
+    assert db.active_checkouts.deleted == []
+
+
+def test_student_already_outside_removes_only_the_new_movement():
+    db = SimpleNamespace(
+        movement_records=FakeCollection(),
+        active_checkouts=FakeCollection(
+            duplicate=True,
+            existing={'movement_id': 'OTHER', 'out_time': datetime(2026, 1, 1)}
+        )
+    )
+
+    response, status = _check_out(db)
+
+    movement, = db.movement_records.inserted
+    assert db.movement_records.deleted == [{'_id': movement['_id']}]
+    assert db.active_checkouts.deleted == []
+    assert status == 400
+    assert response['message'] == 'Student is already checked out'
+
+
+def test_check_out_records_movement_then_checkout():
+    db = SimpleNamespace(movement_records=FakeCollection(), active_checkouts=FakeCollection())
+
+    response, status = _check_out(db)
+
+    assert status == 200
+    assert db.movement_records.inserted[0]['event_id'] == 'E1'
+    assert db.active_checkouts.inserted[0]['movement_id'] == 'E1'
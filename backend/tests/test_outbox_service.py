@@ -0,0 +1,66 @@
+"""Outbox retries: failures are counted and parked after MAX_ATTEMPTS"""
+
+from types import SimpleNamespace
+
+import pytest
+
+outbox_service = pytest.importorskip('services.outbox_service')
+
+
+class FakeMovements:
+    def __init__(self):
+        self.updates = []
+
+    def update_one(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=1)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    def failing_handler(payload, db):
+        raise RuntimeError('socket closed')
+
+    monkeypatch.setitem(outbox_service._handlers, 'test_failing', failing_handler)
+    monkeypatch.setitem(outbox_service._handlers, 'test_ok', lambda payload, db: None)
+    return SimpleNamespace(movement_records=FakeMovements())
+
+
+def test_failure_increments_attempts(db):
+    effect = outbox_service.new_effect('test_failing', {})
+
+    outbox_service._run_effect('E1', effect, db)
+
+    assert db.movement_records.updates == [(
+        {'event_id': 'E1', 'pending_effects.effect_id': effect['effect_id']},
+        {'$inc': {'pending_effects.$.attempts': 1}}
+    )]
+
+
+def test_last_attempt_parks_the_entry(db):
+    effect = dict(outbox_service.new_effect('test_failing', {}), attempts=outbox_service.MAX_ATTEMPTS - 1)
+    parked_before = outbox_service.get_outbox_stats()['parked']
+
+    outbox_service._run_effect('E1', effect, db)
+
+    (query, update), = db.movement_records.updates
+    assert query == {'event_id': 'E1', 'pending_effects.effect_id': effect['effect_id']}
+    assert update['$pull'] == {'pending_effects': {'effect_id': effect['effect_id']}}
+    parked = update['$push']['dead_effects']
+    assert parked['attempts'] == outbox_service.MAX_ATTEMPTS
+    assert parked['last_error'] == 'RuntimeError: socket closed'
+    assert outbox_service.get_outbox_stats()['parked'] == parked_before + 1
+
+
+def test_success_removes_the_entry(db):
+    effect = outbox_service.new_effect('test_ok', {})
+
+    outbox_service._run_effect('E1', effect, db)
+
+    assert db.movement_records.updates == [(
+        {'event_id': 'E1'},
+        {'$pull': {'pending_effects': {'effect_id': effect['effect_id']}}}
+    )]
+    stats = outbox_service.get_outbox_stats()
+    assert stats['queue_depth'] == 0
+    assert stats['in_flight'] == 0
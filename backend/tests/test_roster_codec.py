@@ -0,0 +1,141 @@
+"""Binary roster codec: round trip, lookups and corrupt input"""
+
+import gzip
+import json
+import random
+import struct
+
+import pytest
+
+from utils.roster_codec import (
+    FORMAT_VERSION,
+    RosterFormatError,
+    RosterView,
+    decode_roster,
+    encode_roster
+)
+
+
+def _roster(count, seed=7):
+    rng = random.Random(seed)
+    students = [
+        {
+            'roll_no': f'{rng.choice(["21", "22", "23"])}{rng.choice(["CS", "EC", "ME"])}{i:05d}',
+            'name': f'{rng.choice(["Aarav", "Diya", "Meera"])} {rng.choice(["Iyer", "Nair", "Das"])}',
+            'hostel': rng.choice(['A', 'B', 'C', 'D'])
+        }
+        for i in range(count)
+    ]
+    rng.shuffle(students)
+    return students
+
+
+def _by_roll_no(students):
+    return sorted(students, key=lambda student: student['roll_no'].encode('utf-8'))
+
+
+def test_round_trip():
+    students = _roster(2000)
+
+    version, decoded = decode_roster(encode_roster(students, roster_version=42))
+
+    assert version == 42
+    assert decoded == _by_roll_no(students)
+
+
+def test_empty_roster():
+    data = encode_roster([], 0)
+
+    assert decode_roster(data) == (0, [])
+    assert RosterView(data).find('R1') is None
+
+
+def test_non_ascii_and_missing_fields():
+    students = [
+        {'roll_no': 'R2', 'name': 'Zoë Ñúñez', 'hostel': 'B'},
+        {'roll_no': 'RÅ1', 'name': '陈伟', 'hostel': 'Ä'},
+        {'roll_no': 'R1'}
+    ]
+
+    version, decoded = decode_roster(encode_roster(students, 2 ** 40))
+
+    assert version == 2 ** 40
+    assert decoded == [
+        {'roll_no': 'R1', 'name': '', 'hostel': ''},
+        {'roll_no': 'R2', 'name': 'Zoë Ñúñez', 'hostel': 'B'},
+        {'roll_no': 'RÅ1', 'name': '陈伟', 'hostel': 'Ä'}
+    ]
+
+
+def test_roll_numbers_sharing_long_prefixes():
+    students = [
+        {'roll_no': 'X' * 300 + suffix, 'name': suffix, 'hostel': 'A'}
+        for suffix in ('', 'a', 'ab', 'b')
+    ]
+
+    assert decode_roster(encode_roster(students))[1] == _by_roll_no(students)
+
+
+def test_lookups():
+    students = _roster(1000)
+    view = RosterView(encode_roster(students))
+
+    assert len(view) == 1000
+    for student in students:
+        assert view.find(student['roll_no']) == student
+    assert view.find('NOT-A-ROLL') is None
+    assert view.find('') is None
+    assert view.find('99ZZ99999') is None
+
+
+def test_smaller_than_gzipped_json():
+    students = _roster(5000)
+    json_body = json.dumps({'students': students}, separators=(',', ':')).encode('utf-8')
+    binary_body = encode_roster(students)
+
+    assert len(binary_body) < len(json_body)
+    assert len(gzip.compress(binary_body)) < len(gzip.compress(json_body))
+
+
+def test_nul_in_value_is_rejected():
+    with pytest.raises(RosterFormatError):
+        encode_roster([{'roll_no': 'R1', 'name': 'A\x00B', 'hostel': 'A'}])
+
+
+def _corrupt(data, offset, value):
+    return data[:offset] + bytes([value]) + data[offset + 1:]
+
+
+def _valid():
+    return encode_roster([
+        {'roll_no': 'R1', 'name': 'One', 'hostel': 'A'},
+        {'roll_no': 'R2', 'name': 'Two', 'hostel': 'B'}
+    ], 5)
+
+
+# Header (20 bytes), then the dictionary: entries, then 'A' and 'B' as length + byte
+_HOSTEL_COLUMN = 20 + 1 + 2 + 2
+_PREFIX_COLUMN = _HOSTEL_COLUMN + 2
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'RSTR',
+    b'JSON' + bytes(20),
+    struct.pack('<4sHHQI', b'RSTR', FORMAT_VERSION - 1, 0, 0, 0) + b'\x00' + bytes(8),
+    _valid()[:-1],
+    _valid()[:_HOSTEL_COLUMN + 1],
+    _valid() + b'\x00',
+    _corrupt(_valid(), _HOSTEL_COLUMN, 7),
+    _corrupt(_valid(), _PREFIX_COLUMN + 1, 200),
+    _valid().replace(b'One', b'\xff\xfe\xfd'),
+    _valid().replace(b'One\x00Two', b'OneXTwo'),
+    _valid().replace(b'R1\x002', b'R3\x002'),
+], ids=[
+    'empty', 'header-only-magic', 'bad-magic', 'old-version', 'truncated-name',
+    'truncated-column', 'trailing-byte', 'hostel-index', 'roll-prefix',
+    'invalid-utf8', 'row-count', 'unsorted'
+])
+def test_corrupt_input_raises_format_error(data):
+    with pytest.raises(RosterFormatError):
+        decode_roster(data)
@@ -0,0 +1,80 @@
+"""Copy-on-write roster filters and rebuilds outside the lock"""
+
+from types import SimpleNamespace
+
+import pytest
+
+roster_filter_service = pytest.importorskip('services.roster_filter_service')
+
+
+class FakeDirectory:
+    def __init__(self, roll_nos):
+        self.loaded = True
+        self.roll_nos = list(roll_nos)
+
+    def entries(self, hostel):
+        return [SimpleNamespace(roll_no=roll_no, hostel=hostel) for roll_no in self.roll_nos]
+
+    def add_listener(self, listener):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(roster_filter_service, 'student_directory', FakeDirectory(['A001', 'A002']))
+    monkeypatch.setattr(roster_filter_service, 'get_roster_version', lambda db: 7)
+    return roster_filter_service.RosterFilterStore()
+
+
+def test_incremental_add_installs_a_copy(store):
+    served = store.get('A', db=object())
+    served_bits = bytes(served.bits)
+
+    store._on_student_change('upsert', {'roll_no': 'A003', 'hostel': 'A', 'roster_version': 9}, None)
+
+    assert bytes(served.bits) == served_bits
+    assert served.roster_version == 7
+
+    current = store.get('A', db=object())
+    assert current is not served
+    assert 'A003' in current
+    assert current.roster_version == 9
+    assert current.to_bytes() != served.to_bytes()
+    assert store.builds == 1
+
+
+def test_stamp_only_change_bumps_version(store):
+    served = store.get('A', db=object())
+    previous = SimpleNamespace(roll_no='A001', hostel='A')
+
+    store._on_student_change('upsert', {'roll_no': 'A001', 'hostel': 'A', 'roster_version': 8}, previous)
+
+    current = store.get('A', db=object())
+    assert current.roster_version == 8
+    assert current.bits == served.bits
+    assert store.incremental_adds == 0
+
+
+def test_roster_version_is_read_outside_the_lock(store, monkeypatch):
+    def get_roster_version(db):
+        assert not store._lock.locked()
+        return 7
+
+    monkeypatch.setattr(roster_filter_service, 'get_roster_version', get_roster_version)
+
+    assert store.get('B', db=object()).roster_version == 7
+
+
+def test_change_during_build_keeps_hostel_stale(store, monkeypatch):
+    def get_roster_version(db):
+        store._on_student_change('delete', None, SimpleNamespace(roll_no='A002', hostel='A'))
+        return 7
+
+    monkeypatch.setattr(roster_filter_service, 'get_roster_version', get_roster_version)
+    store.get('A', db=object())
+
+    monkeypatch.setattr(roster_filter_service, 'get_roster_version', lambda db: 8)
+    rebuilt = store.get('A', db=object())
+
+    assert store.builds == 2
+    assert rebuilt.roster_version == 8
@@ -0,0 +1,135 @@
+"""Roster reconcile: the pipeline stamp matches the stamp written per student"""
+
+from types import SimpleNamespace
+
+import pytest
+
+roster_service = pytest.importorskip('services.roster_service')
+
+_MISSING = object()
+
+
+def _evaluate(expression, document):
+    """The subset of aggregation expressions ROSTER_STAMP_EXPRESSION uses"""
+    if isinstance(expression, str) and expression.startswith('$'):
+        return document.get(expression[1:], _MISSING)
+    if isinstance(expression, dict) and '$ifNull' in expression:
+        value, replacement = expression['$ifNull']
+        value = _evaluate(value, document)
+        return replacement if value is _MISSING or value is None else value
+    if isinstance(expression, dict):
+        # Object expressions drop fields that evaluate to missing
+        evaluated = {field: _evaluate(value, document) for field, value in expression.items()}
+        return {field: value for field, value in evaluated.items() if value is not _MISSING}
+    return expression
+
+
+class FakeStudents:
+    def __init__(self, documents):
+        self.documents = documents
+        self.updates = []
+        self.stale = []
+
+    def find_one(self, query, projection=None):
+        return None
+
+    def find(self, query, projection=None):
+        stored, expression = query['$expr']['$ne']
+        self.stale = [
+            dict(document) for document in self.documents
+            if _evaluate(stored, document) != _evaluate(expression, document)
+        ]
+        return self.stale
+
+    def update_one(self, query, update):
+        self.updates.append((query, update))
+        document = next(document for document in self.documents if document['_id'] == query['_id'])
+        document.update(update['$set'])
+        return SimpleNamespace(matched_count=1)
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    allocated = iter(range(100, 200))
+    monkeypatch.setattr(roster_service, '_allocate_version', lambda db: next(allocated))
+    monkeypatch.setattr(roster_service, '_commit_version', lambda db, version: None)
+    monkeypatch.setattr(roster_service, '_notify', lambda *args, **kwargs: None)
+    monkeypatch.setattr(roster_service, 'get_roster_version', lambda db=None: 0)
+
+
+def test_stamp_expression_matches_current_stamp():
+    for document in (
+        {'roll_no': 'R1', 'name': 'Asha', 'hostel': 'A'},
+        {'roll_no': 'R1', 'hostel': 'A'},
+        {'roll_no': 'R1', 'name': None, 'hostel': 'A'}
+    ):
+        assert _evaluate(roster_service.ROSTER_STAMP_EXPRESSION, document) == roster_service._current_stamp(document)
+
+
+def test_student_without_name_is_not_stale_once_stamped(versions):
+    students = FakeStudents([{'_id': 1, 'roll_no': 'R1', 'hostel': 'A'}])
+    db = SimpleNamespace(students=students)
+
+    assert roster_service.reconcile_roster(db) == 1
+    assert roster_service.reconcile_roster(db) == 0
+    assert students.stale == []
+
+    (_, update), = students.updates
+    assert update['$set']['roster_stamp'] == {'roll_no': 'R1', 'name': None, 'hostel': 'A'}
+
+
+@pytest.fixture
+def pushes(monkeypatch):
+    pushes = []
+    monkeypatch.setattr(roster_service, '_pushed_stamps', {})
+    monkeypatch.setattr(roster_service, '_push_baseline', 10)
+    monkeypatch.setattr(roster_service, '_known_version', None)
+    monkeypatch.setattr(roster_service, '_notify', lambda *args: pushes.append(args))
+    return pushes
+
+
+def _stamped(version, **stamp):
+    stamp = dict({'roll_no': 'R1', 'name': 'Asha', 'hostel': 'A'}, **stamp)
+    return dict(stamp, _id=1, roster_version=version, roster_stamp=dict(stamp))
+
+
+def test_move_seen_by_follower_pushes_delete_then_upsert(pushes):
+    roster_service._push_directory_change('update', _stamped(11), None)
+    roster_service._push_directory_change('update', dict(_stamped(11), hostel='B'), None)
+    roster_service._push_directory_change('update', _stamped(12, hostel='B'), None)
+
+    assert pushes == [
+        ('upsert', 'A', 11, {'roll_no': 'R1', 'name': 'Asha', 'hostel': 'A'}),
+        ('delete', 'A', 12, {'roll_no': 'R1', 'hostel': 'A'}),
+        ('upsert', 'B', 12, {'roll_no': 'R1', 'name': 'Asha', 'hostel': 'B'})
+    ]
+
+
+def test_unrelated_update_pushes_nothing(pushes):
+    roster_service._push_directory_change('update', _stamped(11), None)
+    roster_service._push_directory_change('update', dict(_stamped(11), phone='123'), None)
+
+    assert len(pushes) == 1
+
+
+def test_change_stamped_before_start_is_not_pushed(pushes):
+    roster_service._push_directory_change('update', _stamped(10), None)
+
+    assert pushes == []
+
+
+def test_delete_pushes_with_the_known_version(pushes):
+    roster_service._remember_version(14)
+    entry = SimpleNamespace(roll_no='R1', hostel='A')
+
+    roster_service._push_directory_change('delete', None, entry)
+
+    assert pushes == [('delete', 'A', 14, {'roll_no': 'R1', 'hostel': 'A'})]
+
+
+def test_directory_stamps_advance_the_known_version(pushes):
+    roster_service._remember_directory_version('update', _stamped(11), None)
+    roster_service._remember_directory_version('update', _stamped(9), None)
+    roster_service._remember_directory_version('insert', {'_id': 2, 'roll_no': 'R2'}, None)
+
+    assert roster_service.get_known_roster_version() == 11
@@ -0,0 +1,101 @@
+"""Student directory: stream before reload, resync only on a real change"""
+
+import pytest
+
+student_directory_module = pytest.importorskip('services.student_directory')
+
+from services.student_directory import StudentDirectory
+
+
+class FakeCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+class FakeStream(list):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeStudents:
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = []
+        self.changes = []
+
+    def find(self, query, projection=None):
+        self.calls.append('find')
+        return FakeCursor(dict(document) for document in self.documents)
+
+    def watch(self, pipeline, full_document=None):
+        self.calls.append('watch')
+        return FakeStream(self.changes)
+
+
+class FakeDb:
+    def __init__(self, documents):
+        self.students = FakeStudents(documents)
+
+
+def _student(student_id, roll_no, name, hostel='A'):
+    return {'_id': student_id, 'roll_no': roll_no, 'name': name, 'hostel': hostel}
+
+
+@pytest.fixture
+def directory():
+    directory = StudentDirectory()
+    notifications = []
+    directory.add_listener(lambda operation, document, previous_entry: notifications.append(operation))
+    directory.notifications = notifications
+    return directory
+
+
+def test_unchanged_reload_does_not_resync(directory):
+    db = FakeDb([_student(1, 'R1', 'Asha'), _student(2, 'R2', 'Ravi')])
+
+    directory.load(db)
+    directory.load(db)
+    directory.load(db)
+
+    assert directory.notifications == ['resync']
+
+
+def test_changed_reload_resyncs(directory):
+    db = FakeDb([_student(1, 'R1', 'Asha'), _student(2, 'R2', 'Ravi')])
+    directory.load(db)
+
+    db.students.documents[1]['name'] = 'Ravi Kumar'
+    directory.load(db)
+
+    assert directory.notifications == ['resync', 'resync']
+    assert directory.get('R2').name == 'Ravi Kumar'
+
+
+def test_reload_reports_missed_deletes(directory):
+    db = FakeDb([_student(1, 'R1', 'Asha'), _student(2, 'R2', 'Ravi')])
+    directory.load(db)
+
+    del db.students.documents[1]
+    directory.load(db)
+
+    assert directory.notifications == ['resync', 'delete', 'resync']
+
+
+def test_stream_is_opened_before_the_reload(directory):
+    db = FakeDb([_student(1, 'R1', 'Asha')])
+    db.students.changes = [{
+        'operationType': 'insert',
+        'documentKey': {'_id': 2},
+        'fullDocument': _student(2, 'R2', 'Ravi')
+    }]
+    directory.add_listener(lambda operation, document, previous_entry: directory.stop())
+
+    directory._watch(db)
+
+    assert db.students.calls == ['watch', 'find']
+    assert directory.mode == 'change_stream'
+    assert directory.notifications == ['resync', 'insert']
+    assert directory.get('R2').name == 'Ravi'
@@ -0,0 +1,86 @@
+"""Offline sync: per-chunk scan fallback, malformed scans and replayed chunks"""
+
+from types import SimpleNamespace
+
+import pytest
+
+sync_service = pytest.importorskip('services.sync_service')
+sync_session_service = pytest.importorskip('services.sync_session_service')
+
+from fake_mongo import FakeCollection
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    calls = {'bulk': [], 'single': []}
+
+    def bulk(user_role, scans, db):
+        calls['bulk'].append([dict(scan) for scan in scans])
+        if len(calls['bulk']) == 2:
+            raise RuntimeError('connection reset')
+        return [({'engine': 'bulk', 'event_id': scan['event_id']}, 200) for scan in scans]
+
+    def single(user_role, data, db):
+        calls['single'].append(dict(data))
+        return {'engine': 'single', 'event_id': data['event_id']}, 200
+
+    monkeypatch.setattr(sync_service, 'BULK_CHUNK_SIZE', 2)
+    monkeypatch.setattr(sync_service, 'process_security_scans_bulk', bulk)
+    monkeypatch.setattr(sync_service, 'process_security_scan', single)
+    return calls
+
+
+def test_only_the_failed_chunk_falls_back(engine):
+    scans = [{'roll_no': f'R{i}', 'action': 'out'} for i in range(5)]
+
+    results = sync_service.sync_security_scans(scans, 'security_a', db=object())
+
+    assert [result['engine'] for result in results] == ['bulk', 'bulk', 'single', 'single', 'bulk']
+    assert [scan['roll_no'] for scan in engine['single']] == ['R2', 'R3']
+    # The retry replays the event IDs the failed bulk attempt used
+    assert [scan['event_id'] for scan in engine['single']] == \
+        [scan['event_id'] for scan in engine['bulk'][1]]
+    assert all(result['success'] for result in results)
+
+
+def test_client_event_ids_are_kept(engine):
+    results = sync_service.sync_security_scans(
+        [{'roll_no': 'R1', 'action': 'out', 'event_id': 'device-1'}], 'security_a', db=object()
+    )
+
+    assert results[0]['event_id'] == 'device-1'
+
+
+def test_unhashable_roll_no_fails_only_that_scan(engine):
+    results = sync_service.sync_security_scans([
+        {'roll_no': ['R1'], 'action': 'out'},
+        {'roll_no': {'$ne': None}, 'action': 'out'},
+        {'roll_no': 'R1', 'action': 'out'}
+    ], 'security_a', db=object())
+
+    assert results[0] == {'success': False, 'error': 'Invalid roll number'}
+    assert results[1] == {'success': False, 'error': 'Invalid roll number'}
+    assert results[2]['success']
+
+
+def test_reapplied_canteen_chunk_records_each_visit_once(monkeypatch):
+    alerted = []
+    monkeypatch.setattr(
+        sync_service.student_directory, 'get_many',
+        lambda roll_nos, db=None: {roll_no: {'roll_no': roll_no, 'name': 'Asha', 'hostel': 'B'} for roll_no in roll_nos}
+    )
+    monkeypatch.setattr(sync_service, 'create_unauthorized_alerts', lambda visits, db: alerted.extend(visits))
+    db = SimpleNamespace(canteen_visits=FakeCollection('canteen_visits', unique=[('event_id',)]))
+    chunk = [{'roll_no': 'R1'}, {'roll_no': 'R2', 'event_id': 'device-2'}]
+
+    first = sync_service.sync_canteen_visits(
+        sync_session_service._with_event_ids(chunk, 'session-1', 0), 'canteen_a', db
+    )
+    again = sync_service.sync_canteen_visits(
+        sync_session_service._with_event_ids(chunk, 'session-1', 0), 'canteen_a', db
+    )
+
+    assert [visit['event_id'] for visit in db.canteen_visits.documents] == ['session-1:0:0', 'device-2']
+    assert all(result['success'] for result in first + again)
+    assert [result.get('already_recorded') for result in again] == [True, True]
+    assert len(alerted) == 2
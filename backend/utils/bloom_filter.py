@@ -0,0 +1,144 @@
+# utils/bloom_filter.py
+"""
+Bloom Filter - Compact roll number membership test for offline devices
+
+A device holding one filter per hostel can tell, without the roster,
+that a roll number is certainly NOT in a hostel, or is in it with a
+false-positive rate of about `false_positive_rate` (1% by default,
+~9.6 bits per student, so a 2,500 student hostel fits in ~3 KB).
+There are no false negatives.
+
+Hashing (what a device has to reimplement):
+
+    digest = SHA-256(roll_no as UTF-8)
+    h1     = digest[0:8]  as little-endian u64
+    h2     = digest[8:16] as little-endian u64, with the lowest bit set
+    bit_i  = (h1 + i * h2) mod bit_count        for i in 0..hash_count-1
+
+Bit j of the filter is bit (j % 8) of byte j // 8 (LSB first).
+
+Serialized form (`application/x-roster-filter`), little-endian:
+
+    magic            4s   b'RBLM'
+    format_version   u8   1
+    hash_count       u8
+    reserved         u16  0
+    bit_count        u32
+    count            u32  roll numbers added
+    roster_version   u64
+    bits             ceil(bit_count / 8) bytes
+"""
+
+import hashlib
+import math
+import struct
+
+MAGIC = b'RBLM'
+FORMAT_VERSION = 1
+BLOOM_FILTER_MIMETYPE = 'application/x-roster-filter'
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+_HEADER = struct.Struct('<4sBBHIIQ')
+_U64_MASK = (1 << 64) - 1
+
+
+class BloomFilterError(ValueError):
+    """The data is not a filter this decoder understands"""
+
+
+def filter_size(capacity, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+    """Optimal (bit_count, hash_count) for capacity items at the given rate"""
+    capacity = max(1, capacity)
+    bit_count = math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))
+    bit_count = max(64, (bit_count + 7) // 8 * 8)
+    hash_count = max(1, round(bit_count / capacity * math.log(2)))
+    return bit_count, min(hash_count, 255)
+
+
+def _hash_pair(roll_no):
+    digest = hashlib.sha256(roll_no.encode('utf-8')).digest()
+    h1 = int.from_bytes(digest[0:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little') | 1
+    return h1, h2
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over roll numbers"""
+
+    def __init__(self, bit_count, hash_count, capacity=None, bits=None, count=0, roster_version=0):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.capacity = capacity
+        self.count = count
+        self.roster_version = roster_version
+        self.bits = bytearray(bits) if bits is not None else bytearray((bit_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        bit_count, hash_count = filter_size(capacity, false_positive_rate)
+        return cls(bit_count, hash_count, capacity=capacity)
+
+    @classmethod
+    def from_roll_numbers(cls, roll_nos, capacity=None, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        roll_nos = list(roll_nos)
+        bloom = cls.for_capacity(capacity or len(roll_nos), false_positive_rate)
+        for roll_no in roll_nos:
+            bloom.add(roll_no)
+        return bloom
+
+    def _positions(self, roll_no):
+        h1, h2 = _hash_pair(roll_no)
+        for i in range(self.hash_count):
+            yield ((h1 + i * h2) & _U64_MASK) % self.bit_count
+
+    def copy(self):
+        return BloomFilter(
+            self.bit_count, self.hash_count, capacity=self.capacity,
+            bits=self.bits, count=self.count, roster_version=self.roster_version
+        )
+
+    def add(self, roll_no):
+        for position in self._positions(roll_no):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, roll_no):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(roll_no)
+        )
+
+    @property
+    def full(self):
+        """True once more items were added than the filter was sized for"""
+        return self.capacity is not None and self.count > self.capacity
+
+    def expected_false_positive_rate(self):
+        """(1 - e^(-k n / m))^k for the items added so far"""
+        if self.count == 0:
+            return 0.0
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_count)) ** self.hash_count
+
+    def to_bytes(self):
+        return _HEADER.pack(
+            MAGIC, FORMAT_VERSION, self.hash_count, 0,
+            self.bit_count, self.count, self.roster_version
+        ) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < _HEADER.size:
+            raise BloomFilterError('Truncated filter header')
+
+        magic, version, hash_count, _reserved, bit_count, count, roster_version = \
+            _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise BloomFilterError('Not a roster filter (bad magic)')
+        if version != FORMAT_VERSION:
+            raise BloomFilterError(f'Unsupported filter format version {version}')
+
+        bits = data[_HEADER.size:]
+        if len(bits) != (bit_count + 7) // 8 or hash_count == 0:
+            raise BloomFilterError('Filter size does not match its header')
+
+        return cls(bit_count, hash_count, bits=bits, count=count, roster_version=roster_version)
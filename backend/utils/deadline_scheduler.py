@@ -0,0 +1,124 @@
+# utils/deadline_scheduler.py
+"""
+Deadline Scheduler - Run a callback for a key when its deadline passes
+
+A min-heap of (deadline, key) served by one thread that sleeps until
+the earliest deadline. Scheduling a key again replaces its deadline
+and cancel() drops it; replaced and cancelled heap items are skipped
+when they reach the top instead of being searched for, so both are
+O(log n).
+
+The callback runs on the scheduler thread, so it should be short or
+hand its work off.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def to_timestamp(deadline):
+    """Epoch seconds for a datetime; naive datetimes are UTC (as MongoDB returns them)"""
+    if isinstance(deadline, (int, float)):
+        return float(deadline)
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline.timestamp()
+
+
+class DeadlineScheduler:
+    """
+    Args:
+        callback: Called as callback(key) once key's deadline has passed
+        name: Name of the scheduler thread
+    """
+
+    def __init__(self, callback, name='deadline-scheduler'):
+        self.callback = callback
+        self.name = name
+        self._heap = []
+        self._deadlines = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self.fired = 0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def schedule(self, key, deadline):
+        """Fire key at deadline (datetime or epoch seconds), replacing any earlier schedule"""
+        timestamp = to_timestamp(deadline)
+
+        with self._condition:
+            if self._deadlines.get(key) == timestamp:
+                return
+            self._deadlines[key] = timestamp
+            heapq.heappush(self._heap, (timestamp, next(self._sequence), key))
+            # Wake the thread only if this is now the earliest deadline
+            if self._heap[0][2] == key:
+                self._condition.notify()
+
+    def cancel(self, key):
+        with self._condition:
+            self._deadlines.pop(key, None)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def next_deadline(self):
+        """Earliest pending deadline as an aware UTC datetime, or None"""
+        with self._condition:
+            self._drop_cancelled()
+            if not self._heap:
+                return None
+            return datetime.fromtimestamp(self._heap[0][0], timezone.utc)
+
+    def _drop_cancelled(self):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    self._drop_cancelled()
+                    if self._heap:
+                        delay = self._heap[0][0] - time.time()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+
+                timestamp, _, key = heapq.heappop(self._heap)
+                del self._deadlines[key]
+
+            self.max_lag_ms = max(self.max_lag_ms, (time.time() - timestamp) * 1000)
+
+            try:
+                self.callback(key)
+            except Exception as e:
+                print(f"❌ Deadline callback failed | Key={key} | {type(e).__name__}: {e}")
+
+            self.fired += 1
+
+    def stats(self):
+        next_deadline = self.next_deadline()
+        return {
+            'pending': len(self._deadlines),
+            'heap_size': len(self._heap),
+            'fired': self.fired,
+            'max_lag_ms': round(self.max_lag_ms, 2),
+            'next_deadline': next_deadline.isoformat() if next_deadline else None
+        }
@@ -0,0 +1,155 @@
+# utils/group_commit.py
+"""
+Group Commit - Batch inserts from concurrent request threads
+
+Request threads call `insert(document)`. A flusher thread collects
+documents for up to `max_wait_ms` (or until `max_batch` are waiting),
+writes them with one unordered insert_many and then wakes every
+waiting request with its own outcome. A request is acknowledged only
+after the batch holding its document has committed.
+
+A request that times out while its document is still queued takes
+it back out, so a failed request never writes. Once the flusher has
+taken the document, the request waits for the batch's real outcome.
+`submit()` and `wait()` let one request queue documents in several
+buffers before waiting on them together.
+"""
+
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+
+
+class GroupCommitTimeout(Exception):
+    """The document was not taken into a batch in time; it was not written"""
+
+
+class _PendingWrite:
+    __slots__ = ('document', 'done', 'error')
+
+    def __init__(self, document):
+        self.document = document
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitBuffer:
+    """
+    Buffer of pending inserts into one collection.
+
+    Args:
+        get_collection: Callable returning the target pymongo collection
+        max_batch: Flush as soon as this many documents are waiting
+        max_wait_ms: Longest time the first document of a batch waits
+        ack_timeout: Seconds a request waits for its batch to commit
+    """
+
+    def __init__(self, get_collection, max_batch=100, max_wait_ms=5, ack_timeout=10):
+        self.get_collection = get_collection
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0, float(max_wait_ms)) / 1000
+        self.ack_timeout = ack_timeout
+        self._pending = []
+        self._condition = threading.Condition()
+        self._flusher = None
+        self.batches = 0
+        self.documents = 0
+        self.largest_batch = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(
+            target=self._run,
+            name='group-commit',
+            daemon=True
+        )
+        self._flusher.start()
+
+    @property
+    def running(self):
+        return self._flusher is not None and self._flusher.is_alive()
+
+    def insert(self, document):
+        """Queue a document and block until its batch has committed"""
+        return self.wait(self.submit(document))
+
+    def submit(self, document):
+        """Queue a document; pass the result to wait()"""
+        pending = _PendingWrite(document)
+
+        with self._condition:
+            self._pending.append(pending)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+        return pending
+
+    def wait(self, pending):
+        """Block until the submitted document's batch has committed; returns its _id"""
+        if not pending.done.wait(self.ack_timeout):
+            with self._condition:
+                if pending in self._pending:
+                    self._pending.remove(pending)
+                    self.timeouts += 1
+                    raise GroupCommitTimeout('Group commit did not start in time; nothing was written')
+            # Already in a batch being written: its outcome decides.
+            pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+
+        return pending.document.get('_id')
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            self.get_collection().insert_many(
+                [pending.document for pending in batch],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                batch[write_error['index']].error = BulkWriteError({
+                    'writeErrors': [write_error]
+                })
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+
+        self.batches += 1
+        self.documents += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        for pending in batch:
+            pending.done.set()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'pending': len(self._pending),
+            'batches': self.batches,
+            'documents': self.documents,
+            'largest_batch': self.largest_batch,
+            'timeouts': self.timeouts,
+            'average_batch': round(self.documents / self.batches, 2) if self.batches else 0
+        }
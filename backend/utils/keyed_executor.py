@@ -0,0 +1,100 @@
+# utils/keyed_executor.py
+"""
+Keyed Executor - Bounded thread pool that keeps per-key order
+
+Tasks submitted with the same key run one at a time, in submission
+order; tasks with different keys run in parallel on up to
+`max_workers` threads. At most `max_pending` tasks may be queued or
+running; submit() blocks beyond that, so a burst slows its producer
+down instead of growing the queue without limit. Producers that must
+not block, such as a timer thread, use try_submit(), which turns the
+task away instead.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class KeyedExecutor:
+    """
+    Args:
+        max_workers: Threads shared by all keys
+        max_pending: Tasks allowed to be queued or running at once
+        thread_name_prefix: Prefix of the pool's thread names
+    """
+
+    def __init__(self, max_workers=8, max_pending=1000, thread_name_prefix='keyed-executor'):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.longest_queue = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) behind earlier tasks of key; returns a Future"""
+        self._slots.acquire()
+        return self._enqueue(key, fn, args, kwargs)
+
+    def try_submit(self, key, fn, *args, **kwargs):
+        """Like submit(), but returns None instead of blocking when max_pending is reached"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        return self._enqueue(key, fn, args, kwargs)
+
+    def _enqueue(self, key, fn, args, kwargs):
+        future = Future()
+        task = (future, fn, args, kwargs)
+
+        with self._lock:
+            self.submitted += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # A drain for this key is running and will pick it up
+                queue.append(task)
+                self.longest_queue = max(self.longest_queue, len(queue))
+                return future
+            self._queues[key] = deque([task])
+
+        self._pool.submit(self._drain, key)
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                future, fn, args, kwargs = queue.popleft()
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                        self.completed += 1
+                    except Exception as e:
+                        future.set_exception(e)
+                        self.failed += 1
+            finally:
+                self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            queued = sum(len(queue) for queue in self._queues.values())
+            active_keys = len(self._queues)
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'queued': queued,
+            'active_keys': active_keys,
+            'longest_queue': self.longest_queue
+        }
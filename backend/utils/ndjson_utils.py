@@ -0,0 +1,75 @@
+# utils/ndjson_utils.py
+"""
+NDJSON Utilities - Incremental parsing of newline-delimited JSON uploads
+
+Offline sync uploads can be sent as `application/x-ndjson` (one record
+per line, optionally gzip-compressed). Records are parsed one line at a
+time straight from the request stream, so memory use depends on the
+batch size, not on the size of the upload.
+"""
+
+import gzip
+import io
+import json
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Longest accepted line; a record is a few hundred bytes.
+MAX_LINE_BYTES = 64 * 1024
+
+
+def is_ndjson_request(request):
+    """True if the request body is NDJSON"""
+    return request.mimetype == NDJSON_MIMETYPE
+
+
+def iter_ndjson(stream, gzipped=False):
+    """
+    Yield one parsed record per non-empty line of a byte stream.
+
+    A line that is not valid JSON (or is too long) is yielded as a
+    string, so the sync services report it as an invalid record
+    instead of failing the whole upload.
+    """
+    if gzipped:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    reader = io.BufferedReader(stream) if not hasattr(stream, 'readline') else stream
+
+    while True:
+        line = reader.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b'\n'):
+            # Skip the rest of the oversized line.
+            while line and not line.endswith(b'\n'):
+                line = reader.readline(MAX_LINE_BYTES)
+            yield '<line too long>'
+            continue
+
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.decode('utf-8', errors='replace')
+
+
+def iter_batches(records, size):
+    """Group an iterable into lists of at most `size` items"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_ndjson_line(record, encoder=None):
+    """Serialize one record as an NDJSON line"""
+    return json.dumps(record, cls=encoder) + '\n'
@@ -0,0 +1,256 @@
+# utils/roster_codec.py
+"""
+Roster Codec - Compact columnar binary roster for offline devices
+
+Reference encoder/decoder for `application/x-roster` bodies. All
+integers are little-endian.
+
+    header
+        magic            4s   b'RSTR'
+        format_version   u16  2
+        flags            u16  0 (reserved)
+        roster_version   u64
+        count            u32  number of students
+    hostel dictionary
+        entries          u8
+        entry            u8 length + UTF-8 bytes, repeated
+    hostel column
+        count x u8       index into the hostel dictionary
+    roll_no column
+        prefixes         count x u8, bytes shared with the previous roll_no
+        data_length      u32
+        data             the rest of each roll_no, joined by NUL bytes
+    name column
+        data_length      u32
+        data             each name, joined by NUL bytes
+
+Rows are sorted by roll_no (byte order of the UTF-8 encoding).
+Sorted roll numbers share long prefixes, so front coding them and
+keeping each column's values together leaves little for gzip to
+repeat; gzipped, the body is about half the size of the gzipped JSON
+roster. Values are separated rather than length-prefixed so a decoder
+can split a whole column at once; strings containing NUL cannot be
+encoded. A decoder rebuilds the roll_no list on load and binary
+searches it for lookups.
+"""
+
+import operator
+import struct
+from bisect import bisect_left
+
+MAGIC = b'RSTR'
+FORMAT_VERSION = 2
+ROSTER_BINARY_MIMETYPE = 'application/x-roster'
+
+_HEADER = struct.Struct('<4sHHQI')
+_U8 = struct.Struct('<B')
+_U32 = struct.Struct('<I')
+
+_SEPARATOR = b'\x00'
+_MAX_PREFIX = 255
+
+
+class RosterFormatError(ValueError):
+    """The data is not a roster this decoder understands"""
+
+
+def encode_roster(students, roster_version=0):
+    """
+    Encode roster rows ({'roll_no', 'name', 'hostel'}) as bytes.
+
+    Args:
+        students: Iterable of student dicts
+        roster_version: Roster version the rows belong to
+
+    Returns:
+        bytes: The encoded roster
+    """
+    rows = sorted(
+        (
+            (student.get('roll_no') or '').encode('utf-8'),
+            (student.get('name') or '').encode('utf-8'),
+            student.get('hostel') or ''
+        )
+        for student in students
+    )
+
+    hostels = sorted({hostel for _, _, hostel in rows})
+    if len(hostels) > 255:
+        raise RosterFormatError('At most 255 distinct hostels can be encoded')
+    hostel_index = {hostel: index for index, hostel in enumerate(hostels)}
+
+    parts = [
+        _HEADER.pack(MAGIC, FORMAT_VERSION, 0, roster_version, len(rows)),
+        _U8.pack(len(hostels))
+    ]
+    for hostel in hostels:
+        encoded = hostel.encode('utf-8')
+        if len(encoded) > 255:
+            raise RosterFormatError('Hostel name longer than 255 bytes')
+        parts.append(_U8.pack(len(encoded)) + encoded)
+
+    parts.append(bytes(hostel_index[hostel] for _, _, hostel in rows))
+
+    prefixes = bytearray()
+    suffixes = []
+    previous = b''
+    for roll_no, _, _ in rows:
+        shared = _shared_prefix(previous, roll_no)
+        prefixes.append(shared)
+        suffixes.append(roll_no[shared:])
+        previous = roll_no
+    parts.append(bytes(prefixes))
+    parts.append(_encode_string_column(suffixes))
+
+    parts.append(_encode_string_column([name for _, name, _ in rows]))
+
+    return b''.join(parts)
+
+
+def _shared_prefix(previous, value):
+    # Sorted neighbours differ near the end; shrink from the longest candidate
+    shared = min(len(previous), len(value), _MAX_PREFIX)
+    while previous[:shared] != value[:shared]:
+        shared -= 1
+    return shared
+
+
+def _encode_string_column(values):
+    for value in values:
+        if _SEPARATOR in value:
+            raise RosterFormatError('String values cannot contain NUL bytes')
+
+    data = _SEPARATOR.join(values)
+    return _U32.pack(len(data)) + data
+
+
+class RosterView:
+    """
+    Read-only view over an encoded roster. The columns are split once
+    on load; lookups by roll_no binary search the rebuilt roll_no list.
+    """
+
+    def __init__(self, data):
+        data = bytes(data)
+
+        if len(data) < _HEADER.size:
+            raise RosterFormatError('Truncated roster header')
+
+        magic, version, _flags, roster_version, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise RosterFormatError('Not a roster (bad magic)')
+        if version != FORMAT_VERSION:
+            raise RosterFormatError(f'Unsupported roster format version {version}')
+
+        self.roster_version = roster_version
+        self.count = count
+
+        position = _HEADER.size
+        entries, position = _read_bytes(data, position, 1)
+
+        self.hostels = []
+        for _ in range(entries[0]):
+            length, position = _read_bytes(data, position, 1)
+            hostel, position = _read_bytes(data, position, length[0])
+            self.hostels.append(_decode(hostel))
+
+        self._hostel_column, position = _read_bytes(data, position, count)
+        if count and max(self._hostel_column) >= len(self.hostels):
+            raise RosterFormatError('Hostel index out of range')
+
+        prefixes, position = _read_bytes(data, position, count)
+        suffixes, position = self._read_string_column(data, position)
+        self._roll_nos = self._expand_roll_nos(prefixes, suffixes)
+        self._roll_strings = _decode_all(self._roll_nos)
+
+        names, position = self._read_string_column(data, position)
+        self._names = _decode_all(names)
+
+        if position != len(data):
+            raise RosterFormatError('Trailing bytes after roster')
+
+    def _read_string_column(self, data, position):
+        length, position = _read_bytes(data, position, 4)
+        column, position = _read_bytes(data, position, _U32.unpack(length)[0])
+
+        values = column.split(_SEPARATOR) if self.count else []
+        if len(values) != self.count:
+            raise RosterFormatError('String column does not match the row count')
+        return values, position
+
+    def _expand_roll_nos(self, prefixes, suffixes):
+        roll_nos = []
+        previous = b''
+        for shared, suffix in zip(prefixes, suffixes):
+            if shared > len(previous):
+                raise RosterFormatError('roll_no prefix longer than the previous roll_no')
+            previous = previous[:shared] + suffix
+            roll_nos.append(previous)
+
+        if not all(map(operator.le, roll_nos, roll_nos[1:])):
+            raise RosterFormatError('Rows are not sorted by roll_no')
+        return roll_nos
+
+    def roll_no(self, row):
+        return self._roll_strings[row]
+
+    def row(self, row):
+        return {
+            'roll_no': self._roll_strings[row],
+            'name': self._names[row],
+            'hostel': self.hostels[self._hostel_column[row]]
+        }
+
+    def rows(self):
+        """Every row as a student dict, in roll_no order"""
+        hostels = self.hostels
+        return [
+            {'roll_no': roll_no, 'name': name, 'hostel': hostels[hostel]}
+            for roll_no, name, hostel in zip(self._roll_strings, self._names, self._hostel_column)
+        ]
+
+    def find(self, roll_no):
+        """Student dict for roll_no, or None"""
+        target = roll_no.encode('utf-8')
+        row = bisect_left(self._roll_nos, target)
+        if row < self.count and self._roll_nos[row] == target:
+            return self.row(row)
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.rows())
+
+
+def _read_bytes(data, position, length):
+    end = position + length
+    if end > len(data):
+        raise RosterFormatError('Truncated roster')
+    return data[position:end], end
+
+
+def _decode(value):
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        raise RosterFormatError('Invalid UTF-8 in roster') from None
+
+
+def _decode_all(values):
+    """Decode a list of UTF-8 values with one decode call"""
+    if not values:
+        return []
+    return _decode(_SEPARATOR.join(values)).split('\x00')
+
+
+def decode_roster(data):
+    """
+    Decode an encoded roster.
+
+    Returns:
+        tuple: (roster_version, list of student dicts sorted by roll_no)
+    """
+    view = RosterView(data)
+    return view.roster_version, view.rows()